@@ -1,10 +1,10 @@
 from django.contrib import admin
 
 try:
-    from .models import AreaComun, Reserva, AutorizacionVisita, RegistroVisitaModel
+    from .models import AreaComun, Reserva, SerieReserva, AutorizacionVisita, RegistroVisitaModel
     HAS_VISITAS = True
 except Exception:
-    from .models import AreaComun, Reserva
+    from .models import AreaComun, Reserva, SerieReserva
     AutorizacionVisita = RegistroVisitaModel = None
     HAS_VISITAS = False
 
@@ -16,7 +16,15 @@ class AreaComunAdmin(admin.ModelAdmin):
 @admin.register(Reserva)
 class ReservaAdmin(admin.ModelAdmin):
     list_display = ("id_reserva","area_comun","usuario","fecha","hora_inicio","hora_fin","estado")
-    list_filter = ("estado","area_comun","fecha")
+    list_filter = ("estado","area_comun","fecha","comprobante_estado")
+    readonly_fields = ("inicio","fin","intervalo",  # los calcula Reserva.save()
+                       "url_comprobante","comprobante_estado","comprobante_intentos",
+                       "comprobante_reintento","comprobante_error")  # area_comun.comprobantes
+
+@admin.register(SerieReserva)
+class SerieReservaAdmin(admin.ModelAdmin):
+    list_display = ("id_serie","area_comun","usuario","frecuencia","fecha_inicio","fecha_fin","hora_inicio","hora_fin","estado")
+    list_filter = ("estado","frecuencia","area_comun")
 
 if HAS_VISITAS and AutorizacionVisita:
     @admin.register(AutorizacionVisita)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AreaComunConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'area_comun'
+
+    def ready(self):
+        from . import signals  # invalida la caché de disponibilidad
@@ -0,0 +1,176 @@
+"""
+Comprobantes de reservas de áreas con pago, subidos fuera del request.
+
+Al reservar, la imagen se guarda en el storage local (Reserva.comprobante_local)
+y la reserva se crea de inmediato con `comprobante_estado = 'pendiente'`.
+Después del commit, un hilo en segundo plano la sube al backend configurado en
+RESERVA_COMPROBANTE_BACKEND y llena `url_comprobante`:
+
+  - ImgbbBackend: la API de imgbb (IMGBB_API_KEY);
+  - LocalBackend: copia dentro del mismo storage (desarrollo y pruebas).
+
+Cada intento toma la reserva con un UPDATE condicional (`comprobante_reintento`
+vencido), igual que la cola de pagos: el hilo y `manage.py
+reintentar_comprobantes` nunca suben el mismo comprobante a la vez y no se deja
+una transacción abierta durante la subida. Si falla por algo pasajero (timeout,
+5xx, 429) se reintenta con espera exponencial (ESPERA_BASE * 2^n, con azar,
+hasta ESPERA_MAX); tras MAX_INTENTOS, o ante un rechazo definitivo, queda
+'fallido' con el error para que el admin lo vea. Si el proceso se reinicia con
+reintentos en espera, el comando los retoma.
+"""
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Reserva
+
+MAX_INTENTOS = 6
+ESPERA_BASE = 5  # segundos
+ESPERA_MAX = 30 * 60
+TOMA = timedelta(minutes=2)  # lo que dura la toma de un intento (más que el timeout de la subida)
+TIMEOUT = 20
+
+log = logging.getLogger(__name__)
+_hilos = ThreadPoolExecutor(max_workers=2, thread_name_prefix="comprobantes-reserva")
+
+
+class ErrorSubida(Exception):
+    """Falla del backend; `reintentable` si conviene volver a intentar más tarde."""
+
+    def __init__(self, mensaje, reintentable=True):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+
+
+# =============== Backends ===============
+
+class ImgbbBackend:
+    URL = "https://api.imgbb.com/1/upload"
+
+    def subir(self, nombre, contenido: bytes) -> str:
+        api_key = os.getenv("IMGBB_API_KEY", "")
+        if not api_key:
+            raise ErrorSubida("Falta IMGBB_API_KEY en el servidor.", reintentable=False)
+        try:
+            resp = requests.post(self.URL, params={"key": api_key},
+                                 files={"image": (os.path.basename(nombre), contenido)}, timeout=TIMEOUT)
+        except requests.RequestException as e:
+            raise ErrorSubida(f"imgbb no respondió: {e}")
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise ErrorSubida(f"imgbb respondió {resp.status_code}")
+        if resp.status_code >= 400:
+            raise ErrorSubida(f"imgbb rechazó la imagen ({resp.status_code}): {resp.text[:200]}", reintentable=False)
+        try:
+            return resp.json()["data"]["url"]
+        except (ValueError, KeyError, TypeError):
+            raise ErrorSubida("Respuesta de imgbb sin URL.")
+
+
+class LocalBackend:
+    """Publica el comprobante en el storage de Django (MEDIA_URL)."""
+    CARPETA = "reservas/publicados/"
+
+    def subir(self, nombre, contenido: bytes) -> str:
+        guardado = default_storage.save(self.CARPETA + os.path.basename(nombre), ContentFile(contenido))
+        return default_storage.url(guardado)
+
+
+def backend():
+    ruta = getattr(settings, "RESERVA_COMPROBANTE_BACKEND", "area_comun.comprobantes.ImgbbBackend")
+    return import_string(ruta)()
+
+
+# =============== Cola ===============
+
+def espera(intentos) -> timedelta:
+    """Espera antes del intento siguiente a `intentos` fallidos (exponencial con azar)."""
+    segundos = min(ESPERA_MAX, ESPERA_BASE * 2 ** (intentos - 1))
+    return timedelta(seconds=random.uniform(segundos / 2, segundos))
+
+
+def pendientes():
+    """Reservas con comprobante por subir cuyo próximo intento ya venció."""
+    return Reserva.objects.filter(comprobante_estado="pendiente", comprobante_reintento__lte=timezone.now())
+
+
+def encolar(reserva_id, demora=None):
+    """Sube el comprobante en segundo plano cuando la transacción confirme (o tras `demora`)."""
+    if demora is None:
+        transaction.on_commit(lambda: _hilos.submit(_subir_en_hilo, reserva_id))
+        return
+    temporizador = threading.Timer(demora.total_seconds(), lambda: _hilos.submit(_subir_en_hilo, reserva_id))
+    temporizador.daemon = True  # si el proceso termina, lo retoma reintentar_comprobantes
+    temporizador.start()
+
+
+def _subir_en_hilo(reserva_id):
+    try:
+        resultado = subir_comprobante(reserva_id)
+        if resultado and resultado[0] == "pendiente":
+            encolar(reserva_id, demora=resultado[1])
+    except Exception:
+        # queda pendiente: la toma vence y lo retoma reintentar_comprobantes
+        log.exception("No se pudo subir el comprobante de la reserva %s", reserva_id)
+    finally:
+        connection.close()  # la conexión es propia de este hilo
+
+
+def _tomar(reserva_id) -> bool:
+    ahora = timezone.now()
+    return bool(Reserva.objects
+                .filter(pk=reserva_id, comprobante_estado="pendiente", comprobante_reintento__lte=ahora)
+                .update(comprobante_reintento=ahora + TOMA))
+
+
+def subir_comprobante(reserva_id):
+    """
+    Un intento de subida. Devuelve None si otro la tomó o no toca todavía; si no,
+    (estado, espera hasta el próximo intento o None).
+    """
+    if not _tomar(reserva_id):
+        return None
+    reserva = Reserva.objects.only("pk", "comprobante_local", "comprobante_intentos").get(pk=reserva_id)
+    campos = {"comprobante_intentos": reserva.comprobante_intentos + 1}
+    try:
+        with reserva.comprobante_local.open("rb") as f:
+            contenido = f.read()
+        url = backend().subir(reserva.comprobante_local.name, contenido)
+    except (ErrorSubida, OSError, ValueError) as e:
+        reintentable = getattr(e, "reintentable", False)
+        campos["comprobante_error"] = str(e) or e.__class__.__name__
+        if reintentable and campos["comprobante_intentos"] < MAX_INTENTOS:
+            demora = espera(campos["comprobante_intentos"])
+            campos["comprobante_reintento"] = timezone.now() + demora
+        else:
+            demora = None
+            campos.update(comprobante_estado="fallido", comprobante_reintento=None)
+        Reserva.objects.filter(pk=reserva_id).update(**campos)
+        log.warning("Comprobante de la reserva %s: intento %s falló: %s",
+                    reserva_id, campos["comprobante_intentos"], campos["comprobante_error"])
+        return campos.get("comprobante_estado", "pendiente"), demora
+
+    Reserva.objects.filter(pk=reserva_id).update(
+        url_comprobante=url, comprobante_estado="subido", comprobante_reintento=None,
+        comprobante_error="", comprobante_local=None, **campos)
+    reserva.comprobante_local.delete(save=False)  # ya está en el backend
+    return "subido", None
+
+
+def reintentar_fallidos(ids=None) -> int:
+    """Vuelve a poner en cola los comprobantes fallidos (todos o los indicados)."""
+    qs = Reserva.objects.filter(comprobante_estado="fallido").exclude(comprobante_local="")
+    if ids is not None:
+        qs = qs.filter(pk__in=list(ids))
+    return qs.update(comprobante_estado="pendiente", comprobante_intentos=0,
+                     comprobante_reintento=timezone.now(), comprobante_error="")
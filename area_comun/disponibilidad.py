@@ -0,0 +1,244 @@
+"""
+Disponibilidad de áreas comunes por día, para uno o varios días y áreas.
+
+`calendario(areas, desde, hasta)` trae en UNA consulta todas las reservas
+activas que tocan el rango (`intervalo && rango`, índice GiST de la
+restricción de no solapamiento) y arma cada día por barrido:
+
+  - el horario del día sale de apertura_hora / cierre_hora (si cierra a la
+    misma hora o antes de abrir, cierra al día siguiente); los días fuera de
+    `dias_habiles` van vacíos;
+  - las reservas del área están ordenadas por inicio; las del día se ubican por
+    búsqueda binaria y se recorren una vez, uniendo las que se pisan o se tocan;
+  - los huecos libres se ajustan a la grilla de `bloque_minutos` contada desde
+    la apertura: solo quedan los bloques que se pueden reservar enteros.
+
+Cada día calculado se cachea por (área, fecha) en la caché DISPONIBILIDAD_CACHE
+(alias de CACHES: LocMem por proceso, o una compartida con varios workers);
+solo los días que faltan se calculan, con la misma consulta única. Las claves
+llevan la versión del área y la generación del día:
+  - crear, cancelar o mover una reserva sube la generación de los días cuyo
+    horario toca el intervalo viejo o el nuevo (signals.py, al confirmar);
+  - editar o borrar el área sube su versión: todos sus días dejan de leerse.
+El lector toma versión y generación ANTES de consultar las reservas y guarda lo
+calculado con esa clave: si una reserva confirma en el medio, lo que guarda
+queda con la generación vieja, que ya nadie lee, en vez de pisar la invalidación
+con el día desactualizado por CACHE_TTL.
+Aciertos y fallos se cuentan por día en la misma caché (estadisticas()).
+"""
+import time as reloj
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.utils import timezone
+
+from .models import AreaComun, Reserva
+
+MAX_DIAS = 62
+CACHE_TTL = 60 * 60
+_PREFIJO = "disponibilidad"
+
+
+def bloque(inicio, fin, tz):
+    # horas locales para mostrar; inicio/fin completos por si el bloque cruza la medianoche
+    inicio, fin = inicio.astimezone(tz), fin.astimezone(tz)
+    return {"hora_inicio": inicio.strftime("%H:%M"), "hora_fin": fin.strftime("%H:%M"),
+            "inicio": inicio.isoformat(), "fin": fin.isoformat()}
+
+
+def _a_grilla(inicio, fin, origen, paso):
+    """[inicio, fin) recortado a bloques enteros de `paso` contados desde `origen`."""
+    if not paso:
+        return inicio, fin
+    desde = origen + -((origen - inicio) // paso) * paso  # redondeo hacia arriba
+    hasta = origen + ((fin - origen) // paso) * paso
+    return desde, hasta
+
+
+def _dia(area, fecha, inicios, fines, tz):
+    """Disponibilidad de `area` en `fecha`; `inicios`/`fines`: reservas del área ordenadas."""
+    if not area.dia_habil(fecha):
+        return {"fecha": fecha.isoformat(), "habil": False, "ocupados": [], "libres": [], "bloques_libres": 0}
+    apertura, cierre = area.horario(fecha)
+    # las reservas no se solapan (restricción): ordenadas por inicio, también lo están por fin
+    primera, ultima = bisect_right(fines, apertura), bisect_left(inicios, cierre)
+
+    ocupados = []
+    for ini, fin in zip(inicios[primera:ultima], fines[primera:ultima]):
+        ini, fin = max(ini, apertura), min(fin, cierre)
+        if ocupados and ini <= ocupados[-1][1]:
+            ocupados[-1][1] = max(ocupados[-1][1], fin)
+        else:
+            ocupados.append([ini, fin])
+
+    paso = timedelta(minutes=area.bloque_minutos)
+    libres, n_bloques, actual = [], 0, apertura
+    for ini, fin in ocupados + [[cierre, cierre]]:
+        desde, hasta = _a_grilla(actual, ini, apertura, paso)
+        if hasta > desde:
+            libres.append(bloque(desde, hasta, tz))
+            n_bloques += (hasta - desde) // paso if paso else 1
+        actual = max(actual, fin)
+
+    return {"fecha": fecha.isoformat(), "habil": True,
+            "apertura": apertura.astimezone(tz).isoformat(), "cierre": cierre.astimezone(tz).isoformat(),
+            "ocupados": [bloque(i, f, tz) for i, f in ocupados], "libres": libres, "bloques_libres": n_bloques}
+
+
+def _medianoche(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min), timezone.get_current_timezone())
+
+
+def _reservas(area_ids, desde, hasta):
+    """{area_id: (inicios, fines)} de las reservas activas que tocan desde..hasta (una consulta)."""
+    # hasta + 2: el último día puede cerrar pasada la medianoche
+    inicio, fin = _medianoche(desde), _medianoche(hasta + timedelta(days=2))
+    filas = (Reserva.objects
+             .filter(area_comun_id__in=area_ids, estado__in=Reserva.ACTIVAS,
+                     intervalo__overlap=DateTimeTZRange(inicio, fin, "[)"))
+             .order_by("area_comun_id", "inicio")
+             .values_list("area_comun_id", "inicio", "fin"))
+    por_area = defaultdict(lambda: ([], []))
+    for area_id, ini, fin in filas:
+        por_area[area_id][0].append(ini)
+        por_area[area_id][1].append(fin)
+    return por_area
+
+
+def _calcular(areas, faltan) -> dict:
+    """{(area_id, fecha): día} para las claves pedidas, con una consulta de reservas."""
+    tz = timezone.get_current_timezone()  # una vez: cada consulta de la zona activa pasa por asgiref
+    fechas = [f for _, f in faltan]
+    por_area = _reservas({a for a, _ in faltan}, min(fechas), max(fechas))
+    return {(a, f): _dia(areas[a], f, *por_area[a], tz) for a, f in faltan}
+
+
+def calendario(areas, desde, hasta) -> list:
+    """[{area, nombre, dias: [...]}] para cada área entre desde y hasta (inclusive)."""
+    areas = {a.pk: a for a in areas}
+    fechas = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+    # versión y generación antes de leer las reservas (ver arriba)
+    versiones = _versiones(areas)
+    generaciones = _generaciones([(a, f) for a in areas for f in fechas])
+    claves = {(a, f): _clave(a, f, versiones[a], generaciones[(a, f)]) for a in areas for f in fechas}
+
+    cache = _cache()
+    guardados = cache.get_many(list(claves.values()))
+    dias = {k: guardados[c] for k, c in claves.items() if c in guardados}
+    faltan = [k for k in claves if k not in dias]
+    if faltan:
+        nuevos = _calcular(areas, faltan)
+        cache.set_many({claves[k]: v for k, v in nuevos.items()}, CACHE_TTL)
+        dias.update(nuevos)
+    _contar(aciertos=len(claves) - len(faltan), fallos=len(faltan))
+
+    return [{"area": area.pk, "nombre": area.nombre_area, "bloque_minutos": area.bloque_minutos,
+             "dias": [dias[(area.pk, f)] for f in fechas]}
+            for area in areas.values()]
+
+
+# =============== Caché ===============
+
+def _cache():
+    return caches[getattr(settings, "DISPONIBILIDAD_CACHE", "default")]
+
+
+def _clave(area_id, fecha, version, generacion) -> str:
+    return f"{_PREFIJO}:{area_id}:{fecha.isoformat()}:v{version}:g{generacion}"
+
+
+def _clave_version(area_id) -> str:
+    return f"{_PREFIJO}:version:{area_id}"
+
+
+def _clave_generacion(area_id, fecha) -> str:
+    return f"{_PREFIJO}:gen:{area_id}:{fecha.isoformat()}"
+
+
+def _contadores(claves) -> dict:
+    """{clave: valor} de contadores de la caché. Uno nuevo arranca en un valor distinto
+    cada vez (reloj en ns): si la caché lo descarta, no revive claves viejas."""
+    cache = _cache()
+    valores = cache.get_many(list(claves))
+    for clave in set(claves) - valores.keys():
+        cache.add(clave, reloj.time_ns(), None)
+        valores[clave] = cache.get(clave)
+    return valores
+
+
+def _versiones(area_ids) -> dict:
+    """{area_id: versión}."""
+    claves = {_clave_version(a): a for a in area_ids}
+    return {claves[c]: v for c, v in _contadores(claves).items()}
+
+
+def _generaciones(pares) -> dict:
+    """{(area_id, fecha): generación}."""
+    claves = {_clave_generacion(a, f): (a, f) for a, f in pares}
+    return {claves[c]: g for c, g in _contadores(claves).items()}
+
+
+def _subir(clave):
+    try:
+        _cache().incr(clave)
+    except ValueError:
+        pass  # sin contador nadie leyó todavía: el primero arranca uno nuevo
+
+
+def invalidar_areas(area_ids):
+    """Todos los días de esas áreas (horario editado, área borrada, cambios masivos)."""
+    for area_id in set(area_ids):
+        _subir(_clave_version(area_id))
+
+
+def fechas_afectadas(area, inicio, fin) -> list:
+    """Días de `area` cuyo horario se cruza con [inicio, fin) (el día anterior puede cerrar después de medianoche)."""
+    tz = timezone.get_current_timezone()
+    fecha, ultima = inicio.astimezone(tz).date() - timedelta(days=1), fin.astimezone(tz).date()
+    fechas = []
+    while fecha <= ultima:
+        apertura, cierre = area.horario(fecha)
+        if apertura < fin and inicio < cierre:
+            fechas.append(fecha)
+        fecha += timedelta(days=1)
+    return fechas
+
+
+def invalidar_reservas(tramos):
+    """Sube la generación de los días tocados por `tramos`: [(area_id, inicio, fin)] (intervalo viejo y nuevo)."""
+    tramos = [t for t in tramos if t[0] and t[1] and t[2]]
+    if not tramos:
+        return
+    areas = AreaComun.objects.in_bulk({t[0] for t in tramos})
+    dias = {(a, f) for a, inicio, fin in tramos if a in areas for f in fechas_afectadas(areas[a], inicio, fin)}
+    for area_id, fecha in dias:
+        _subir(_clave_generacion(area_id, fecha))
+
+
+def _contar(aciertos, fallos):
+    cache = _cache()
+    for nombre, n in (("aciertos", aciertos), ("fallos", fallos)):
+        if not n:
+            continue
+        clave = f"{_PREFIJO}:stats:{nombre}"
+        cache.add(clave, 0, None)
+        try:
+            cache.incr(clave, n)
+        except ValueError:
+            cache.set(clave, n, None)
+
+
+def estadisticas(reiniciar=False) -> dict:
+    """Aciertos/fallos (por día de área) desde el último reinicio, en la caché configurada."""
+    cache = _cache()
+    claves = [f"{_PREFIJO}:stats:aciertos", f"{_PREFIJO}:stats:fallos"]
+    valores = cache.get_many(claves)
+    aciertos, fallos = valores.get(claves[0], 0), valores.get(claves[1], 0)
+    if reiniciar:
+        cache.delete_many(claves)
+    total = aciertos + fallos
+    return {"aciertos": aciertos, "fallos": fallos, "tasa_aciertos": round(aciertos / total, 4) if total else None}
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from area_comun.disponibilidad import estadisticas, invalidar_areas
+from area_comun.models import AreaComun
+
+
+class Command(BaseCommand):
+    help = ("Muestra aciertos y fallos de la caché de disponibilidad (por día de área) desde el último "
+            "reinicio. Con LocMem los contadores son del proceso que corre el comando: para ver los del "
+            "servidor, DISPONIBILIDAD_CACHE tiene que apuntar a una caché compartida.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reiniciar", action="store_true", help="Poner los contadores en cero.")
+        parser.add_argument("--vaciar", action="store_true",
+                            help="Invalidar la disponibilidad cacheada de todas las áreas.")
+
+    def handle(self, *args, **opts):
+        datos = estadisticas(reiniciar=opts["reiniciar"])
+        tasa = "-" if datos["tasa_aciertos"] is None else f"{datos['tasa_aciertos']:.1%}"
+        self.stdout.write(f"aciertos: {datos['aciertos']}  fallos: {datos['fallos']}  tasa: {tasa}")
+        if opts["vaciar"]:
+            invalidar_areas(AreaComun.objects.values_list("pk", flat=True))
+            self.stdout.write(self.style.SUCCESS("Disponibilidad cacheada invalidada."))
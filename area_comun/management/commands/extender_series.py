@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from area_comun.series import expandir, series_para_extender
+
+
+class Command(BaseCommand):
+    help = ("Agrega a las series de reservas activas las fechas que entraron a la ventana del área "
+            "(hoy + max_dias_adelante) desde la última corrida. Las que chocan con otra reserva se "
+            "listan y no se crean. Correr a diario (cron).")
+
+    def handle(self, *args, **opts):
+        total_creadas = total_conflictos = 0
+        for serie in series_para_extender():
+            creadas, conflictos = expandir(serie)
+            total_creadas += len(creadas)
+            total_conflictos += len(conflictos)
+            for c in conflictos:
+                self.stdout.write(self.style.WARNING(f"serie {serie.pk} ({serie.area_comun}) {c['fecha']}: {c['motivo']}"))
+        estilo = self.style.WARNING if total_conflictos else self.style.SUCCESS
+        self.stdout.write(estilo(f"{total_creadas} reservas creadas, {total_conflictos} fechas en conflicto."))
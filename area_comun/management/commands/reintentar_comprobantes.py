@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from area_comun.comprobantes import pendientes, reintentar_fallidos, subir_comprobante
+
+
+class Command(BaseCommand):
+    help = ("Sube los comprobantes de reservas pendientes cuyo reintento ya venció (los que el hilo en "
+            "segundo plano no llegó a subir, p.ej. tras reiniciar el servidor). Un intento por reserva; "
+            "los que vuelven a fallar quedan para la próxima corrida. Con --fallidos, antes vuelve a "
+            "poner en cola los que agotaron los intentos.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fallidos", action="store_true",
+                            help="Reintentar también los comprobantes marcados como fallidos.")
+
+    def handle(self, *args, **opts):
+        if opts["fallidos"]:
+            self.stdout.write(f"{reintentar_fallidos()} comprobantes fallidos otra vez en cola.")
+
+        resultados = {"subido": 0, "pendiente": 0, "fallido": 0}
+        for pk in list(pendientes().order_by("comprobante_reintento").values_list("pk", flat=True)):
+            resultado = subir_comprobante(pk)
+            if resultado:
+                resultados[resultado[0]] += 1
+        estilo = self.style.WARNING if resultados["fallido"] else self.style.SUCCESS
+        self.stdout.write(estilo(f"{resultados['subido']} subidos, {resultados['pendiente']} para reintentar, "
+                                 f"{resultados['fallido']} fallidos."))
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from area_comun.disponibilidad import invalidar_areas
+from area_comun.models import AreaComun, Reserva
+
+_T = Reserva._meta.db_table
+_ACTIVAS = "('pendiente', 'confirmada')"
+
+
+class Command(BaseCommand):
+    help = ("Llena inicio/fin/intervalo de las reservas guardadas sin intervalo (fecha + horas en la zona "
+            "del sistema; hora_fin <= hora_inicio termina al día siguiente). Las reservas activas que se "
+            "solapan con otra quedan sin intervalo (la más antigua conserva el horario) y se listan para "
+            "que el admin las cancele. Correr una vez al desplegar; se puede repetir.")
+
+    def handle(self, *args, **opts):
+        with transaction.atomic(), connection.cursor() as cur:
+            # 1) inicio/fin desde fecha + horas, igual que Reserva.completar_intervalo()
+            cur.execute(f"""
+                UPDATE {_T} SET
+                    inicio = (fecha + hora_inicio) AT TIME ZONE %(tz)s,
+                    fin = (CASE WHEN hora_fin <= hora_inicio THEN fecha + 1 ELSE fecha END + hora_fin)
+                          AT TIME ZONE %(tz)s
+                WHERE intervalo IS NULL
+                  AND fecha IS NOT NULL AND hora_inicio IS NOT NULL AND hora_fin IS NOT NULL
+            """, {"tz": timezone.get_current_timezone_name()})
+            # 2) intervalo, en una sentencia, para todas las que no chocan con otra activa
+            cur.execute(f"""
+                UPDATE {_T} r SET intervalo = tstzrange(r.inicio, r.fin, '[)')
+                WHERE r.intervalo IS NULL AND r.inicio IS NOT NULL AND r.fin IS NOT NULL
+                  AND (r.estado NOT IN {_ACTIVAS} OR NOT EXISTS (
+                      SELECT 1 FROM {_T} o
+                      WHERE o.area_comun_id = r.area_comun_id AND o.id_reserva <> r.id_reserva
+                        AND o.estado IN {_ACTIVAS}
+                        AND o.inicio < r.fin AND o.fin > r.inicio
+                  ))
+            """)
+            rellenadas = cur.rowcount
+
+        # 3) las que se solapan, de la más antigua a la más nueva: la restricción decide
+        pendientes = (Reserva.objects
+                      .filter(intervalo__isnull=True, inicio__isnull=False, fin__isnull=False)
+                      .order_by("creada_en", "pk")
+                      .values_list("pk", "area_comun_id", "inicio", "fin"))
+        choques = []
+        for pk, area_id, inicio, fin in pendientes:
+            try:
+                with transaction.atomic(), connection.cursor() as cur:
+                    cur.execute(f"UPDATE {_T} SET intervalo = tstzrange(inicio, fin, '[)') WHERE id_reserva = %s",
+                                [pk])
+                rellenadas += 1
+            except IntegrityError:
+                choques.append((pk, area_id, inicio, fin))
+
+        # los UPDATE directos no pasan por las señales
+        invalidar_areas(AreaComun.objects.values_list("pk", flat=True))
+
+        for pk, area_id, inicio, fin in choques:
+            self.stdout.write(self.style.WARNING(
+                f"reserva {pk} (área {area_id}, {timezone.localtime(inicio):%Y-%m-%d %H:%M} - "
+                f"{timezone.localtime(fin):%Y-%m-%d %H:%M}) se solapa con otra activa; queda sin intervalo."))
+        estilo = self.style.WARNING if choques else self.style.SUCCESS
+        self.stdout.write(estilo(f"{rellenadas} reservas con intervalo, {len(choques)} en conflicto."))
@@ -1,7 +1,10 @@
+from datetime import datetime, timedelta
+
 from django.db import models
 from django.utils import timezone
 from django.db.models import Q
 from django.contrib.postgres.fields import DateTimeRangeField
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
 from django.contrib.postgres.constraints import ExclusionConstraint
 from django.contrib.postgres.fields.ranges import RangeOperators
 
@@ -10,6 +13,19 @@ from users.models import Usuario as User
 
 # ================== ÁREAS COMUNES ==================
 
+def rango_local(fecha, desde, hasta):
+    """
+    (inicio, fin) con zona horaria para `desde`-`hasta` el día `fecha`. Si `hasta`
+    no es posterior a `desde`, termina al día siguiente (cruza la medianoche).
+    """
+    tz = timezone.get_current_timezone()
+    inicio = timezone.make_aware(datetime.combine(fecha, desde), tz)
+    fin = timezone.make_aware(datetime.combine(fecha, hasta), tz)
+    if fin <= inicio:
+        fin = timezone.make_aware(datetime.combine(fecha + timedelta(days=1), hasta), tz)
+    return inicio, fin
+
+
 class AreaComun(models.Model):
     id_area = models.AutoField(primary_key=True)
     nombre_area = models.CharField(max_length=100, unique=True)
@@ -46,13 +62,57 @@ class AreaComun(models.Model):
             permitidos = {0,1,2,3,4,5}
         return fecha.weekday() in permitidos
 
+    def horario(self, fecha):
+        """(apertura, cierre) del día; si cierra a la misma hora o antes de abrir, cierra al día siguiente."""
+        return rango_local(fecha, self.apertura_hora, self.cierre_hora)
+
 
 # ================== RESERVAS ==================
 
+class SerieReserva(models.Model):
+    """
+    Reserva que se repite (estilo RRULE): cada `intervalo` semanas los días de
+    `dias_semana`, o cada `intervalo` meses el día de fecha_inicio, hasta fecha_fin.
+    Las ocurrencias son Reservas con `serie`; las arma area_comun.series.
+    """
+    id_serie = models.AutoField(primary_key=True)
+    usuario = models.ForeignKey(CopropietarioModel, on_delete=models.CASCADE, related_name="series_reserva")
+    area_comun = models.ForeignKey(AreaComun, on_delete=models.CASCADE, related_name="series_reserva")
+
+    FRECUENCIAS = (
+        ('semanal', 'Semanal'),
+        ('mensual', 'Mensual'),
+    )
+    frecuencia = models.CharField(max_length=10, choices=FRECUENCIAS, default='semanal')
+    intervalo = models.PositiveSmallIntegerField(default=1, help_text="Cada cuántas semanas/meses.")
+    # Semanal: CSV de días 0-6 (0=lunes), como AreaComun.dias_habiles; vacío = el día de fecha_inicio
+    dias_semana = models.CharField(max_length=20, blank=True)
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    nota = models.TextField(blank=True)
+
+    ESTADO_CHOICES = (
+        ('activa', 'Activa'),
+        ('cancelada', 'Cancelada'),
+    )
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='activa')
+    creada_en = models.DateTimeField(default=timezone.now)
+    cancelada_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'serie_reserva'
+
+    def __str__(self):
+        return f"{self.area_comun} {self.get_frecuencia_display().lower()} ({self.fecha_inicio} - {self.fecha_fin})"
+
+
 class Reserva(models.Model):
     id_reserva = models.AutoField(primary_key=True)
     usuario = models.ForeignKey(CopropietarioModel, on_delete=models.CASCADE, related_name="reservas")
     area_comun = models.ForeignKey(AreaComun, on_delete=models.CASCADE, related_name="reservas")
+    serie = models.ForeignKey(SerieReserva, on_delete=models.SET_NULL, null=True, blank=True, related_name="reservas")
 
     fecha = models.DateField(null=True, blank=True)
     hora_inicio = models.TimeField(null=True, blank=True)
@@ -62,9 +122,26 @@ class Reserva(models.Model):
     inicio = models.DateTimeField(null=True, blank=True)
     fin = models.DateTimeField(null=True, blank=True)
 
+    # [inicio, fin): lo llena save(); sobre él trabajan la restricción de no
+    # solapamiento (índice GiST por área) y las consultas de disponibilidad
     intervalo = DateTimeRangeField(null=True, blank=True)
     url_comprobante = models.URLField(null=True, blank=True)
 
+    # Comprobante de pago: se guarda local al reservar y un hilo lo sube al backend
+    # configurado (area_comun.comprobantes), con reintentos; al subir, queda url_comprobante
+    COMPROBANTE_ESTADOS = (
+        ('', 'Sin comprobante'),
+        ('pendiente', 'Pendiente de subir'),
+        ('subido', 'Subido'),
+        ('fallido', 'Falló la subida'),
+    )
+    comprobante_local = models.FileField(upload_to="reservas/comprobantes/%Y/%m/", null=True, blank=True)
+    comprobante_estado = models.CharField(max_length=10, choices=COMPROBANTE_ESTADOS, default='', blank=True)
+    comprobante_intentos = models.PositiveSmallIntegerField(default=0)
+    # próximo intento (o fin de la toma del intento en curso)
+    comprobante_reintento = models.DateTimeField(null=True, blank=True)
+    comprobante_error = models.TextField(blank=True)
+
     ESTADO_CHOICES = (
         ('pendiente', 'Pendiente'),
         ('confirmada', 'Confirmada'),
@@ -96,8 +173,40 @@ class Reserva(models.Model):
         indexes = [
             models.Index(fields=['area_comun', 'inicio']),
             models.Index(fields=['area_comun', 'fin']),
+            # comprobantes por subir, por vencimiento del reintento
+            models.Index(fields=['comprobante_reintento'], name='reserva_comprobante_pend_idx',
+                         condition=Q(comprobante_estado='pendiente')),
         ]
 
+    ACTIVAS = ("pendiente", "confirmada")  # las que ocupan el área
+    CAMPOS_HORARIO = ("fecha", "hora_inicio", "hora_fin", "inicio", "fin")
+    # lo que cambia la disponibilidad del área (signals.py invalida su caché)
+    CAMPOS_OCUPACION = ("area_comun", "area_comun_id", "estado", *CAMPOS_HORARIO, "intervalo")
+
+    # (area_comun_id, inicio, fin) tal como se leyó de la BD
+    _original = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._original = tuple(instance.__dict__.get(f) for f in ("area_comun_id", "inicio", "fin"))
+        return instance
+
+    def completar_intervalo(self):
+        """inicio/fin desde fecha + horas (si están) e `intervalo` = [inicio, fin)."""
+        if self.fecha and self.hora_inicio and self.hora_fin:
+            self.inicio, self.fin = rango_local(self.fecha, self.hora_inicio, self.hora_fin)
+        self.intervalo = DateTimeTZRange(self.inicio, self.fin, "[)") if self.inicio and self.fin else None
+
+    def save(self, *args, **kwargs):
+        # toda escritura (serializer, admin, shell) deja el intervalo al día
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or set(update_fields) & set(self.CAMPOS_HORARIO):
+            self.completar_intervalo()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "inicio", "fin", "intervalo"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         try:
             return f"{self.area_comun.nombre_area} - {self.usuario.idUsuario.username} ({self.fecha})"
@@ -1,11 +1,12 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 from django.utils import timezone
-from django.db.models import Q
 from rest_framework import serializers
-from django.db import IntegrityError 
-from .models import AreaComun, Reserva, AutorizacionVisita, RegistroVisitaModel
-from users.models import CopropietarioModel, GuardiaModel
-import os, requests
+from django.db import IntegrityError, transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from .models import AreaComun, Reserva, SerieReserva, AutorizacionVisita, RegistroVisitaModel, rango_local
+from users.models import GuardiaModel
+from users.propiedad import contexto_propiedad
+from . import comprobantes
 
 # --------- ÁREAS COMUNES / RESERVAS ---------
 
@@ -19,11 +20,22 @@ class ReservaSerializer(serializers.ModelSerializer):
     # Comprobante opcional; si el área requiere pago, se vuelve obligatorio
     imagen = serializers.ImageField(write_only=True, required=False)
     area_comun = serializers.PrimaryKeyRelatedField(queryset=AreaComun.objects.all())
+    intervalo = serializers.SerializerMethodField()
 
     class Meta:
         model = Reserva
         fields = "__all__"
-        read_only_fields = ["usuario", "url_comprobante", "inicio", "fin"]
+        # serie: solo la asigna series.crear_serie (una serie ajena se cancelaría con esta reserva)
+        read_only_fields = ["usuario", "serie", "url_comprobante", "inicio", "fin", "comprobante_local",
+                            "comprobante_estado", "comprobante_intentos", "comprobante_reintento",
+                            "comprobante_error"]
+
+    def get_intervalo(self, obj):
+        if not obj.intervalo:
+            return None
+        fecha_hora = serializers.DateTimeField()
+        return {"lower": fecha_hora.to_representation(obj.intervalo.lower),
+                "upper": fecha_hora.to_representation(obj.intervalo.upper), "bounds": obj.intervalo.bounds}
 
     def validate(self, data):
         fecha = data.get("fecha")
@@ -34,29 +46,26 @@ class ReservaSerializer(serializers.ModelSerializer):
         if not (fecha and hi and hf and area):
             raise serializers.ValidationError("fecha, hora_inicio, hora_fin y area_comun son obligatorios.")
 
-        tz = timezone.get_current_timezone()
-        inicio_dt = timezone.make_aware(datetime.combine(fecha, hi), tz)
-        fin_dt    = timezone.make_aware(datetime.combine(fecha, hf), tz)
-
-        # fin > inicio
-        if fin_dt <= inicio_dt:
-            raise serializers.ValidationError("La hora de fin debe ser posterior a la de inicio.")
+        if hf == hi:
+            raise serializers.ValidationError("La hora de fin debe ser distinta de la de inicio.")
+        # hora_fin anterior a hora_inicio: termina al día siguiente
+        inicio_dt, fin_dt = rango_local(fecha, hi, hf)
 
         # Antelación 24h
         if inicio_dt < timezone.localtime() + timedelta(hours=24):
             raise serializers.ValidationError("Las reservas deben realizarse al menos 24 horas antes.")
 
-        # Dentro del horario del área
-        apertura = timezone.make_aware(datetime.combine(fecha, area.apertura_hora), tz)
-        cierre   = timezone.make_aware(datetime.combine(fecha, area.cierre_hora), tz)
-        if not (apertura <= inicio_dt and fin_dt <= cierre):
+        # Dentro del horario del área (el del día o, pasada la medianoche, el de la noche anterior)
+        horarios = (area.horario(fecha), area.horario(fecha - timedelta(days=1)))
+        if not any(apertura <= inicio_dt and fin_dt <= cierre for apertura, cierre in horarios):
             raise serializers.ValidationError("La reserva debe estar dentro del horario del área.")
 
-        # Antisolape lógico (mismo día/área). Permite back-to-back.
+        # Antisolape: && sobre el intervalo (índice GiST de la restricción). [inicio, fin)
+        # permite reservas seguidas; la restricción en la BD cubre las carreras.
         solapa = (
             Reserva.objects
-            .filter(area_comun=area, fecha=fecha, estado__in=["pendiente", "confirmada"])
-            .filter(Q(hora_inicio__lt=hf) & Q(hora_fin__gt=hi))
+            .filter(area_comun=area, estado__in=Reserva.ACTIVAS,
+                    intervalo__overlap=DateTimeTZRange(inicio_dt, fin_dt, "[)"))
             .exists()
         )
         if solapa:
@@ -76,33 +85,77 @@ class ReservaSerializer(serializers.ModelSerializer):
         area   = validated_data["area_comun"]
 
         # Usuario = copropietario logueado
-        user = self.context["request"].user
-        try:
-            copro = CopropietarioModel.objects.get(idUsuario=user)
-        except CopropietarioModel.DoesNotExist:
+        request = self.context["request"]
+        if not contexto_propiedad(request).es_copropietario:
             raise serializers.ValidationError("El usuario logueado no es un copropietario.")
 
-        # Subir comprobante si el área lo requiere (o si se envió)
-        if area.requiere_pago:
-            if imagen is None:
-                raise serializers.ValidationError("Debe adjuntar comprobante (imagen) para esta área.")
-            api_key = os.getenv("IMGBB_API_KEY", "")
-            if not api_key:
-                raise serializers.ValidationError("Falta IMGBB_API_KEY en el servidor.")
-            try:
-                files = {"image": imagen.read()}
-                resp = requests.post(f"https://api.imgbb.com/1/upload?key={api_key}", files=files, timeout=20)
-                resp.raise_for_status()
-                validated_data["url_comprobante"] = resp.json()["data"]["url"]
-            except Exception:
-                raise serializers.ValidationError("Error subiendo el comprobante.")
+        # Comprobante: se guarda local y se sube en segundo plano (area_comun.comprobantes)
+        if area.requiere_pago and imagen is None:
+            raise serializers.ValidationError("Debe adjuntar comprobante (imagen) para esta área.")
+        if imagen is not None:
+            validated_data.update(comprobante_local=imagen, comprobante_estado="pendiente",
+                                  comprobante_reintento=timezone.now())
 
         # Create con manejo de ExclusionConstraint (anti-solape en DB)
+        reserva = Reserva(usuario_id=request.user.pk, **validated_data)
         try:
-            return Reserva.objects.create(usuario=copro, **validated_data)
+            # savepoint: la vista puede correr dentro de una transacción (idempotencia)
+            with transaction.atomic():
+                reserva.save()
         except IntegrityError:
+            # la imagen se escribe antes del INSERT: sin reserva quedaría huérfana
+            if reserva.comprobante_local and reserva.comprobante_local._committed:
+                reserva.comprobante_local.delete(save=False)
             # Si otro proceso creó una reserva en el mismo intervalo justo ahora
             raise serializers.ValidationError("El horario se ocupó mientras confirmabas. Intenta con otro rango.")
+        if reserva.comprobante_estado == "pendiente":
+            comprobantes.encolar(reserva.pk)
+        return reserva
+
+
+class SerieReservaSerializer(serializers.ModelSerializer):
+    area_comun = serializers.PrimaryKeyRelatedField(queryset=AreaComun.objects.all())
+    reservas = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SerieReserva
+        fields = "__all__"
+        read_only_fields = ["usuario", "estado", "creada_en", "cancelada_en"]
+
+    def get_reservas(self, obj):
+        # prefetch de la vista: sin consulta por serie
+        return [{"id_reserva": r.id_reserva, "fecha": r.fecha.isoformat(), "estado": r.estado}
+                for r in sorted(obj.reservas.all(), key=lambda r: r.fecha)]
+
+    def validate(self, data):
+        area = data["area_comun"]
+        if area.estado != "activo":
+            raise serializers.ValidationError("El área no está activa.")
+        # cada reserva de pago lleva su propio comprobante
+        if area.requiere_pago:
+            raise serializers.ValidationError("Las áreas con pago se reservan de a una, con su comprobante.")
+        if data["hora_fin"] == data["hora_inicio"]:
+            raise serializers.ValidationError("La hora de fin debe ser distinta de la de inicio.")
+        if data["fecha_fin"] < data["fecha_inicio"]:
+            raise serializers.ValidationError("fecha_fin debe ser igual o posterior a fecha_inicio.")
+        if data["fecha_inicio"] < timezone.localdate():
+            raise serializers.ValidationError("fecha_inicio no puede ser pasada.")
+        if data.get("intervalo", 1) < 1:
+            raise serializers.ValidationError("intervalo debe ser 1 o más.")
+
+        dias = data.get("dias_semana", "")
+        if data.get("frecuencia", "semanal") == "mensual":
+            dias = ""  # mensual: el día del mes de fecha_inicio
+        elif dias:
+            try:
+                numeros = sorted({int(x) for x in dias.split(",") if x.strip() != ""})
+            except ValueError:
+                numeros = [-1]
+            if not numeros or not all(0 <= n <= 6 for n in numeros):
+                raise serializers.ValidationError("dias_semana: CSV de días 0-6 (0=lunes ... 6=domingo).")
+            dias = ",".join(map(str, numeros))
+        data["dias_semana"] = dias
+        return data
 
 
 # --------- VISITAS (CU11) ---------
@@ -0,0 +1,206 @@
+"""
+Series de reservas: una SerieReserva se expande en Reservas dentro de la
+ventana del área (hoy + max_dias_adelante).
+
+  - las fechas salen de la regla (semanal por días de la semana o mensual por
+    día del mes, cada `intervalo`); un mes sin ese día (31, 29-feb) se salta;
+  - cada fecha se valida como una reserva suelta (día hábil, antelación,
+    horario) y todas se cruzan contra las reservas activas con UNA consulta
+    (`intervalo && [primera, última)`, índice GiST de la restricción) y búsqueda
+    binaria;
+  - las libres se insertan con un bulk_create; si entre la consulta y el
+    insert otra reserva ocupó un horario, la restricción lo rechaza y se
+    reintenta fila por fila, pasando esas a conflictos;
+  - cancelar la serie cancela sus reservas futuras con un solo UPDATE.
+
+Las fechas que entran a la ventana con los días las agrega
+`manage.py extender_series` (expandir() salta las que la serie ya tiene).
+bulk_create y UPDATE no pasan por las señales: la caché de disponibilidad se
+invalida aquí, al confirmar.
+"""
+import calendar
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.backends.postgresql.psycopg_any import DateTimeTZRange
+from django.utils import timezone
+
+from .disponibilidad import invalidar_reservas
+from .models import Reserva, SerieReserva, rango_local
+
+_T = Reserva._meta.db_table
+
+
+class SerieSinFechas(Exception):
+    """Ninguna fecha de la serie se pudo reservar; `conflictos` dice por qué."""
+
+    def __init__(self, conflictos):
+        super().__init__("Ninguna fecha de la serie está disponible.")
+        self.conflictos = conflictos
+
+
+def limite(area) -> date:
+    """Última fecha reservable del área."""
+    return timezone.localdate() + timedelta(days=area.max_dias_adelante)
+
+
+def dias_semana(serie) -> set:
+    if not serie.dias_semana:
+        return {serie.fecha_inicio.weekday()}
+    return {int(x) for x in serie.dias_semana.split(",") if x.strip() != ""}
+
+
+def fechas(serie, hasta) -> list:
+    """Fechas de la regla entre fecha_inicio y min(fecha_fin, hasta)."""
+    ultima = min(serie.fecha_fin, hasta)
+    salida = []
+    if serie.frecuencia == "mensual":
+        año, mes, k = serie.fecha_inicio.year, serie.fecha_inicio.month, 0
+        while True:
+            m = mes - 1 + k * serie.intervalo
+            a, m = año + m // 12, m % 12 + 1
+            if date(a, m, 1) > ultima:
+                return salida
+            if serie.fecha_inicio.day <= calendar.monthrange(a, m)[1]:
+                salida.append(date(a, m, serie.fecha_inicio.day))
+            k += 1
+    dias = dias_semana(serie)
+    lunes = serie.fecha_inicio - timedelta(days=serie.fecha_inicio.weekday())
+    fecha = serie.fecha_inicio
+    while fecha <= ultima:
+        if fecha.weekday() in dias and ((fecha - lunes).days // 7) % serie.intervalo == 0:
+            salida.append(fecha)
+        fecha += timedelta(days=1)
+    return salida
+
+
+def _conflicto(fecha, motivo, inicio=None, fin=None) -> dict:
+    datos = {"fecha": fecha.isoformat(), "motivo": motivo}
+    if inicio:
+        datos.update(inicio=inicio.isoformat(), fin=fin.isoformat())
+    return datos
+
+
+def planificar(serie, hasta=None):
+    """
+    (reservas sin guardar, conflictos) de las fechas de la serie hasta `hasta`
+    (por defecto el límite del área) que la serie todavía no tiene.
+    """
+    area = serie.area_comun
+    hasta = min(hasta or limite(area), limite(area))
+    ya = set(serie.reservas.values_list("fecha", flat=True)) if serie.pk else set()
+    minimo = timezone.now() + timedelta(hours=area.antelacion_min_horas)
+
+    candidatas, conflictos = [], []
+    hoy = timezone.localdate()
+    for fecha in fechas(serie, hasta):
+        if fecha in ya or fecha < hoy:  # al extender: las pasadas ya no se reservan
+            continue
+        inicio, fin = rango_local(fecha, serie.hora_inicio, serie.hora_fin)
+        horarios = (area.horario(fecha), area.horario(fecha - timedelta(days=1)))
+        if not area.dia_habil(fecha):
+            conflictos.append(_conflicto(fecha, "Día no hábil para el área."))
+        elif inicio < minimo:
+            conflictos.append(_conflicto(fecha, f"Debe reservarse con {area.antelacion_min_horas} horas de antelación."))
+        elif not any(apertura <= inicio and fin <= cierre for apertura, cierre in horarios):
+            conflictos.append(_conflicto(fecha, "Fuera del horario del área."))
+        else:
+            candidatas.append((fecha, inicio, fin))
+    if not candidatas:
+        return [], conflictos
+
+    # una consulta para todas: las activas no se solapan, ordenadas por inicio también lo están por fin
+    ocupadas = (Reserva.objects
+                .filter(area_comun=area, estado__in=Reserva.ACTIVAS,
+                        intervalo__overlap=DateTimeTZRange(candidatas[0][1], candidatas[-1][2], "[)"))
+                .order_by("inicio").values_list("inicio", "fin"))
+    inicios, fines = [], []
+    for ini, fin in ocupadas:
+        inicios.append(ini)
+        fines.append(fin)
+
+    libres = []
+    for fecha, inicio, fin in candidatas:
+        i = bisect_right(fines, inicio)  # primera ocupada que termina después de `inicio`
+        if i < len(inicios) and inicios[i] < fin:
+            conflictos.append(_conflicto(fecha, "Ya existe una reserva en ese horario.", inicio, fin))
+            continue
+        reserva = Reserva(usuario_id=serie.usuario_id, area_comun=area, serie=serie, fecha=fecha,
+                          hora_inicio=serie.hora_inicio, hora_fin=serie.hora_fin, nota=serie.nota)
+        reserva.completar_intervalo()  # bulk_create no pasa por save()
+        libres.append(reserva)
+    return libres, conflictos
+
+
+def _insertar(reservas, conflictos) -> list:
+    try:
+        with transaction.atomic():
+            return Reserva.objects.bulk_create(reservas)
+    except IntegrityError:
+        pass
+    # otra reserva ocupó algún horario entre la consulta y el insert
+    creadas = []
+    for reserva in reservas:
+        try:
+            with transaction.atomic():
+                reserva.save(force_insert=True)
+            creadas.append(reserva)
+        except IntegrityError:
+            conflictos.append(_conflicto(reserva.fecha, "El horario se ocupó mientras se creaba la serie.",
+                                         reserva.inicio, reserva.fin))
+    return creadas
+
+
+@transaction.atomic
+def expandir(serie, hasta=None):
+    """Crea las reservas libres de la serie que faltan. Devuelve (creadas, conflictos)."""
+    libres, conflictos = planificar(serie, hasta)
+    creadas = _insertar(libres, conflictos) if libres else []
+    tramos = [(r.area_comun_id, r.inicio, r.fin) for r in creadas]
+    if tramos:
+        transaction.on_commit(lambda: invalidar_reservas(tramos))
+    conflictos.sort(key=lambda c: c["fecha"])
+    return creadas, conflictos
+
+
+@transaction.atomic
+def crear_serie(serie):
+    """Guarda la serie y sus reservas; si ninguna fecha está libre no guarda nada (SerieSinFechas)."""
+    serie.save()
+    creadas, conflictos = expandir(serie)
+    if not creadas:
+        raise SerieSinFechas(conflictos)
+    return creadas, conflictos
+
+
+@transaction.atomic
+def cancelar_serie(serie, desde=None, motivo="") -> int:
+    """
+    Cancela en un UPDATE las reservas activas de la serie que empiezan en `desde`
+    o después (por defecto, ahora). Las pasadas quedan como están.
+    """
+    ahora = timezone.now()
+    sql = f"""
+        UPDATE {_T} SET estado = 'cancelada', cancelada_en = %(ahora)s, motivo_cancelacion = %(motivo)s
+        WHERE serie_id = %(serie)s AND estado = ANY(%(activas)s) AND inicio >= %(desde)s
+        RETURNING area_comun_id, inicio, fin
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, {"ahora": ahora, "motivo": motivo or "Serie cancelada", "serie": serie.pk,
+                          "activas": list(Reserva.ACTIVAS), "desde": max(desde or ahora, ahora)})
+        tramos = cur.fetchall()
+    if desde is None or desde <= ahora:
+        serie.estado, serie.cancelada_en = "cancelada", ahora
+        serie.save(update_fields=["estado", "cancelada_en"])
+    else:
+        # cancelar desde una fecha futura: la serie termina ahí
+        serie.fecha_fin = min(serie.fecha_fin, timezone.localtime(desde).date() - timedelta(days=1))
+        serie.save(update_fields=["fecha_fin"])
+    if tramos:
+        transaction.on_commit(lambda: invalidar_reservas(tramos))
+    return len(tramos)
+
+
+def series_para_extender():
+    return SerieReserva.objects.filter(estado="activa", fecha_fin__gte=timezone.localdate()).select_related("area_comun")
@@ -0,0 +1,37 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .disponibilidad import invalidar_areas, invalidar_reservas
+from .models import AreaComun, Reserva
+
+# La caché de disponibilidad se invalida al confirmar: antes, otra lectura podría volver a
+# cachear el estado viejo. Se borran los días del intervalo anterior (Reserva._original)
+# y del nuevo, así mover una reserva de hora, día o área libera y ocupa lo que corresponde.
+
+
+@receiver(post_save, sender=Reserva)
+def reserva_post_save(sender, instance: Reserva, update_fields=None, **kwargs):
+    if update_fields is not None and not set(update_fields) & set(Reserva.CAMPOS_OCUPACION):
+        return  # nota, comprobante, etc.
+    tramos = [(instance.area_comun_id, instance.inicio, instance.fin)]
+    if instance._original:
+        tramos.append(instance._original)
+    transaction.on_commit(lambda: invalidar_reservas(tramos))
+    instance._original = tramos[0]
+
+
+@receiver(post_delete, sender=Reserva)
+def reserva_post_delete(sender, instance: Reserva, **kwargs):
+    tramos = [(instance.area_comun_id, instance.inicio, instance.fin)]
+    if instance._original:
+        tramos.append(instance._original)
+    transaction.on_commit(lambda: invalidar_reservas(tramos))
+
+
+@receiver(post_save, sender=AreaComun)
+@receiver(post_delete, sender=AreaComun)
+def area_cambiada(sender, instance: AreaComun, **kwargs):
+    # horario, días hábiles, bloque o estado: todos los días del área
+    area_id = instance.pk
+    transaction.on_commit(lambda: invalidar_areas([area_id]))
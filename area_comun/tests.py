@@ -1,3 +1,488 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime, time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from users.models import CopropietarioModel, Rol, Usuario
+from . import comprobantes, disponibilidad, series
+from .disponibilidad import calendario, estadisticas, invalidar_reservas
+from .models import AreaComun, Reserva, SerieReserva
+from .serializers import ReservaSerializer
+
+LUNES = date(2030, 1, 7)
+SABADO = date(2030, 1, 12)
+
+
+def crear_copropietario(username="a101"):
+    rol, _ = Rol.objects.get_or_create(name="Copropietario")
+    usuario = Usuario.objects.create_user(username=username, password="clave123", email=f"{username}@test.bo",
+                                          ci=f"ci-{username}", idRol=rol)
+    return CopropietarioModel.objects.create(idUsuario=usuario)
+
+
+def crear_area(nombre="Churrasquera", **extra):
+    datos = {"capacidad": 20, "apertura_hora": time(8), "cierre_hora": time(22), "bloque_minutos": 60,
+             "antelacion_min_horas": 0, "dias_habiles": "0,1,2,3,4,5", **extra}
+    return AreaComun.objects.create(nombre_area=nombre, **datos)
+
+
+def crear_reserva(area, usuario, fecha, desde, hasta, **extra):
+    return Reserva.objects.create(area_comun=area, usuario=usuario, fecha=fecha, hora_inicio=desde, hora_fin=hasta,
+                                  **extra)
+
+
+# =============== Disponibilidad por día ===============
+
+def en(fecha, hora, minuto=0):
+    return timezone.make_aware(datetime.combine(fecha, time(hora, minuto)))
+
+
+class DisponibilidadDiaTests(SimpleTestCase):
+    """disponibilidad._dia sobre reservas ya ordenadas, sin base de datos."""
+
+    def dia(self, fecha, reservas=(), **extra):
+        datos = {"apertura_hora": time(8), "cierre_hora": time(22), "bloque_minutos": 60,
+                 "dias_habiles": "0,1,2,3,4,5", **extra}
+        inicios, fines = [i for i, _ in reservas], [f for _, f in reservas]
+        return disponibilidad._dia(AreaComun(**datos), fecha, inicios, fines, timezone.get_current_timezone())
+
+    def horas(self, bloques):
+        return [(b["hora_inicio"], b["hora_fin"]) for b in bloques]
+
+    def test_libres_ajustados_a_la_grilla(self):
+        dia = self.dia(LUNES, [(en(LUNES, 9, 30), en(LUNES, 10, 15))])
+        self.assertEqual(self.horas(dia["ocupados"]), [("09:30", "10:15")])
+        # 09:00-09:30 y 10:15-11:00 no completan un bloque de la grilla desde las 08:00
+        self.assertEqual(self.horas(dia["libres"]), [("08:00", "09:00"), ("11:00", "22:00")])
+        self.assertEqual(dia["bloques_libres"], 12)
+        dia = self.dia(LUNES, [(en(LUNES, 9, 30), en(LUNES, 10, 15))], bloque_minutos=45)
+        self.assertEqual(self.horas(dia["libres"])[:2], [("08:00", "09:30"), ("10:15", "21:30")])
+
+    def test_une_reservas_contiguas_y_recorta_al_horario(self):
+        dia = self.dia(LUNES, [(en(LUNES, 7), en(LUNES, 9)), (en(LUNES, 10), en(LUNES, 11)),
+                               (en(LUNES, 11), en(LUNES, 12)), (en(LUNES, 21), en(LUNES, 23))])
+        self.assertEqual(self.horas(dia["ocupados"]), [("08:00", "09:00"), ("10:00", "12:00"), ("21:00", "22:00")])
+        self.assertEqual(self.horas(dia["libres"]), [("09:00", "10:00"), ("12:00", "21:00")])
+        self.assertEqual(dia["bloques_libres"], 10)
+
+    def test_horario_que_cruza_la_medianoche(self):
+        martes = date(2030, 1, 8)
+        reservas = [(en(LUNES, 0, 30), en(LUNES, 1, 30)),  # es de la noche del domingo
+                    (en(LUNES, 23), en(martes, 1))]
+        dia = self.dia(LUNES, reservas, apertura_hora=time(20), cierre_hora=time(2))
+        self.assertEqual((dia["apertura"], dia["cierre"]), (en(LUNES, 20).isoformat(), en(martes, 2).isoformat()))
+        self.assertEqual(self.horas(dia["ocupados"]), [("23:00", "01:00")])
+        self.assertEqual(dia["ocupados"][0]["fin"], en(martes, 1).isoformat())
+        self.assertEqual(self.horas(dia["libres"]), [("20:00", "23:00"), ("01:00", "02:00")])
+        self.assertEqual(dia["bloques_libres"], 4)
+        # el martes abre a las 20:00: la reserva de la madrugada ya no lo toca
+        self.assertEqual(self.dia(martes, reservas, apertura_hora=time(20), cierre_hora=time(2))["bloques_libres"], 6)
+
+    def test_dia_no_habil_va_vacio(self):
+        self.assertEqual(self.dia(SABADO, dias_habiles="0,1,2,3,4"),
+                         {"fecha": SABADO.isoformat(), "habil": False, "ocupados": [], "libres": [],
+                          "bloques_libres": 0})
+        self.assertTrue(self.dia(SABADO)["habil"])
+        self.assertFalse(self.dia(date(2030, 1, 13))["habil"])  # domingo
+
+
+# =============== Áreas (API) ===============
+
+class AreaComunApiTests(TestCase):
+    def setUp(self):
+        rol, _ = Rol.objects.get_or_create(name="Administrador")
+        self.admin = Usuario.objects.create_user(username="admin", password="clave123", email="admin@test.bo",
+                                                 ci="ci-admin", idRol=rol)
+        self.area = crear_area()
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_listado_en_el_sobre(self):
+        r = self.client.get("/areacomun/areas/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual((r.json()["status"], [a["id_area"] for a in r.json()["values"]]), (1, [self.area.pk]))
+
+    def test_delete_desactiva_sin_borrar(self):
+        crear_reserva(self.area, crear_copropietario(), LUNES, time(10), time(12))
+        r = self.client.delete(f"/areacomun/areas/{self.area.pk}/")
+        self.assertEqual(r.status_code, 200)
+        self.area.refresh_from_db()
+        self.assertEqual(self.area.estado, "inactivo")
+        self.assertEqual(Reserva.objects.filter(area_comun=self.area).count(), 1)
+        r = self.client.get(f"/areacomun/areas/{self.area.pk}/disponibilidad/?fecha={LUNES}")
+        self.assertEqual(r.status_code, 400)
+
+    def test_sin_sesion_es_401(self):
+        self.assertEqual(APIClient().get("/areacomun/areas/").status_code, 401)
+
+
+# =============== Intervalo de las reservas ===============
+
+class ReservaIntervaloTests(TestCase):
+    """save() llena inicio/fin/intervalo; la restricción de la BD impide los solapes."""
+
+    def setUp(self):
+        self.area = crear_area()
+        self.usuario = crear_copropietario()
+
+    def assertIntervalo(self, reserva, inicio, fin):
+        reserva = Reserva.objects.get(pk=reserva.pk)
+        self.assertEqual((reserva.inicio, reserva.fin), (inicio, fin))
+        self.assertEqual((reserva.intervalo.lower, reserva.intervalo.upper, reserva.intervalo.bounds),
+                         (inicio, fin, "[)"))
+
+    def valida(self, fecha, desde, hasta, area=None):
+        ser = ReservaSerializer(data={"area_comun": (area or self.area).pk, "fecha": fecha.isoformat(),
+                                      "hora_inicio": desde, "hora_fin": hasta})
+        return ser.is_valid()
+
+    def test_solapada_la_rechaza_la_restriccion(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_constraint WHERE conname = 'exc_reserva_no_overlap_por_area'")
+            if cur.fetchone() is None:
+                self.skipTest("la BD de pruebas no tiene la restricción de no solapamiento (btree_gist)")
+        crear_reserva(self.area, self.usuario, LUNES, time(10), time(12))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            crear_reserva(self.area, self.usuario, LUNES, time(11), time(13))
+        # una cancelada no ocupa el horario
+        crear_reserva(self.area, self.usuario, LUNES, time(11), time(13), estado="cancelada")
+        self.assertEqual(Reserva.objects.count(), 2)
+
+    def test_reservas_seguidas_se_permiten(self):
+        crear_reserva(self.area, self.usuario, LUNES, time(10), time(12))
+        self.assertTrue(self.valida(LUNES, "12:00", "14:00"))
+        self.assertTrue(self.valida(LUNES, "08:00", "10:00"))
+        self.assertFalse(self.valida(LUNES, "11:59", "14:00"))
+        with transaction.atomic():
+            crear_reserva(self.area, self.usuario, LUNES, time(12), time(14))
+            crear_reserva(self.area, self.usuario, LUNES, time(8), time(10))
+        self.assertEqual(Reserva.objects.count(), 3)
+
+    def test_cruce_de_medianoche_usa_el_horario_de_la_noche_anterior(self):
+        noche = crear_area("Salón", apertura_hora=time(20), cierre_hora=time(2))
+        martes = date(2030, 1, 8)
+        reserva = crear_reserva(noche, self.usuario, LUNES, time(23), time(1))
+        self.assertIntervalo(reserva, en(LUNES, 23), en(martes, 1))
+        # la madrugada del martes es parte del horario del lunes (20:00-02:00)
+        self.assertTrue(self.valida(martes, "01:00", "02:00", noche))
+        self.assertFalse(self.valida(martes, "00:30", "01:30", noche))  # choca con la de las 23:00
+        self.assertFalse(self.valida(martes, "01:30", "02:30", noche))  # pasa el cierre
+        # el sábado no es hábil, pero la noche del viernes sigue hasta las 02:00
+        self.assertTrue(self.valida(SABADO, "00:00", "01:00", noche))
+
+    def test_update_fields_parcial_recalcula_el_intervalo(self):
+        reserva = crear_reserva(self.area, self.usuario, LUNES, time(10), time(12))
+        reserva.hora_fin = time(13)
+        reserva.save(update_fields=["hora_fin"])
+        self.assertIntervalo(reserva, en(LUNES, 10), en(LUNES, 13))
+        martes = date(2030, 1, 8)
+        reserva.fecha = martes
+        reserva.save(update_fields=["fecha"])
+        self.assertIntervalo(reserva, en(martes, 10), en(martes, 13))
+        # sin campos de horario no se toca el intervalo (ni lo que cambió en memoria sin guardar)
+        reserva.hora_inicio, reserva.nota = time(9), "con parrilla"
+        reserva.save(update_fields=["nota"])
+        self.assertIntervalo(reserva, en(martes, 10), en(martes, 13))
+        reserva.refresh_from_db()
+        reserva.hora_inicio = time(23)  # hora_fin 13:00 <= 23:00: termina el día siguiente
+        reserva.save(update_fields=["hora_inicio"])
+        self.assertIntervalo(reserva, en(martes, 23), en(date(2030, 1, 9), 13))
+
+
+# =============== Caché de disponibilidad ===============
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                                       "LOCATION": "pruebas-disponibilidad"}})
+class DisponibilidadCacheTests(TestCase):
+    """Cada día se cachea por (área, fecha, generación); las reservas suben la generación al confirmar."""
+
+    def setUp(self):
+        disponibilidad._cache().clear()
+        self.area = crear_area()
+        self.usuario = crear_copropietario()
+
+    def dias(self, desde=LUNES, hasta=SABADO):
+        return {d["fecha"]: d for d in calendario([self.area], desde, hasta)[0]["dias"]}
+
+    def ocupados(self, fecha):
+        return [(b["hora_inicio"], b["hora_fin"]) for b in self.dias(fecha, fecha)[fecha.isoformat()]["ocupados"]]
+
+    def reservar(self, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return crear_reserva(self.area, self.usuario, *args, **kwargs)
+
+    def test_aciertos_y_fallos(self):
+        self.dias()
+        self.assertEqual(estadisticas(reiniciar=True), {"aciertos": 0, "fallos": 6, "tasa_aciertos": 0.0})
+        with self.assertNumQueries(0):
+            self.dias()
+        self.assertEqual(estadisticas(reiniciar=True), {"aciertos": 6, "fallos": 0, "tasa_aciertos": 1.0})
+
+    def test_crear_recalcula_solo_el_dia_tocado(self):
+        self.dias()
+        estadisticas(reiniciar=True)
+        self.reservar(LUNES, time(10), time(12))
+        dias = self.dias()
+        self.assertEqual(estadisticas(reiniciar=True)["fallos"], 1)
+        self.assertEqual([b["hora_inicio"] for b in dias[LUNES.isoformat()]["ocupados"]], ["10:00"])
+
+    def test_cancelar_libera_el_dia(self):
+        reserva = self.reservar(LUNES, time(10), time(12))
+        self.assertEqual(self.ocupados(LUNES), [("10:00", "12:00")])
+        reserva.estado = "cancelada"
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.save(update_fields=["estado"])
+        self.assertEqual(self.ocupados(LUNES), [])
+
+    def test_mover_libera_el_dia_viejo_y_ocupa_el_nuevo(self):
+        reserva = self.reservar(LUNES, time(10), time(12))
+        martes = date(2030, 1, 8)
+        self.dias()
+        reserva.fecha, reserva.hora_inicio, reserva.hora_fin = martes, time(14), time(16)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva.save()
+        self.assertEqual(self.ocupados(LUNES), [])
+        self.assertEqual(self.ocupados(martes), [("14:00", "16:00")])
+
+    def test_lectura_vieja_no_pisa_la_invalidacion(self):
+        # una lectura consulta las reservas, otra reserva confirma y recién después la lectura guarda el día
+        original = disponibilidad._reservas
+
+        def leer_y_confirmar_otra(*args):
+            leidas = original(*args)
+            reserva = crear_reserva(self.area, self.usuario, LUNES, time(10), time(12))
+            invalidar_reservas([(self.area.pk, reserva.inicio, reserva.fin)])  # su on_commit
+            return leidas
+
+        with mock.patch.object(disponibilidad, "_reservas", leer_y_confirmar_otra):
+            self.assertEqual(self.ocupados(LUNES), [])  # lo que leyó antes del commit
+        self.assertEqual(self.ocupados(LUNES), [("10:00", "12:00")])
+
+    def test_editar_el_area_invalida_todos_sus_dias(self):
+        self.dias()
+        estadisticas(reiniciar=True)
+        self.area.apertura_hora = time(9)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.area.save()
+        self.assertEqual(self.dias()[LUNES.isoformat()]["libres"][0]["hora_inicio"], "09:00")
+        self.assertEqual(estadisticas()["fallos"], 6)
+
+
+# =============== Comprobantes de reservas ===============
+
+def _png():
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8), "blue").save(buf, "PNG")
+    return buf.getvalue()
+
+
+class BackendPrueba:
+    """Backend para las pruebas: levanta los `errores` en orden y anota cada subida."""
+    errores = []
+    subidas = []
+    en_subida = seguir = None  # threading.Event para frenar una subida a mitad
+
+    def subir(self, nombre, contenido):
+        BackendPrueba.subidas.append(nombre)
+        if BackendPrueba.en_subida:
+            BackendPrueba.en_subida.set()
+            BackendPrueba.seguir.wait(10)
+        if BackendPrueba.errores:
+            raise BackendPrueba.errores.pop(0)
+        return f"https://cdn.test/{os.path.basename(nombre)}"
+
+
+class ComprobanteReservaMixin:
+    backend = "area_comun.tests.BackendPrueba"
+
+    def setUp(self):
+        super().setUp()
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=carpeta, RESERVA_COMPROBANTE_BACKEND=self.backend)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        BackendPrueba.errores, BackendPrueba.subidas = [], []
+        BackendPrueba.en_subida = BackendPrueba.seguir = None
+        self.area = crear_area(requiere_pago=True)
+        self.usuario = crear_copropietario()
+
+    def reserva_con_comprobante(self, desde=time(10), hasta=time(12)):
+        return crear_reserva(self.area, self.usuario, LUNES, desde, hasta,
+                             comprobante_local=SimpleUploadedFile("pago.png", _png()),
+                             comprobante_estado="pendiente", comprobante_reintento=timezone.now())
+
+    def locales(self):
+        return sorted(f for _, _, archivos in os.walk(settings.MEDIA_ROOT) for f in archivos)
+
+
+class ComprobantesReservaTests(ComprobanteReservaMixin, TestCase):
+    def vencer(self, reserva):
+        Reserva.objects.filter(pk=reserva.pk).update(comprobante_reintento=timezone.now())
+
+    def test_backend_local_publica_y_borra_el_temporal(self):
+        with override_settings(RESERVA_COMPROBANTE_BACKEND="area_comun.comprobantes.LocalBackend"):
+            reserva = self.reserva_con_comprobante()
+            local = reserva.comprobante_local.name
+            self.assertEqual(comprobantes.subir_comprobante(reserva.pk), ("subido", None))
+        reserva.refresh_from_db()
+        self.assertEqual((reserva.comprobante_estado, reserva.comprobante_intentos, bool(reserva.comprobante_local)),
+                         ("subido", 1, False))
+        self.assertTrue(reserva.url_comprobante.startswith("/media/reservas/publicados/"))
+        self.assertFalse(default_storage.exists(local))
+        self.assertEqual(len(self.locales()), 1)
+
+    def test_reintentos_con_espera_exponencial_hasta_fallar(self):
+        reserva = self.reserva_con_comprobante()
+        BackendPrueba.errores = [comprobantes.ErrorSubida("timeout")] * comprobantes.MAX_INTENTOS
+        with self.assertLogs("area_comun.comprobantes", "WARNING") as logs:
+            for intento in range(1, comprobantes.MAX_INTENTOS):
+                estado, demora = comprobantes.subir_comprobante(reserva.pk)
+                tope = comprobantes.ESPERA_BASE * 2 ** (intento - 1)
+                self.assertEqual(estado, "pendiente")
+                self.assertTrue(tope / 2 <= demora.total_seconds() <= tope, (intento, demora))
+                self.assertIsNone(comprobantes.subir_comprobante(reserva.pk))  # todavía no toca
+                self.vencer(reserva)
+            self.assertEqual(comprobantes.subir_comprobante(reserva.pk), ("fallido", None))
+        self.assertEqual(len(logs.records), comprobantes.MAX_INTENTOS)
+        reserva.refresh_from_db()
+        self.assertEqual((reserva.comprobante_estado, reserva.comprobante_intentos, reserva.comprobante_error),
+                         ("fallido", comprobantes.MAX_INTENTOS, "timeout"))
+        self.assertIsNone(reserva.comprobante_reintento)
+        self.assertEqual(len(BackendPrueba.subidas), comprobantes.MAX_INTENTOS)
+        # el temporal se conserva para volver a intentarlo a mano
+        self.assertEqual(comprobantes.reintentar_fallidos(), 1)
+        self.assertEqual(comprobantes.subir_comprobante(reserva.pk), ("subido", None))
+
+    def test_rechazo_definitivo_falla_sin_reintentar(self):
+        reserva = self.reserva_con_comprobante()
+        BackendPrueba.errores = [comprobantes.ErrorSubida("imagen rechazada", reintentable=False)]
+        with self.assertLogs("area_comun.comprobantes", "WARNING"):
+            self.assertEqual(comprobantes.subir_comprobante(reserva.pk), ("fallido", None))
+        reserva.refresh_from_db()
+        self.assertEqual((reserva.comprobante_estado, reserva.comprobante_intentos), ("fallido", 1))
+        self.vencer(reserva)
+        self.assertIsNone(comprobantes.subir_comprobante(reserva.pk))
+
+    def test_reserva_que_choca_no_deja_el_comprobante_huerfano(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario.idUsuario)
+
+        def reservar(desde):
+            return self.client.post("/areacomun/reservas/", {
+                "area_comun": self.area.pk, "fecha": LUNES.isoformat(), "hora_inicio": desde, "hora_fin": "12:00",
+                "imagen": SimpleUploadedFile("pago.png", _png(), "image/png")}, format="multipart")
+
+        # una restricción que salta en el INSERT, como la de no solapamiento en una carrera:
+        # la imagen ya quedó escrita (FileField.pre_save) cuando la BD rechaza la fila
+        with connection.cursor() as cur:
+            cur.execute(f"ALTER TABLE {Reserva._meta.db_table} ADD CONSTRAINT prueba_choque "
+                        "CHECK (hora_inicio <> '10:00')")
+        r = reservar("10:00")
+        self.assertEqual(r.status_code, 400)
+        self.assertFalse(Reserva.objects.exists())
+        self.assertEqual(self.locales(), [])
+        self.assertEqual(reservar("11:00").status_code, 201)
+        self.assertEqual(len(self.locales()), 1)
+
+
+class ComprobantesReservaConcurrenciaTests(ComprobanteReservaMixin, TransactionTestCase):
+    def test_el_comando_no_sube_lo_que_el_hilo_tiene_tomado(self):
+        reserva = self.reserva_con_comprobante()
+        BackendPrueba.en_subida, BackendPrueba.seguir = threading.Event(), threading.Event()
+        hilo = threading.Thread(target=comprobantes._subir_en_hilo, args=(reserva.pk,))
+        hilo.start()
+        try:
+            self.assertTrue(BackendPrueba.en_subida.wait(10))
+            salida = io.StringIO()
+            call_command("reintentar_comprobantes", stdout=salida)
+            self.assertIn("0 subidos, 0 para reintentar, 0 fallidos", salida.getvalue())
+        finally:
+            BackendPrueba.seguir.set()
+            hilo.join()
+        reserva.refresh_from_db()
+        self.assertEqual((reserva.comprobante_estado, reserva.comprobante_intentos), ("subido", 1))
+        self.assertEqual(len(BackendPrueba.subidas), 1)
+
+
+# =============== Series de reservas ===============
+
+class SeriesTests(TestCase):
+    def setUp(self):
+        self.area = crear_area(max_dias_adelante=5000, dias_habiles="0,1,2,3,4")
+        self.usuario = crear_copropietario()
+
+    def serie(self, inicio, fin, **extra):
+        datos = {"frecuencia": "semanal", "hora_inicio": time(18), "hora_fin": time(20), **extra}
+        return SerieReserva(usuario=self.usuario, area_comun=self.area, fecha_inicio=inicio, fecha_fin=fin, **datos)
+
+    def activas(self, serie):
+        return list(serie.reservas.filter(estado__in=Reserva.ACTIVAS).order_by("fecha").values_list("fecha", flat=True))
+
+    def test_semanal_cada_dos_semanas(self):
+        serie = self.serie(LUNES, date(2030, 2, 6), intervalo=2, dias_semana="0,2")
+        self.assertEqual(series.fechas(serie, date(2030, 12, 31)),
+                         [LUNES, date(2030, 1, 9), date(2030, 1, 21), date(2030, 1, 23), date(2030, 2, 4),
+                          date(2030, 2, 6)])
+        # las semanas se cuentan desde el lunes de fecha_inicio, aunque empiece un miércoles
+        serie.fecha_inicio = date(2030, 1, 9)
+        self.assertEqual(series.fechas(serie, date(2030, 1, 31))[:3],
+                         [date(2030, 1, 9), date(2030, 1, 21), date(2030, 1, 23)])
+        # sin días: el de fecha_inicio; `hasta` recorta
+        serie = self.serie(LUNES, date(2030, 12, 31), intervalo=3)
+        self.assertEqual(series.fechas(serie, date(2030, 2, 20)), [LUNES, date(2030, 1, 28), date(2030, 2, 18)])
+
+    def test_mensual_salta_los_meses_sin_el_dia(self):
+        serie = self.serie(date(2030, 1, 31), date(2030, 8, 31), frecuencia="mensual")
+        self.assertEqual(series.fechas(serie, date(2030, 12, 31)),
+                         [date(2030, 1, 31), date(2030, 3, 31), date(2030, 5, 31), date(2030, 7, 31),
+                          date(2030, 8, 31)])
+        serie.intervalo = 3
+        self.assertEqual(series.fechas(serie, date(2030, 12, 31)), [date(2030, 1, 31), date(2030, 7, 31)])
+
+    def test_informa_conflictos_y_crea_las_libres(self):
+        crear_reserva(self.area, crear_copropietario("b202"), date(2030, 1, 9), time(19), time(21))
+        serie = self.serie(LUNES, date(2030, 1, 12), dias_semana="0,2,4,5")
+        with self.captureOnCommitCallbacks(execute=True):
+            creadas, conflictos = series.crear_serie(serie)
+        self.assertEqual([r.fecha for r in creadas], [LUNES, date(2030, 1, 11)])
+        self.assertEqual([(c["fecha"], c["motivo"]) for c in conflictos], [
+            ("2030-01-09", "Ya existe una reserva en ese horario."),
+            ("2030-01-12", "Día no hábil para el área."),
+        ])
+        # ninguna fecha libre: no se guarda la serie
+        otra = self.serie(date(2030, 1, 9), date(2030, 1, 9))
+        with self.assertRaises(series.SerieSinFechas) as ctx:
+            series.crear_serie(otra)
+        self.assertEqual([c["fecha"] for c in ctx.exception.conflictos], ["2030-01-09"])
+        self.assertEqual(SerieReserva.objects.count(), 1)
+
+    def test_cancelar_desde_una_fecha(self):
+        self.area.apertura_hora, self.area.cierre_hora = time(0), time(0)
+        self.area.save()
+        serie = self.serie(LUNES, date(2030, 1, 25), dias_semana="0,2,4", hora_inicio=time(0), hora_fin=time(2))
+        series.crear_serie(serie)
+        self.assertEqual(len(self.activas(serie)), 9)
+        # la del 16 empieza justo en `desde` (medianoche): también se cancela
+        desde = timezone.make_aware(datetime.combine(date(2030, 1, 16), time.min))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(series.cancelar_serie(serie, desde=desde), 5)
+        self.assertEqual(self.activas(serie), [LUNES, date(2030, 1, 9), date(2030, 1, 11), date(2030, 1, 14)])
+        serie.refresh_from_db()
+        self.assertEqual((serie.estado, serie.fecha_fin), ("activa", date(2030, 1, 15)))
+        self.assertEqual(series.cancelar_serie(serie), 4)
+        serie.refresh_from_db()
+        self.assertEqual(serie.estado, "cancelada")
@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AreaComunViewSet, ReservaViewSet, mostrarVisitas, marcarEntradaVisita, marcarSalidaVisita
+from .views import AreaComunViewSet, ReservaViewSet, SerieReservaViewSet, mostrarVisitas, marcarEntradaVisita, marcarSalidaVisita
 
 router = DefaultRouter()
 router.register(r'areas', AreaComunViewSet, basename='areas')
 router.register(r'reservas', ReservaViewSet, basename='reservas')
+router.register(r'series', SerieReservaViewSet, basename='series')
 
 urlpatterns = [
     # Visitas (guardia)
@@ -6,18 +6,23 @@ from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 
-from .models import AreaComun, Reserva, AutorizacionVisita, RegistroVisitaModel
+from .disponibilidad import MAX_DIAS as MAX_DIAS_CALENDARIO, calendario as armar_calendario
+from .models import AreaComun, Reserva, SerieReserva, AutorizacionVisita, RegistroVisitaModel
+from . import series
 from .serializers import (
-    AreaComunSerializer, ReservaSerializer,
+    AreaComunSerializer, ReservaSerializer, SerieReservaSerializer,
     MarcarEntradaSerializer, MarcarSalidaSerializer,
     ListaVisitantesSerializer
 )
-from .permissions import AdminOrStaffReadOnly, CopropietarioOrAdmin, IsAdmin
-from users.models import CopropietarioModel, GuardiaModel, PersonaModel
+from .permissions import AdminOrStaffReadOnly, CopropietarioOrAdmin
+from users.models import GuardiaModel, PersonaModel
+from users.propiedad import contexto_propiedad
+from condominio.idempotencia import idempotente
+from condominio.pagination import EnvelopePaginationMixin, EnvelopeCursorPagination
 
 # ---------- helpers envelope ----------
-def ok(message="OK", values=None, code=status.HTTP_200_OK):
-    return Response({"status":1,"error":0,"message":message,"values":values}, status=code)
+def ok(message="OK", values=None, code=status.HTTP_200_OK, **extra):
+    return Response({"status":1,"error":0,"message":message,"values":values, **extra}, status=code)
 
 def fail(message="Error", values=None, code=status.HTTP_400_BAD_REQUEST):
     return Response({"status":2,"error":1,"message":message,"values":values}, status=code)
@@ -27,13 +32,17 @@ def fail(message="Error", values=None, code=status.HTTP_400_BAD_REQUEST):
 
 @api_view(['GET'])
 def mostrarVisitas(request):
-    visitas = AutorizacionVisita.objects.all().order_by('-hora_inicio')
-    data = ListaVisitantesSerializer(visitas, many=True).data
+    visitas = AutorizacionVisita.objects.select_related('visitante', 'copropietario__idUsuario')
+    paginator = EnvelopeCursorPagination()
+    paginator.ordering = ('-hora_inicio', '-id')
+    page = paginator.paginate_queryset(visitas, request)
+    data = ListaVisitantesSerializer(page, many=True).data
     return Response({
         "status": 1,
         "error": 0,
         "message": "Visitas listadas correctamente",
-        "data": data
+        "data": data,
+        **paginator.enlaces(),
     })
 
 @api_view(['PATCH'])
@@ -59,7 +68,38 @@ def marcarSalidaVisita(request):
 
 # ===================== AREAS =====================
 
+def _fecha_param(request, nombre, defecto=None):
+    valor = request.query_params.get(nombre)
+    if not valor:
+        if defecto is None:
+            raise ValueError(f"Debe enviar ?{nombre}=YYYY-MM-DD")
+        return defecto
+    try:
+        return datetime.strptime(valor, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Formato de '{nombre}' inválido, use YYYY-MM-DD")
+
+def _rango_calendario(request):
+    """(desde, hasta) de ?desde=&hasta=; por defecto desde hoy, 30 días."""
+    desde = _fecha_param(request, "desde", timezone.localdate())
+    hasta = _fecha_param(request, "hasta", desde + timedelta(days=29))
+    if hasta < desde:
+        raise ValueError("'hasta' debe ser igual o posterior a 'desde'")
+    if (hasta - desde).days >= MAX_DIAS_CALENDARIO:
+        raise ValueError(f"El rango no puede superar {MAX_DIAS_CALENDARIO} días")
+    return desde, hasta
+
+
 class AreaComunViewSet(viewsets.ModelViewSet):
+    """
+    CRUD de áreas comunes. Leen todos los roles autenticados (sin sesión: 401);
+    escribe solo el Administrador.
+    - Todas las respuestas van en el sobre {status, error, message, values};
+      el listado trae el arreglo de áreas en `values`.
+    - DELETE no borra la fila: deja el área en estado 'inactivo' y conserva sus
+      reservas e historial. Un área inactiva sigue en el listado y no acepta
+      consultas de disponibilidad.
+    """
     queryset = AreaComun.objects.all().order_by('nombre_area')
     serializer_class = AreaComunSerializer
     permission_classes = [permissions.IsAuthenticated, AdminOrStaffReadOnly]
@@ -116,71 +156,64 @@ class AreaComunViewSet(viewsets.ModelViewSet):
         if area.estado != 'activo':
             return fail("El área no está activa")
 
-        if not area.dia_habil(fecha):
+        dia = armar_calendario([area], fecha, fecha)[0]["dias"][0]
+        if not dia["habil"]:
             return ok("Día no habilitado para el área", {"ocupados": [], "libres": []})
 
-        tz = timezone.get_current_timezone()
-        apertura = timezone.make_aware(datetime.combine(fecha, area.apertura_hora), tz)
-        cierre   = timezone.make_aware(datetime.combine(fecha, area.cierre_hora), tz)
-
-        reservas = (Reserva.objects
-                    .filter(area_comun=area, fecha=fecha, estado__in=['pendiente','confirmada'])
-                    .order_by('hora_inicio'))
-
-        ocupados = []
-        libres = []
-
-        current = apertura
-        for r in reservas:
-            ini = timezone.make_aware(datetime.combine(r.fecha, r.hora_inicio), tz)
-            fin = timezone.make_aware(datetime.combine(r.fecha, r.hora_fin), tz)
-
-            # hueco libre antes
-            if ini > current:
-                libres.append({"hora_inicio": current.strftime("%H:%M"), "hora_fin": ini.strftime("%H:%M")})
-            # bloque ocupado
-            ocupados.append({"hora_inicio": ini.strftime("%H:%M"), "hora_fin": fin.strftime("%H:%M")})
-            if fin > current:
-                current = fin
-
-        if current < cierre:
-            libres.append({"hora_inicio": current.strftime("%H:%M"), "hora_fin": cierre.strftime("%H:%M")})
-
-        return ok("Disponibilidad del área", {"area": area.nombre_area, "fecha": fecha_str, "ocupados": ocupados, "libres": libres})
-
-class AreaComunViewSet(viewsets.ModelViewSet):
-    queryset = AreaComun.objects.all()
-    serializer_class = AreaComunSerializer
+        return ok("Disponibilidad del área", {"area": area.nombre_area, "fecha": fecha_str,
+                                              "ocupados": dia["ocupados"], "libres": dia["libres"]})
 
-    def get_permissions(self):
-        if self.action in ["create", "update", "partial_update", "destroy"]:
-            return [IsAdmin()]
-        # list/retrieve: lectura
-        return [permissions.IsAuthenticatedOrReadOnly()]
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def calendario(self, request, pk=None):
+        """
+        GET /areacomun/areas/{id}/calendario/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+        Bloques libres y ocupados de cada día del rango (máx. 62 días; por defecto
+        30 desde hoy), en una sola consulta de reservas.
+        """
+        area = self.get_object()
+        try:
+            desde, hasta = _rango_calendario(request)
+        except ValueError as e:
+            return fail(str(e))
+        if area.estado != 'activo':
+            return fail("El área no está activa")
+        return ok("Calendario del área", armar_calendario([area], desde, hasta)[0])
 
+    @action(detail=False, methods=['get'], url_path='calendario', permission_classes=[permissions.IsAuthenticated])
+    def calendario_areas(self, request):
+        """
+        GET /areacomun/areas/calendario/?desde=YYYY-MM-DD&hasta=YYYY-MM-DD
+        Lo mismo que /areas/{id}/calendario/ para todas las áreas activas a la vez.
+        """
+        try:
+            desde, hasta = _rango_calendario(request)
+        except ValueError as e:
+            return fail(str(e))
+        areas = AreaComun.objects.filter(estado='activo').order_by('nombre_area')
+        return ok("Calendario de áreas", armar_calendario(areas, desde, hasta))
 
 # ===================== RESERVAS =====================
 
-class ReservaViewSet(viewsets.ModelViewSet):
+class ReservaViewSet(EnvelopePaginationMixin, viewsets.ModelViewSet):
     queryset = Reserva.objects.select_related('area_comun','usuario__idUsuario').all().order_by('-creada_en')
     serializer_class = ReservaSerializer
     permission_classes = [permissions.IsAuthenticated, CopropietarioOrAdmin]
     parser_classes = [MultiPartParser, FormParser]  # por si luego anexas comprobante archivo
+    ordering = ('-creada_en',)
 
     def get_queryset(self):
         qs = super().get_queryset()
-        # Copropietario: solo sus reservas
-        try:
-            coprop = CopropietarioModel.objects.get(idUsuario=self.request.user)
-            return qs.filter(usuario=coprop)
-        except CopropietarioModel.DoesNotExist:
-            # Admin/Guardia/Empleado ven todo
-            return qs
+        # Copropietario: solo sus reservas (la PK del copropietario es la del usuario)
+        if contexto_propiedad(self.request).es_copropietario:
+            return qs.filter(usuario_id=self.request.user.pk)
+        # Admin/Guardia/Empleado ven todo
+        return qs
 
     def list(self, request, *args, **kwargs):
-        ser = self.get_serializer(self.get_queryset(), many=True)
-        return ok("Reservas listadas correctamente", ser.data)
+        data, enlaces = self.paginar(self.filter_queryset(self.get_queryset()))
+        return ok("Reservas listadas correctamente", data, **enlaces)
 
+    @idempotente
     def create(self, request, *args, **kwargs):
         ser = self.get_serializer(data=request.data)
         if ser.is_valid():
@@ -204,11 +237,9 @@ class ReservaViewSet(viewsets.ModelViewSet):
         # permiso: si es coprop, debe ser suya
         role = getattr(getattr(request.user, 'idRol', None), 'name', '')
         if role == 'Copropietario':
-            try:
-                cop = CopropietarioModel.objects.get(idUsuario=request.user)
-            except CopropietarioModel.DoesNotExist:
+            if not contexto_propiedad(request).es_copropietario:
                 return fail("No eres copropietario")
-            if reserva.usuario_id != cop.id:
+            if reserva.usuario_id != request.user.pk:
                 return fail("No puedes cancelar reservas de otro usuario", code=status.HTTP_403_FORBIDDEN)
 
         if reserva.estado == 'cancelada':
@@ -220,3 +251,67 @@ class ReservaViewSet(viewsets.ModelViewSet):
 
         ser = self.get_serializer(reserva)
         return ok("Reserva cancelada correctamente", ser.data)
+
+
+# ===================== SERIES DE RESERVAS =====================
+
+class SerieReservaViewSet(EnvelopePaginationMixin, viewsets.ModelViewSet):
+    """
+    Reservas que se repiten (semanal o mensual hasta fecha_fin). Crear la serie
+    reserva de una vez las fechas libres dentro de max_dias_adelante del área y
+    devuelve las que chocan; las siguientes las agrega `extender_series`.
+    """
+    queryset = (SerieReserva.objects.select_related('area_comun', 'usuario__idUsuario')
+                .prefetch_related('reservas').order_by('-creada_en'))
+    serializer_class = SerieReservaSerializer
+    permission_classes = [permissions.IsAuthenticated, CopropietarioOrAdmin]
+    http_method_names = ['get', 'post', 'head', 'options']  # se modifica cancelando
+    ordering = ('-creada_en',)
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if contexto_propiedad(self.request).es_copropietario:
+            return qs.filter(usuario_id=self.request.user.pk)
+        return qs
+
+    def list(self, request, *args, **kwargs):
+        data, enlaces = self.paginar(self.filter_queryset(self.get_queryset()))
+        return ok("Series listadas correctamente", data, **enlaces)
+
+    @idempotente
+    def create(self, request, *args, **kwargs):
+        if not contexto_propiedad(request).es_copropietario:
+            return fail("El usuario logueado no es un copropietario.")
+        ser = self.get_serializer(data=request.data)
+        if not ser.is_valid():
+            return fail("Datos inválidos para crear la serie", ser.errors)
+        serie = SerieReserva(usuario_id=request.user.pk, **ser.validated_data)
+        try:
+            creadas, conflictos = series.crear_serie(serie)
+        except series.SerieSinFechas as e:
+            return fail(str(e), {"conflictos": e.conflictos}, code=status.HTTP_409_CONFLICT)
+        serie = self.get_queryset().get(pk=serie.pk)
+        return ok(f"Serie creada: {len(creadas)} reservas, {len(conflictos)} fechas en conflicto",
+                  {"serie": self.get_serializer(serie).data, "conflictos": conflictos,
+                   "reservado_hasta": min(serie.fecha_fin, series.limite(serie.area_comun)).isoformat()},
+                  code=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def cancelar(self, request, pk=None):
+        """
+        POST /areacomun/series/{id}/cancelar/  {desde?: YYYY-MM-DD, motivo?}
+        Cancela en una sola sentencia las reservas de la serie que aún no empezaron
+        (o las que empiezan desde `desde`, y la serie termina el día anterior).
+        """
+        serie = self.get_object()
+        if serie.estado == 'cancelada':
+            return fail("La serie ya está cancelada")
+        desde = None
+        if request.data.get('desde'):
+            try:
+                fecha = datetime.strptime(request.data['desde'], "%Y-%m-%d").date()
+            except ValueError:
+                return fail("Formato de 'desde' inválido, use YYYY-MM-DD")
+            desde = timezone.make_aware(datetime.combine(fecha, datetime.min.time()))
+        n = series.cancelar_serie(serie, desde=desde, motivo=request.data.get('motivo', ''))
+        return ok(f"{n} reservas de la serie canceladas", self.get_serializer(self.get_queryset().get(pk=serie.pk)).data)
@@ -5,8 +5,9 @@ from rest_framework.decorators import action
 from .models import Comunicado
 from .serializers import ComunicadoSerializer, ListarComunicadoSerializer
 from .permissions import IsAdmin
+from condominio.pagination import EnvelopePaginationMixin
 
-class ComunicadoViewSet(viewsets.ModelViewSet):
+class ComunicadoViewSet(EnvelopePaginationMixin, viewsets.ModelViewSet):
     """
     - List (GET): todos los roles autenticados ven comunicados activos (por defecto).
                   ?todos=1 para ver también inactivos (solo admin).
@@ -18,6 +19,7 @@ class ComunicadoViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ["titulo", "descripcion", "tipo"]
     ordering_fields = ["fecha_publicacion", "fecha_vencimiento", "id"]
+    ordering = ("-fecha_publicacion", "-id")
 
     def get_permissions(self):
         if self.action in ["create", "update", "partial_update", "destroy", "activar", "archivar"]:
@@ -40,6 +42,10 @@ class ComunicadoViewSet(viewsets.ModelViewSet):
         # Por defecto, solo activos
         return qs.filter(activo=True)
 
+    def list(self, request, *args, **kwargs):
+        data, enlaces = self.paginar(self.filter_queryset(self.get_queryset()))
+        return Response({"status": 1, "error": 0, "message": "Comunicados listados correctamente", "values": data, **enlaces})
+
     def create(self, request, *args, **kwargs):
         ser = self.get_serializer(data=request.data)
         ser.is_valid(raise_exception=True)
@@ -0,0 +1,130 @@
+"""
+Cabecera Idempotency-Key para escrituras que los clientes reintentan.
+
+    @idempotente
+    def create(self, request, *args, **kwargs): ...
+
+La primera petición con una clave la reserva (fila "en curso") junto con la
+huella de su cuerpo y ejecuta el handler; si responde < 500 se guarda el status
+y el cuerpo de la respuesta en la misma transacción que lo escrito por el
+handler. Un reintento con la misma clave (mismo usuario, método y ruta) y el
+mismo cuerpo recibe esa respuesta guardada sin ejecutar el handler; con otro
+cuerpo recibe 422. Si el primero todavía está corriendo, el reintento recibe
+409. Un error 5xx o una excepción deshacen lo escrito y liberan la clave para
+poder reintentar.
+
+La huella del cuerpo de un multipart no relee la subida: combina los campos con
+el sha256 de cada archivo (el que calculó el upload handler de la vista, si lo
+hay). Las vistas que cambian los upload handlers deben hacerlo antes de que
+corra el decorador (en initial()).
+
+El decorador va sobre el método del APIView/ViewSet: cuando corre, DRF ya
+autenticó y verificó permisos.
+"""
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from functools import wraps
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from users.models import ClaveIdempotencia
+
+CABECERA = "Idempotency-Key"
+TTL = timedelta(hours=24)
+# Una reserva "en curso" huérfana (proceso caído) se libera sola pasado este plazo
+TTL_EN_CURSO = timedelta(minutes=5)
+MAX_LARGO = 255
+
+
+def _fail(message, code):
+    return Response({"status": 2, "error": 1, "message": message, "values": None}, status=code)
+
+
+def _huella(request, clave) -> bytes:
+    texto = f"{request.user.pk}|{request.method}|{request.path}|{clave}"
+    return hashlib.sha256(texto.encode("utf-8")).digest()
+
+
+def _sha256_archivo(archivo) -> str:
+    sha = hashlib.sha256()
+    for bloque in archivo.chunks():
+        sha.update(bloque)
+    archivo.seek(0)
+    return sha.hexdigest()
+
+
+def _huella_cuerpo(request) -> bytes:
+    if not request.content_type.startswith("multipart/form-data"):
+        return hashlib.sha256(request.body).digest()
+    campos = []
+    for nombre, valores in sorted(request.data.lists()):
+        campos.append([nombre, [
+            {"sha256": getattr(v, "sha256", None) or _sha256_archivo(v)} if hasattr(v, "chunks") else v
+            for v in valores
+        ]])
+    return hashlib.sha256(json.dumps(campos, cls=JSONEncoder).encode("utf-8")).digest()
+
+
+def _reservar(huella, huella_cuerpo):
+    """(fila, creada): creada=True si esta petición tomó la clave."""
+    ahora = timezone.now()
+    with transaction.atomic():
+        ClaveIdempotencia.objects.filter(huella=huella, expira_en__lte=ahora).delete()
+        return ClaveIdempotencia.objects.get_or_create(
+            huella=huella, defaults={"huella_cuerpo": huella_cuerpo, "expira_en": ahora + TTL_EN_CURSO})
+
+
+def _repetir(fila):
+    datos = json.loads(zlib.decompress(bytes(fila.respuesta))) if fila.respuesta else None
+    resp = Response(datos, status=fila.status_code)
+    resp["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def idempotente(metodo):
+    @wraps(metodo)
+    def envoltura(self, request, *args, **kwargs):
+        clave = request.headers.get(CABECERA, "").strip()
+        if not clave:
+            return metodo(self, request, *args, **kwargs)
+        if len(clave) > MAX_LARGO:
+            return _fail(f"La cabecera {CABECERA} no puede superar {MAX_LARGO} caracteres.",
+                         status.HTTP_400_BAD_REQUEST)
+
+        huella_cuerpo = _huella_cuerpo(request)
+        fila, creada = _reservar(_huella(request, clave), huella_cuerpo)
+        if not creada:
+            # las filas anteriores a huella_cuerpo (NULL) no se comparan
+            if fila.huella_cuerpo is not None and bytes(fila.huella_cuerpo) != huella_cuerpo:
+                return _fail(f"La {CABECERA} ya se usó con otro cuerpo.", status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if fila.en_curso:
+                return _fail("Ya hay una solicitud en curso con esta Idempotency-Key.", status.HTTP_409_CONFLICT)
+            return _repetir(fila)
+
+        try:
+            # lo que escribe el handler y la respuesta guardada se confirman juntos
+            with transaction.atomic():
+                respuesta = metodo(self, request, *args, **kwargs)
+                if respuesta.status_code < 500 and hasattr(respuesta, "data"):
+                    cuerpo = json.dumps(respuesta.data, cls=JSONEncoder, ensure_ascii=False).encode("utf-8")
+                    ClaveIdempotencia.objects.filter(pk=fila.pk).update(
+                        en_curso=False,
+                        status_code=respuesta.status_code,
+                        respuesta=zlib.compress(cuerpo),
+                        expira_en=timezone.now() + TTL,
+                    )
+                    return respuesta
+                # 5xx: el reintento tiene que poder correr de nuevo desde cero
+                transaction.set_rollback(True)
+        except Exception:
+            ClaveIdempotencia.objects.filter(pk=fila.pk).delete()
+            raise
+        ClaveIdempotencia.objects.filter(pk=fila.pk).delete()
+        return respuesta
+    return envoltura
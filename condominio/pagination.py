@@ -0,0 +1,183 @@
+"""
+Paginación común de los listados.
+
+Por defecto se usa cursor (keyset) sobre el orden natural de cada vista
+(atributo `ordering` de la vista), así el costo de pedir la página N no crece
+con N y los cursores no se corren si se insertan filas mientras se pagina.
+Las tablas de administración pueden aceptar además ?offset=&limit= declarando
+`offset_pagination_class = EnvelopeOffsetPagination`.
+
+El cursor lleva la clave completa de la última fila: los valores de todos los
+campos del orden, más la pk si el orden no la incluye (desempate, la clave
+queda única). La página siguiente se filtra con la comparación de filas
+expandida (a < x OR (a = x AND b > y) ...), que respeta el sentido de cada
+campo; no hay desplazamiento (offset) dentro de los empates, así que un
+periodo o un bloque con miles de filas se recorre entero. Los campos del orden
+no pueden ser nulos.
+
+En modo cursor el orden es siempre el de la vista: ?ordering= (OrderingFilter)
+no cambia la clave, solo aplica en modo offset.
+
+El envelope {status, error, message, values} se mantiene: `values` es la lista
+de la página y se agregan las claves `next` / `previous` (y `count` en offset).
+"""
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class EnvelopeCursorPagination(BasePagination):
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+    cursor_query_param = "cursor"
+    ordering = ("-id",)
+    invalid_cursor_message = "Cursor inválido."
+
+    # =============== Orden y clave ===============
+
+    def get_ordering(self, request, queryset, view):
+        """[(campo, descendente)] del orden de la vista, terminado en la pk."""
+        orden = getattr(view, "ordering", None) or self.ordering
+        if isinstance(orden, str):
+            orden = (orden,)
+        campos = [(c.lstrip("-"), c.startswith("-")) for c in orden]
+        pk = queryset.model._meta.pk
+        if not any(c in ("pk", pk.name, pk.attname) for c, _ in campos):
+            campos.append(("pk", campos[-1][1] if campos else False))
+        return campos
+
+    def _campo_modelo(self, model, campo):
+        if campo == "pk":
+            return model._meta.pk
+        partes = campo.split("__")
+        for parte in partes[:-1]:
+            model = model._meta.get_field(parte).related_model
+        return model._meta.get_field(partes[-1])
+
+    @staticmethod
+    def _valor(obj, campo):
+        for parte in campo.split("__"):
+            obj = getattr(obj, parte)
+        return obj
+
+    def _filtro(self, valores, atras):
+        """Filas después de `valores` en el orden (antes, si `atras`)."""
+        condicion, iguales = Q(), {}
+        for i, ((campo, desc), valor) in enumerate(zip(self.campos, valores)):
+            op = "lt" if desc != atras else "gt"
+            tramo = Q(**iguales, **{f"{campo}__{op}": valor})
+            condicion = tramo if i == 0 else condicion | tramo
+            iguales[campo] = valor
+        # cota del primer campo aparte: el planner la usa como rango sobre el índice
+        campo, desc = self.campos[0]
+        return Q(**{f"{campo}__{'lte' if desc != atras else 'gte'}": valores[0]}) & condicion
+
+    # =============== Paginación ===============
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(request.query_params[self.page_size_query_param],
+                                     strict=True, cutoff=self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.tamano = self.get_page_size(request)
+        self.campos = self.get_ordering(request, queryset, view)
+        self.modelo = queryset.model
+
+        cursor = self.decode_cursor(request)
+        atras = bool(cursor and cursor[1])
+        orden = [("-" if desc != atras else "") + campo for campo, desc in self.campos]
+        if cursor:
+            queryset = queryset.filter(self._filtro(cursor[0], atras))
+        filas = list(queryset.order_by(*orden)[:self.tamano + 1])
+        hay_mas = len(filas) > self.tamano
+        filas = filas[:self.tamano]
+        if atras:
+            filas.reverse()
+            self.has_next, self.has_previous = bool(filas), hay_mas
+        else:
+            self.has_next, self.has_previous = hay_mas, bool(cursor and filas)
+        self.page = filas
+        return filas
+
+    def decode_cursor(self, request):
+        """(valores, atras) del ?cursor=, o None en la primera página."""
+        codificado = request.query_params.get(self.cursor_query_param)
+        if not codificado:
+            return None
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(codificado.encode("ascii")).decode("utf-8"))
+            crudos = datos["k"]
+            if len(crudos) != len(self.campos):
+                raise ValueError
+            valores = [self._campo_modelo(self.modelo, campo).to_python(v)
+                       for (campo, _), v in zip(self.campos, crudos)]
+            return valores, bool(datos.get("r"))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj, atras):
+        clave = [self._valor(obj, campo) for campo, _ in self.campos]
+        datos = json.dumps({"k": clave, "r": int(atras)}, cls=DjangoJSONEncoder, separators=(",", ":"))
+        codificado = base64.urlsafe_b64encode(datos.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, codificado)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], atras=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], atras=True)
+
+    def get_paginated_response(self, data):
+        return Response({**self.enlaces(), "results": data})
+
+    def enlaces(self):
+        return {"next": self.get_next_link(), "previous": self.get_previous_link()}
+
+
+class EnvelopeOffsetPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 500
+
+    def enlaces(self):
+        return {"next": self.get_next_link(), "previous": self.get_previous_link(), "count": self.count}
+
+
+class EnvelopePaginationMixin:
+    pagination_class = EnvelopeCursorPagination
+    offset_pagination_class = None
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            clase = self.pagination_class
+            if self.offset_pagination_class and "offset" in self.request.query_params:
+                clase = self.offset_pagination_class
+            self._paginator = clase() if clase else None
+        return self._paginator
+
+    def paginar(self, queryset):
+        """Serializa la página pedida. Devuelve (data, enlaces) para armar el envelope."""
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return self.get_serializer(queryset, many=True).data, {}
+        return self.get_serializer(page, many=True).data, self.paginator.enlaces()
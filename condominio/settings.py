@@ -104,7 +104,7 @@ DATABASES = {
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.RolJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -119,8 +119,27 @@ from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),  # token de acceso
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),    # token de refresco
+    # Todos los endpoints de login emiten tokens con rol/unidades (users.authentication)
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.MyTokenObtainPairSerializer',
 }
 
+# Caché
+# LocMem es por proceso: con varios workers usa una caché compartida (Redis/Memcached)
+# para que las invalidaciones (claims del token, etc.) lleguen a todos los procesos.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'condominio-default',
+    }
+}
+# Alias de CACHES para la disponibilidad de áreas comunes (area_comun.disponibilidad).
+# Con varios workers tiene que ser compartida, o un worker seguiría viendo libre un horario ya reservado.
+DISPONIBILIDAD_CACHE = 'default'
+
+# Dónde se publican los comprobantes de reservas (area_comun.comprobantes):
+# ImgbbBackend (IMGBB_API_KEY) o LocalBackend (MEDIA_ROOT, para desarrollo y pruebas)
+RESERVA_COMPROBANTE_BACKEND = 'area_comun.comprobantes.ImgbbBackend'
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
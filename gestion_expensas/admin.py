@@ -1,31 +1,125 @@
 from django.contrib import admin
-from .models import Tarifa, Expensa, Pago
+from django.db import transaction
+
+from .comprobantes import encolar, guardar_comprobante
+from .cuenta import registrar_cambio_expensa
+from .models import (Tarifa, Expensa, Pago, AsignacionPago, ResumenCobranza, PoliticaRecargo, Recargo,
+                     CuentaUnidad, MovimientoCuenta)
+from .recargos import revertir_recargos
+from .resumen import cambios_resumen
+from .services import cambiar_estado_pagos, anular_expensas
 
 @admin.register(Tarifa)
 class TarifaAdmin(admin.ModelAdmin):
-    list_display = ("id","nombre","monto_bs","vigente_desde","activa")
-    list_filter = ("activa",)
+    list_display = ("id","nombre","tipo_unidad","monto_bs","monto_m2","vigente_desde","activa")
+    list_filter = ("activa","tipo_unidad")
 
 @admin.register(Expensa)
 class ExpensaAdmin(admin.ModelAdmin):
     list_display = ("id","unidad","periodo","monto_total","saldo","estado")
     list_filter = ("estado","periodo")
     search_fields = ("unidad__codigo",)
+    actions = ["anular"]
+    def save_model(self, request, obj, form, change):
+        # Ediciones manuales también pasan por el resumen de cobranza
+        with transaction.atomic():
+            antes = None
+            if change:
+                antes = (Expensa.objects.select_for_update().filter(pk=obj.pk)
+                         .values_list("monto_total", "estado").first())
+            with cambios_resumen([obj.pk] if change else []) as tocadas:
+                super().save_model(request, obj, form, change)
+                if not change:
+                    tocadas.append(obj.pk)
+            registrar_cambio_expensa(obj, antes)
+    def anular(self, request, queryset):
+        ids = anular_expensas(queryset.values_list("pk", flat=True))
+        self.message_user(request, f"{len(ids)} expensas anuladas.")
+
+class AsignacionPagoInline(admin.TabularInline):
+    # Las mantiene el reparto al aprobar/rechazar: solo lectura
+    model = AsignacionPago
+    extra = 0
+    can_delete = False
+    readonly_fields = ("expensa","monto","created_at")
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(Pago)
 class PagoAdmin(admin.ModelAdmin):
-    list_display = ("id","expensa","usuario","monto_bs","estado","created_at")
-    list_filter = ("estado","metodo")
+    list_display = ("id","expensa","usuario","monto_bs","distribuir","estado","comprobante_repetido","created_at")
+    list_filter = ("estado","metodo","distribuir","comprobante_repetido")
+    readonly_fields = ("comprobante_sha256","comprobante_miniatura","comprobante_repetido","revisor","revision_hasta")
+    inlines = [AsignacionPagoInline]
     actions = ["aprobar_pagos","rechazar_pagos"]
+    def save_model(self, request, obj, form, change):
+        # Un comprobante subido desde el admin también se guarda por contenido
+        if "comprobante" in form.changed_data:
+            if obj.comprobante and not obj.comprobante._committed:
+                for campo, valor in guardar_comprobante(obj.comprobante.file).items():
+                    setattr(obj, campo, valor)
+            else:
+                obj.comprobante_sha256, obj.comprobante_miniatura, obj.comprobante_repetido = "", None, False
+        super().save_model(request, obj, form, change)
+        if obj.comprobante_sha256 and not obj.comprobante_miniatura:
+            encolar(obj.comprobante_sha256)
     def aprobar_pagos(self, request, queryset):
-        n=0
-        for p in queryset:
-            if p.estado != "APROBADO":
-                p.estado = "APROBADO"; p.save(update_fields=["estado"]); n+=1
+        res = cambiar_estado_pagos(queryset.values_list("pk", flat=True), "APROBADO")
+        n = sum(1 for r in res if r["cambiado"])
         self.message_user(request, f"{n} pagos aprobados.")
     def rechazar_pagos(self, request, queryset):
-        n=0
-        for p in queryset:
-            if p.estado != "RECHAZADO":
-                p.estado = "RECHAZADO"; p.save(update_fields=["estado"]); n+=1
+        res = cambiar_estado_pagos(queryset.values_list("pk", flat=True), "RECHAZADO")
+        n = sum(1 for r in res if r["cambiado"])
         self.message_user(request, f"{n} pagos rechazados.")
+
+@admin.register(ResumenCobranza)
+class ResumenCobranzaAdmin(admin.ModelAdmin):
+    list_display = ("periodo","bloque","facturado","cobrado","saldo","n_pendiente","n_parcial","n_pagada","n_anulada")
+    list_filter = ("bloque",)
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(PoliticaRecargo)
+class PoliticaRecargoAdmin(admin.ModelAdmin):
+    list_display = ("id","nombre","monto_fijo","porcentaje_mensual","tope_bs","dias_gracia","vigente_desde","activa")
+    list_filter = ("activa",)
+
+@admin.register(Recargo)
+class RecargoAdmin(admin.ModelAdmin):
+    list_display = ("id","expensa","fecha_corte","saldo_base","dias","monto","revertido","created_at")
+    list_filter = ("revertido","fecha_corte")
+    readonly_fields = ("expensa","politica","fecha_corte","saldo_base","dias","monto","revertido","revertido_en","created_at")
+    actions = ["revertir"]
+    def has_add_permission(self, request):
+        return False
+    def has_delete_permission(self, request, obj=None):
+        return False  # se revierten, no se borran (quedan para auditoría)
+    def revertir(self, request, queryset):
+        res = revertir_recargos(recargo_ids=queryset.values_list("pk", flat=True))
+        self.message_user(request, f"{res['recargos']} recargos revertidos.")
+
+@admin.register(CuentaUnidad)
+class CuentaUnidadAdmin(admin.ModelAdmin):
+    list_display = ("unidad","saldo","updated_at")
+    search_fields = ("unidad__codigo",)
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(MovimientoCuenta)
+class MovimientoCuentaAdmin(admin.ModelAdmin):
+    # Libro de solo inserción: se corrige con reversos, nunca editando filas
+    list_display = ("id","unidad","fecha","tipo","monto","saldo","glosa")
+    list_filter = ("tipo",)
+    search_fields = ("unidad__codigo",)
+    def has_add_permission(self, request):
+        return False
+    def has_change_permission(self, request, obj=None):
+        return False
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,88 @@
+"""
+Cola de revisión de pagos PENDIENTES para varios administradores a la vez.
+
+Cada revisor pide un lote y recibe los pagos pendientes más antiguos que nadie
+tiene reservados, ya reservados a su nombre por unos minutos. Primero se
+renuevan todas sus reservas vigentes (un UPDATE) y cuentan para el lote; el
+resto del lote sale de una sola sentencia:
+
+    SELECT ... WHERE estado = 'PENDIENTE' AND reserva libre o vencida
+    ORDER BY created_at, id LIMIT n
+    FOR UPDATE SKIP LOCKED
+
+seguida del UPDATE que graba revisor y `revision_hasta`. SKIP LOCKED hace que
+dos revisores que piden a la vez se salteen las filas que el otro está tomando
+en vez de esperarlo, así nunca reciben el mismo pago. El recorrido va por el
+índice parcial de pendientes (created_at, id) y solo pasa de largo las filas
+reservadas por otros.
+
+Una reserva vencida (revisor que cerró la pestaña) deja el pago otra vez libre
+sin que nada tenga que limpiarla. Pedir de nuevo renueva todas las reservas
+propias, aunque sean más nuevas que los pagos libres del lote.
+Aprobar o rechazar un pago reservado por otro revisor se rechaza
+(cambiar_estado_pagos con `revisor`).
+"""
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Pago
+
+LOTE = 20
+MAX_LOTE = 100
+MINUTOS = 10
+MAX_MINUTOS = 60
+
+_T_PAGO = Pago._meta.db_table
+
+
+def tomar_pagos(revisor, cantidad=LOTE, minutos=MINUTOS):
+    """
+    Reserva para `revisor` hasta `cantidad` pagos pendientes: sus reservas
+    vigentes se renuevan todas y cuentan primero; el resto, los libres más
+    antiguos. Devuelve (ids en orden de llegada, vencimiento).
+    """
+    ahora = timezone.now()
+    hasta = ahora + timedelta(minutes=minutos)
+    renovar = f"""
+        UPDATE {_T_PAGO} SET revision_hasta = %(hasta)s
+        WHERE estado = 'PENDIENTE' AND revisor_id = %(revisor)s AND revision_hasta > %(ahora)s
+        RETURNING id, created_at
+    """
+    tomar = f"""
+        WITH elegidos AS (
+            SELECT id FROM {_T_PAGO}
+            WHERE estado = 'PENDIENTE' AND (revision_hasta IS NULL OR revision_hasta <= %(ahora)s)
+            ORDER BY created_at, id
+            LIMIT %(cantidad)s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE {_T_PAGO} p SET revisor_id = %(revisor)s, revision_hasta = %(hasta)s
+        FROM elegidos e
+        WHERE p.id = e.id
+        RETURNING p.id, p.created_at
+    """
+    params = {"ahora": ahora, "hasta": hasta, "revisor": revisor.pk}
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(renovar, params)
+        filas = cur.fetchall()
+        if len(filas) < cantidad:
+            cur.execute(tomar, {**params, "cantidad": cantidad - len(filas)})
+            filas += cur.fetchall()
+    return [pid for pid, _ in sorted(filas, key=lambda f: (f[1], f[0]))], hasta
+
+
+def pagos_reservados(revisor):
+    """Pagos pendientes con reserva vigente de `revisor`, en orden de llegada."""
+    return (Pago.objects
+            .filter(estado="PENDIENTE", revisor=revisor, revision_hasta__gt=timezone.now())
+            .order_by("created_at", "id"))
+
+
+def liberar_pagos(revisor, pago_ids=None) -> int:
+    """Devuelve a la cola los pagos reservados por `revisor` (todos o los indicados)."""
+    qs = Pago.objects.filter(estado="PENDIENTE", revisor=revisor, revision_hasta__isnull=False)
+    if pago_ids is not None:
+        qs = qs.filter(pk__in=list(pago_ids))
+    return qs.update(revisor=None, revision_hasta=None)
@@ -0,0 +1,215 @@
+"""
+Comprobantes de pago guardados por contenido.
+
+La subida se escribe a disco por bloques (ComprobanteUploadHandler, el handler
+de archivos temporales de Django) y el sha256 se calcula sobre esos mismos
+bloques, sin releer el archivo. El archivo queda en
+
+    comprobantes/<h[:2]>/<sha256>_orig.<ext>
+
+y `Pago.comprobante_sha256` lo indexa: si el mismo archivo ya está en otro
+pago, no se escribe de nuevo (ambos pagos apuntan a la misma ruta) y el pago
+nuevo queda con `comprobante_repetido` para que el admin lo revise como posible
+pago duplicado.
+
+Después del commit, un hilo en segundo plano recodifica las imágenes con
+Pillow (JPEG, lado máximo MAX_LADO) y genera la miniatura que muestran los
+listados. Si el hilo falla o el proceso se reinicia, el comprobante queda
+pendiente (sin miniatura) y `manage.py procesar_comprobantes` lo retoma.
+PDF y otros formatos se guardan tal cual.
+
+Al recodificar, los pagos pasan a la ruta nueva y el original se borra. Para
+que un pago que se está creando con el mismo archivo no quede apuntando al
+original borrado, guardar_comprobante y el cambio de ruta toman el mismo
+candado por sha (pg_advisory_xact_lock) hasta el fin de su transacción: la
+ruta se resuelve y el pago se inserta sin que el procesamiento cambie de ruta
+en el medio, y el original solo se borra si ningún pago lo usa.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import connection, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Pago
+
+MAX_LADO = 1600
+MAX_LADO_MINIATURA = 320
+CALIDAD_JPEG = 80
+IMAGENES = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tif", ".tiff")
+
+log = logging.getLogger(__name__)
+_hilos = ThreadPoolExecutor(max_workers=2, thread_name_prefix="comprobantes")
+_en_curso = set()  # sha en proceso en este proceso (dos pagos con el mismo archivo)
+_candado = threading.Lock()
+
+
+class ComprobanteUploadHandler(TemporaryFileUploadHandler):
+    """Escribe la subida a un temporal por bloques y calcula su sha256 al vuelo."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self._sha = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self._sha.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        archivo = super().file_complete(file_size)
+        archivo.sha256 = self._sha.hexdigest()
+        return archivo
+
+
+def sha256_archivo(archivo) -> str:
+    # archivos que no pasaron por el handler (admin, comandos)
+    sha = hashlib.sha256()
+    for bloque in archivo.chunks():
+        sha.update(bloque)
+    archivo.seek(0)
+    return sha.hexdigest()
+
+
+def _ruta(sha, sufijo, ext) -> str:
+    return f"comprobantes/{sha[:2]}/{sha}{sufijo}{ext}"
+
+
+def _guardar(nombre, contenido) -> str:
+    # la ruta sale del contenido: si ya existe (p.ej. de un pago borrado), es el mismo archivo
+    if default_storage.exists(nombre):
+        return nombre
+    return default_storage.save(nombre, contenido)
+
+
+def _bloquear(sha):
+    """Candado por sha hasta el fin de la transacción en curso."""
+    with connection.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", [sha])
+
+
+def _borrar(nombres):
+    for nombre in nombres:
+        default_storage.delete(nombre)
+
+
+def _extension(nombre) -> str:
+    ext = os.path.splitext(nombre or "")[1].lower()
+    return ext if ext.isascii() and len(ext) <= 6 else ""
+
+
+def pendientes():
+    """Pagos con comprobante de imagen aún sin miniatura."""
+    sin_miniatura = Q(comprobante_miniatura="") | Q(comprobante_miniatura__isnull=True)
+    es_imagen = Q()
+    for ext in IMAGENES:
+        es_imagen |= Q(comprobante__iendswith=ext)
+    return Pago.objects.exclude(comprobante_sha256="").filter(sin_miniatura, es_imagen)
+
+
+# =============== Subida ===============
+
+def guardar_comprobante(archivo) -> dict:
+    """
+    Guarda `archivo` por su contenido (o reutiliza el ya guardado) y devuelve los
+    campos del Pago: comprobante, comprobante_sha256, comprobante_miniatura y
+    comprobante_repetido.
+
+    Llamar dentro de la transacción que guarda el pago: el candado del sha se
+    mantiene hasta el commit, así la ruta devuelta no se borra antes de que el
+    pago la use.
+    """
+    sha = getattr(archivo, "sha256", None) or sha256_archivo(archivo)
+    _bloquear(sha)
+    previo = (Pago.objects.filter(comprobante_sha256=sha).exclude(comprobante="")
+              .values_list("comprobante", "comprobante_miniatura").first())
+    if previo and default_storage.exists(previo[0]):
+        nombre, miniatura = previo[0], previo[1] or None
+    elif default_storage.exists(_ruta(sha, "", ".jpg")):
+        # ya recodificado (los pagos que lo usaban se borraron): la ruta canónica es la nueva
+        nombre = _ruta(sha, "", ".jpg")
+        miniatura = _ruta(sha, "_min", ".jpg") if default_storage.exists(_ruta(sha, "_min", ".jpg")) else None
+    else:
+        nombre = _guardar(_ruta(sha, "_orig", _extension(archivo.name)), archivo)
+        miniatura = None
+    return {
+        "comprobante": nombre,
+        "comprobante_sha256": sha,
+        "comprobante_miniatura": miniatura,
+        "comprobante_repetido": previo is not None,
+    }
+
+
+def encolar(sha):
+    """Procesa el comprobante en segundo plano cuando la transacción confirme."""
+    transaction.on_commit(lambda: _hilos.submit(_procesar_en_hilo, sha))
+
+
+def _procesar_en_hilo(sha):
+    with _candado:
+        if sha in _en_curso:
+            return
+        _en_curso.add(sha)
+    try:
+        procesar_comprobante(sha)
+    except Exception:
+        # queda pendiente: lo retoma procesar_comprobantes
+        log.exception("No se pudo procesar el comprobante %s", sha)
+    finally:
+        connection.close()  # la conexión es propia de este hilo
+        with _candado:
+            _en_curso.discard(sha)
+
+
+# =============== Compresión y miniatura ===============
+
+def _jpeg(imagen, lado) -> bytes:
+    copia = imagen.copy()
+    copia.thumbnail((lado, lado))
+    salida = BytesIO()
+    copia.save(salida, "JPEG", quality=CALIDAD_JPEG, optimize=True)
+    return salida.getvalue()
+
+
+def procesar_comprobante(sha) -> bool:
+    """
+    Recodifica el comprobante `sha` y genera su miniatura; actualiza todos los
+    pagos que lo comparten. Devuelve False si no hay nada que hacer o no es imagen.
+    """
+    nombres = set(Pago.objects.filter(comprobante_sha256=sha).exclude(comprobante="")
+                  .values_list("comprobante", flat=True))
+    if not nombres or not pendientes().filter(comprobante_sha256=sha).exists():
+        return False
+    original = min(nombres)
+    try:
+        with default_storage.open(original, "rb") as f:
+            imagen = Image.open(f)
+            imagen.draft("RGB", (MAX_LADO, MAX_LADO))  # JPEG: decodifica ya reducido
+            imagen = ImageOps.exif_transpose(imagen)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        return False
+    if imagen.mode not in ("RGB", "L"):
+        imagen = imagen.convert("RGB")
+
+    completo = _jpeg(imagen, MAX_LADO)
+    nuevo = original
+    if len(completo) < default_storage.size(original):
+        nuevo = _guardar(_ruta(sha, "", ".jpg"), ContentFile(completo))
+    miniatura = _guardar(_ruta(sha, "_min", ".jpg"), ContentFile(_jpeg(imagen, MAX_LADO_MINIATURA)))
+
+    with transaction.atomic():
+        # un pago nuevo con este sha no se inserta mientras tanto (guardar_comprobante espera el candado)
+        _bloquear(sha)
+        Pago.objects.filter(comprobante_sha256=sha).update(comprobante=nuevo, comprobante_miniatura=miniatura)
+        viejos = nombres - {nuevo}
+        en_uso = set(Pago.objects.filter(comprobante__in=viejos).values_list("comprobante", flat=True))
+        sobrantes = viejos - en_uso
+        transaction.on_commit(lambda: _borrar(sobrantes))
+    return True
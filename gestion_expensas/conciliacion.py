@@ -0,0 +1,190 @@
+"""
+Conciliación de extractos bancarios contra pagos pendientes.
+
+El CSV del banco (columnas fecha, monto, referencia; `descripcion` opcional) se
+lee fila a fila. Los pagos PENDIENTES del método indicado se cargan una vez en
+dos índices hash:
+  - (referencia normalizada, monto) -> pagos
+  - (monto, fecha)                  -> pagos   (para sugerir cuando no hay referencia)
+Cada línea se resuelve con búsquedas O(1) (más los días de la ventana), así
+10k líneas contra 10k pagos cuestan lineal y no N x M.
+
+Se aprueban automáticamente solo los pares sin ambigüedad: la línea encuentra
+un único pago por referencia + monto dentro de la ventana de fechas y ninguna
+otra línea reclama ese pago. El resto vuelve como lista de revisión.
+"""
+import codecs
+import csv
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from .models import Pago
+from .services import cambiar_estado_pagos
+
+VENTANA_DIAS = 3
+
+
+def normalizar_referencia(valor) -> str:
+    return "".join(ch for ch in str(valor or "").upper() if ch.isalnum())
+
+
+def _monto(valor) -> Decimal:
+    texto = str(valor or "").strip().replace(" ", "")
+    if "," in texto and "." in texto:
+        # el separador que aparece último es el decimal: 1.234,56 | 1,234.56
+        miles = "." if texto.rfind(",") > texto.rfind(".") else ","
+        texto = texto.replace(miles, "")
+    elif "," in texto or "." in texto:
+        # un solo tipo de separador: es de miles si se repite o si le siguen
+        # exactamente 3 dígitos (1.234 | 1,234 | 1.234.567); si no, decimal (12,5 | 12.50)
+        sep = "," if "," in texto else "."
+        partes = texto.split(sep)
+        if len(partes) > 2 or len(partes[-1]) == 3:
+            texto = texto.replace(sep, "")
+    texto = texto.replace(",", ".")
+    return Decimal(texto).quantize(Decimal("0.01"))
+
+
+def _fecha(valor) -> date:
+    texto = str(valor or "").strip()
+    for formato in ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d/%m/%y"):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            continue
+    raise ValueError(f"fecha inválida: {texto!r}")
+
+
+def leer_extracto(archivo):
+    """
+    Itera (nro_linea, dict | None, error | None) sobre el CSV subido, sin cargarlo entero.
+    Acepta ',' o ';' como separador y BOM de Excel.
+    """
+    texto = codecs.iterdecode(archivo, "utf-8-sig")  # los File de Django iteran por líneas
+    primera = next(texto, "")
+    dialecto = ";" if primera.count(";") > primera.count(",") else ","
+    encabezado = [c.strip().lower() for c in next(csv.reader([primera], delimiter=dialecto))]
+    faltan = {"fecha", "monto", "referencia"} - set(encabezado)
+    if faltan:
+        raise ValueError(f"Faltan columnas en el extracto: {', '.join(sorted(faltan))}")
+    for nro, fila in enumerate(csv.reader(texto, delimiter=dialecto), start=2):
+        if not any(c.strip() for c in fila):
+            continue
+        datos = dict(zip(encabezado, fila))
+        try:
+            monto = _monto(datos.get("monto"))
+            if monto <= 0:
+                # débitos y líneas en cero no son cobros: no se concilian
+                raise ValueError(f"monto no positivo (débito): {datos.get('monto')!r}")
+            yield nro, {
+                "fecha": _fecha(datos.get("fecha")),
+                "monto": monto,
+                "referencia": (datos.get("referencia") or "").strip(),
+                "descripcion": (datos.get("descripcion") or "").strip(),
+            }, None
+        except (ValueError, InvalidOperation) as e:
+            yield nro, None, str(e)
+
+
+class IndicePagos:
+    """Índices hash sobre pagos pendientes: filas (id, referencia, monto, fecha)."""
+
+    def __init__(self, pagos):
+        self.por_referencia = defaultdict(list)
+        self.por_monto_fecha = defaultdict(list)
+        for pago_id, referencia, monto, fecha in pagos:
+            ref = normalizar_referencia(referencia)
+            if ref:
+                self.por_referencia[(ref, monto)].append((pago_id, fecha))
+            self.por_monto_fecha[(monto, fecha)].append(pago_id)
+
+    def por_ref(self, referencia, monto, fecha, ventana):
+        ref = normalizar_referencia(referencia)
+        if not ref:
+            return []
+        return [pid for pid, f in self.por_referencia.get((ref, monto), ())
+                if abs((f - fecha).days) <= ventana]
+
+    def por_monto(self, monto, fecha, ventana):
+        salida = []
+        for d in range(-ventana, ventana + 1):
+            salida += self.por_monto_fecha.get((monto, fecha + timedelta(days=d)), ())
+        return salida
+
+
+def conciliar(lineas, indice: IndicePagos, ventana=VENTANA_DIAS):
+    """
+    `lineas`: iterable de (nro, dict | None, error | None) como leer_extracto.
+    Devuelve (pares {pago_id: linea}, revision [dict], invalidas [dict], total_lineas).
+    """
+    propuestas = defaultdict(list)  # pago_id -> [linea]
+    revision, invalidas, total = [], [], 0
+    for nro, linea, error in lineas:
+        total += 1
+        if error:
+            invalidas.append({"linea": nro, "error": error})
+            continue
+        linea["linea"] = nro
+        candidatos = indice.por_ref(linea["referencia"], linea["monto"], linea["fecha"], ventana)
+        if len(candidatos) == 1:
+            propuestas[candidatos[0]].append(linea)
+            continue
+        if candidatos:
+            revision.append({**linea, "motivo": "varios pagos con la misma referencia y monto", "candidatos": candidatos})
+            continue
+        sugeridos = indice.por_monto(linea["monto"], linea["fecha"], ventana)
+        motivo = "sin pago con esa referencia; hay pagos del mismo monto" if sugeridos else "sin coincidencias"
+        revision.append({**linea, "motivo": motivo, "candidatos": sugeridos[:20]})
+
+    pares = {}
+    for pago_id, lineas_pago in propuestas.items():
+        if len(lineas_pago) == 1:
+            pares[pago_id] = lineas_pago[0]
+        else:
+            for linea in lineas_pago:
+                revision.append({**linea, "motivo": "varias líneas apuntan al mismo pago", "candidatos": [pago_id]})
+    revision.sort(key=lambda r: r["linea"])
+    return pares, revision, invalidas, total
+
+
+def _salida(linea):
+    # montos como texto "123.45" (igual que los serializers) y fechas ISO
+    return {**linea, "monto": f"{linea['monto']:.2f}", "fecha": linea["fecha"].isoformat()}
+
+
+def _pagos_pendientes(metodos):
+    return (Pago.objects.filter(estado="PENDIENTE", metodo__in=metodos)
+            .values_list("id", "referencia", "monto_bs", "fecha_pago__date")
+            .iterator(chunk_size=5000))
+
+
+def conciliar_extracto(archivo, ventana=VENTANA_DIAS, metodos=("TRANSFERENCIA",), simular=False) -> dict:
+    """
+    Concilia el extracto contra los pagos pendientes y aprueba en lote los pares
+    sin ambigüedad (salvo `simular`). Devuelve aprobados, revisión e inválidas.
+    """
+    indice = IndicePagos(_pagos_pendientes(metodos))
+    pares, revision, invalidas, total = conciliar(leer_extracto(archivo), indice, ventana)
+
+    aprobados = []
+    if pares:
+        if simular:
+            estados = {pid: {"ok": True, "estado": "PENDIENTE"} for pid in pares}
+        else:
+            # solo si siguen PENDIENTES: un rechazo hecho mientras tanto no se pisa
+            estados = {r["id"]: r for r in cambiar_estado_pagos(sorted(pares), "APROBADO", desde=("PENDIENTE",))}
+        for pago_id, linea in sorted(pares.items(), key=lambda p: p[1]["linea"]):
+            r = estados.get(pago_id, {})
+            if r.get("ok"):
+                aprobados.append({**linea, "pago_id": pago_id, "estado": r["estado"]})
+            else:
+                revision.append({**linea, "motivo": r.get("detalle", "el pago ya no existe"), "candidatos": [pago_id]})
+    revision.sort(key=lambda r: r["linea"])
+    return {
+        "lineas": total,
+        "aprobados": [_salida(a) for a in aprobados],
+        "revision": [_salida(r) for r in revision],
+        "invalidas": invalidas,
+        "simulado": simular,
+    }
@@ -0,0 +1,192 @@
+"""
+Cuenta corriente de cada unidad: libro de movimientos de solo inserción.
+
+Cada cambio que mueve lo que la unidad debe deja una fila en MovimientoCuenta,
+en la misma transacción que el cambio de saldo de la expensa:
+
+    CARGO / RECARGO / AJUSTE (+)   expensa generada, recargo, cambio de monto
+    PAGO (-)                       pago aprobado (monto completo, aunque sobre)
+    ANULACION (-) / REVERSO (±)    anulación de expensa, des-aprobación, recargo revertido
+
+Cada fila guarda el saldo de la cuenta después de aplicarla. CuentaUnidad lleva
+el saldo vigente y su fila se bloquea (INSERT ... ON CONFLICT DO UPDATE) al
+registrar, así los saldos corridos de una unidad no se cruzan entre
+transacciones. Un estado de cuenta de cualquier rango sale del índice
+(unidad, fecha, id): el saldo inicial es el de la última fila anterior al rango.
+
+Invariante: saldo = apertura + monto_total de las expensas no anuladas
+               - pagos aprobados (creadas después de la apertura).
+
+La APERTURA la escribe `manage.py inicializar_cuentas`, también para unidades
+que ya tienen movimientos: va fechada antes del primero y es la única vez que
+se corrigen los saldos corridos de filas ya escritas.
+"""
+from django.db import connection
+from django.utils import timezone
+
+from .models import CuentaUnidad, Expensa, MovimientoCuenta, Pago, Recargo
+
+_T_CUENTA = CuentaUnidad._meta.db_table
+_T_MOV = MovimientoCuenta._meta.db_table
+_T_EXPENSA = Expensa._meta.db_table
+_T_PAGO = Pago._meta.db_table
+_T_RECARGO = Recargo._meta.db_table
+
+
+def registrar_sql(origen_sql, params=()):
+    """
+    Registra los movimientos que devuelve `origen_sql`, un SELECT de
+    (unidad_id, tipo, monto, expensa_id, pago_id, recargo_id, glosa) en el orden
+    en que deben quedar. Los montos 0 se omiten (salvo APERTURA).
+    Una sentencia: actualiza las cuentas y escribe las filas con su saldo corrido.
+    """
+    sql = f"""
+        WITH nuevos AS (
+            SELECT o.*, row_number() OVER () AS ord
+            FROM ({origen_sql}) AS o(unidad_id, tipo, monto, expensa_id, pago_id, recargo_id, glosa)
+            WHERE o.monto <> 0 OR o.tipo = 'APERTURA'
+        ),
+        por_unidad AS (
+            SELECT unidad_id, SUM(monto) AS total FROM nuevos GROUP BY unidad_id
+        ),
+        cuentas AS (
+            INSERT INTO {_T_CUENTA} (unidad_id, saldo, updated_at)
+            SELECT unidad_id, total, %s FROM por_unidad ORDER BY unidad_id
+            ON CONFLICT (unidad_id) DO UPDATE
+                SET saldo = {_T_CUENTA}.saldo + EXCLUDED.saldo, updated_at = EXCLUDED.updated_at
+            RETURNING unidad_id, saldo
+        )
+        INSERT INTO {_T_MOV} (unidad_id, fecha, tipo, monto, saldo, expensa_id, pago_id, recargo_id, glosa)
+        SELECT n.unidad_id, clock_timestamp(), n.tipo, n.monto,
+               c.saldo - p.total + SUM(n.monto) OVER (PARTITION BY n.unidad_id ORDER BY n.ord),
+               n.expensa_id, n.pago_id, n.recargo_id, n.glosa
+        FROM nuevos n
+        JOIN por_unidad p ON p.unidad_id = n.unidad_id
+        JOIN cuentas c ON c.unidad_id = n.unidad_id
+        ORDER BY n.unidad_id, n.ord
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [*params, timezone.now()])
+        return cur.rowcount
+
+
+def registrar(filas):
+    """Como registrar_sql, con filas (unidad_id, tipo, monto, expensa_id, pago_id, recargo_id, glosa)."""
+    filas = list(filas)
+    if not filas:
+        return 0
+    columnas = list(zip(*filas))
+    origen = """
+        SELECT u, t, m, e, p, r, g FROM unnest(
+            %s::bigint[], %s::varchar[], %s::numeric[], %s::bigint[], %s::bigint[], %s::bigint[], %s::varchar[]
+        ) WITH ORDINALITY AS x(u, t, m, e, p, r, g, n)
+        ORDER BY n
+    """
+    return registrar_sql(origen, [list(c) for c in columnas])
+
+
+# =============== Orígenes de movimientos ===============
+
+def registrar_cargos(expensa_ids):
+    """CARGO por cada expensa recién creada (monto_total)."""
+    if not expensa_ids:
+        return 0
+    return registrar_sql(f"""
+        SELECT unidad_id, 'CARGO', monto_total, id, NULL::bigint, NULL::bigint,
+               'Expensa ' || to_char(periodo, 'YYYY-MM')
+        FROM {_T_EXPENSA} WHERE id = ANY(%s::bigint[]) ORDER BY id
+    """, [list(expensa_ids)])
+
+
+def registrar_anulaciones(expensa_ids):
+    """ANULACION (-monto_total) por cada expensa recién anulada."""
+    if not expensa_ids:
+        return 0
+    return registrar_sql(f"""
+        SELECT unidad_id, 'ANULACION', -monto_total, id, NULL::bigint, NULL::bigint,
+               'Anulación expensa ' || to_char(periodo, 'YYYY-MM')
+        FROM {_T_EXPENSA} WHERE id = ANY(%s::bigint[]) ORDER BY id
+    """, [list(expensa_ids)])
+
+
+def registrar_pagos(pago_ids, aprobados=True):
+    """PAGO (-monto) por pagos recién aprobados o REVERSO (+monto) por pagos des-aprobados."""
+    if not pago_ids:
+        return 0
+    tipo, signo, texto = ("PAGO", -1, "Pago") if aprobados else ("REVERSO", 1, "Reverso de pago")
+    return registrar_sql(f"""
+        SELECT e.unidad_id, %s, p.monto_bs * %s, p.expensa_id, p.id, NULL::bigint,
+               %s || ' #' || p.id || ' (' || p.metodo || COALESCE(NULLIF(' ' || p.referencia, ' '), '') || ')'
+        FROM {_T_PAGO} p JOIN {_T_EXPENSA} e ON e.id = p.expensa_id
+        WHERE p.id = ANY(%s::bigint[]) ORDER BY p.id
+    """, [tipo, signo, texto, list(pago_ids)])
+
+
+def registrar_recargos(recargo_ids, revertidos=False):
+    """RECARGO (+monto) o su REVERSO (-monto); los de expensas anuladas no mueven la cuenta."""
+    if not recargo_ids:
+        return 0
+    tipo, signo, texto = ("REVERSO", -1, "Reverso de recargo") if revertidos else ("RECARGO", 1, "Recargo por mora")
+    return registrar_sql(f"""
+        SELECT e.unidad_id, %s, r.monto * %s, r.expensa_id, NULL::bigint, r.id,
+               %s || ' ' || to_char(r.fecha_corte, 'YYYY-MM-DD')
+        FROM {_T_RECARGO} r JOIN {_T_EXPENSA} e ON e.id = r.expensa_id
+        WHERE r.id = ANY(%s::bigint[]) AND e.estado <> 'ANULADA' ORDER BY r.id
+    """, [tipo, signo, texto, list(recargo_ids)])
+
+
+def _vigente(monto_total, estado):
+    return monto_total if estado != "ANULADA" else 0
+
+
+def registrar_cambio_expensa(expensa: Expensa, antes=None, borrada=False):
+    """
+    Movimiento por una edición puntual (admin, borrado): `antes` = (monto_total, estado)
+    leído de la BD, o None si la expensa es nueva.
+    """
+    if antes is None:
+        tipo, delta, texto = "CARGO", _vigente(expensa.monto_total, expensa.estado), "Expensa"
+    elif borrada:
+        tipo, delta, texto = "AJUSTE", -_vigente(*antes), "Expensa eliminada"
+    else:
+        delta = _vigente(expensa.monto_total, expensa.estado) - _vigente(*antes)
+        if antes[1] != "ANULADA" and expensa.estado == "ANULADA":
+            tipo, texto = "ANULACION", "Anulación expensa"
+        else:
+            tipo, texto = "AJUSTE", "Ajuste expensa"
+    return registrar([(expensa.unidad_id, tipo, delta, expensa.pk, None, None, f"{texto} {expensa.periodo:%Y-%m}")])
+
+
+def registrar_cambio_pago(pago_id, antes, despues):
+    """
+    Movimientos por un Pago editado o borrado a mano: `antes` / `despues` son
+    (expensa_id, estado, monto_bs, ...) como Pago._original; `despues` None si se borró.
+    """
+    if antes is not None and despues is not None and tuple(antes[:3]) == tuple(despues[:3]):
+        return 0
+    aprobado_antes = antes is not None and antes[1] == "APROBADO"
+    aprobado_despues = despues is not None and despues[1] == "APROBADO"
+    expensas = {t[0] for t, a in ((antes, aprobado_antes), (despues, aprobado_despues)) if a}
+    if not expensas:
+        return 0
+    unidades = dict(Expensa.objects.filter(pk__in=expensas).values_list("pk", "unidad_id"))
+    filas = []
+    if aprobado_antes and antes[0] in unidades:
+        filas.append((unidades[antes[0]], "REVERSO", antes[2], antes[0], pago_id, None, f"Reverso de pago #{pago_id}"))
+    if aprobado_despues:
+        filas.append((unidades[despues[0]], "PAGO", -despues[2], despues[0], pago_id, None, f"Pago #{pago_id}"))
+    if len(filas) == 2 and filas[0][0] == filas[1][0] and filas[0][2] == -filas[1][2]:
+        return 0  # misma unidad y mismo monto: la cuenta no cambia
+    return registrar(filas)
+
+
+# =============== Consulta ===============
+
+def saldo_al(unidad_id, momento):
+    """Saldo de la cuenta antes de `momento` (0 si no hay movimientos previos). Una búsqueda por índice."""
+    fila = (MovimientoCuenta.objects
+            .filter(unidad_id=unidad_id, fecha__lt=momento)
+            .order_by("-fecha", "-id")
+            .values_list("saldo", flat=True)
+            .first())
+    return fila if fila is not None else 0
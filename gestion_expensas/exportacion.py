@@ -0,0 +1,191 @@
+"""
+Exportación de expensas y pagos en CSV o XLSX, en streaming.
+
+Las filas salen de `values_list(...).iterator(chunk_size)`: en PostgreSQL eso
+abre un cursor del lado del servidor y trae de a `CHUNK` filas, con los campos
+relacionados (unidad.codigo, usuario.username) resueltos con JOIN en la misma
+consulta. Cada bloque se escribe y se entrega al cliente antes de leer el
+siguiente, así la memoria no crece con la cantidad de filas.
+
+El XLSX se arma a mano (zip + XML de una hoja con cadenas inline) porque los
+escritores de planillas arman el archivo completo antes de entregarlo.
+"""
+import csv
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+CHUNK = 2000
+
+COLUMNAS_EXPENSAS = (
+    ("id", "id"),
+    ("unidad__codigo", "unidad"),
+    ("unidad__bloque", "bloque"),
+    ("periodo", "periodo"),
+    ("vencimiento", "vencimiento"),
+    ("monto_total", "monto_total"),
+    ("saldo", "saldo"),
+    ("estado", "estado"),
+    ("glosa", "glosa"),
+    ("created_at", "creada"),
+)
+
+COLUMNAS_PAGOS = (
+    ("id", "id"),
+    ("expensa_id", "expensa"),
+    ("expensa__periodo", "periodo"),
+    ("expensa__unidad__codigo", "unidad"),
+    ("usuario__username", "usuario"),
+    ("monto_bs", "monto_bs"),
+    ("metodo", "metodo"),
+    ("referencia", "referencia"),
+    ("distribuir", "distribuido"),
+    ("estado", "estado"),
+    ("fecha_pago", "fecha_pago"),
+    ("created_at", "creado"),
+)
+
+FORMATOS = ("csv", "xlsx")
+
+
+def _texto(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).strftime("%Y-%m-%d %H:%M:%S") if timezone.is_aware(valor) else valor.isoformat(" ")
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _filas(queryset, columnas):
+    campos = [c for c, _ in columnas]
+    return queryset.values_list(*campos).iterator(chunk_size=CHUNK)
+
+
+# --------- CSV ----------
+class _Eco:
+    """Pseudo-archivo para csv.writer: devuelve lo escrito en vez de guardarlo."""
+    def write(self, valor):
+        return valor
+
+
+def _csv(filas, encabezado):
+    escritor = csv.writer(_Eco())
+    yield "\ufeff" + escritor.writerow(encabezado)  # BOM: Excel abre bien los acentos
+    lote = []
+    for fila in filas:
+        lote.append(escritor.writerow([_texto(v) for v in fila]))
+        if len(lote) >= CHUNK:
+            yield "".join(lote)
+            lote = []
+    if lote:
+        yield "".join(lote)
+
+
+# --------- XLSX ----------
+class _Buffer:
+    """Destino no posicionable para ZipFile: acumula bytes hasta que se vacían."""
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self.partes)
+        self.partes.clear()
+        return datos
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+def _workbook(hoja):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(hoja)}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )
+
+
+def _celda(valor):
+    if isinstance(valor, (int, Decimal, float)) and not isinstance(valor, bool):
+        return f"<c><v>{valor}</v></c>"
+    return f'<c t="inlineStr"><is><t>{escape(_texto(valor))}</t></is></c>'
+
+
+def _fila_xml(valores):
+    return "<row>" + "".join(_celda(v) for v in valores) + "</row>"
+
+
+def _xlsx(filas, encabezado, hoja):
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _RELS)
+        zf.writestr("xl/workbook.xml", _workbook(hoja))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        with zf.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as hoja_xml:
+            hoja_xml.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja_xml.write(_fila_xml(encabezado).encode("utf-8"))
+            lote = []
+            for fila in filas:
+                lote.append(_fila_xml(fila))
+                if len(lote) >= CHUNK:
+                    hoja_xml.write("".join(lote).encode("utf-8"))
+                    lote = []
+                    yield buffer.vaciar()
+            if lote:
+                hoja_xml.write("".join(lote).encode("utf-8"))
+            hoja_xml.write(b"</sheetData></worksheet>")
+    yield buffer.vaciar()
+
+
+# --------- Respuesta ----------
+def respuesta_exportacion(queryset, columnas, nombre, formato="csv"):
+    """StreamingHttpResponse con las filas de `queryset` en el formato pedido."""
+    filas = _filas(queryset, columnas)
+    encabezado = [t for _, t in columnas]
+    sello = timezone.localtime().strftime("%Y%m%d-%H%M")
+    if formato == "xlsx":
+        contenido = _xlsx(filas, encabezado, nombre)
+        tipo = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        contenido = _csv(filas, encabezado)
+        tipo = "text/csv; charset=utf-8"
+    resp = StreamingHttpResponse(contenido, content_type=tipo)
+    resp["Content-Disposition"] = f'attachment; filename="{nombre}-{sello}.{formato}"'
+    return resp
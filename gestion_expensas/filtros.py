@@ -0,0 +1,65 @@
+"""
+Filtros comunes de expensas y pagos (listados y exportaciones).
+
+El periodo se filtra como rango de fechas (periodo >= desde AND periodo < hasta)
+para que el índice sobre `periodo` sirva; nunca con __year / __month.
+"""
+from datetime import date
+
+
+def _primer_dia(yyyymm: str) -> date:
+    # "2025-09" -> date(2025, 9, 1). Si llega "2025-09-01", también sirve.
+    partes = yyyymm.split("-")
+    return date(int(partes[0]), int(partes[1]), 1)
+
+
+def _mes_siguiente(d: date) -> date:
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def rango_periodo(params):
+    """
+    (desde, hasta) con `hasta` exclusivo, a partir de ?periodo=YYYY-MM o de
+    ?periodo_desde=YYYY-MM / ?periodo_hasta=YYYY-MM (ambos inclusive).
+    Lanza ValueError si alguno no tiene formato YYYY-MM.
+    """
+    try:
+        if params.get("periodo"):
+            desde = _primer_dia(params["periodo"])
+            return desde, _mes_siguiente(desde)
+        desde = _primer_dia(params["periodo_desde"]) if params.get("periodo_desde") else None
+        hasta = _mes_siguiente(_primer_dia(params["periodo_hasta"])) if params.get("periodo_hasta") else None
+    except (IndexError, ValueError):
+        raise ValueError("Periodo inválido. Usa YYYY-MM.")
+    return desde, hasta
+
+
+def filtrar_periodo(qs, params, campo="periodo"):
+    desde, hasta = rango_periodo(params)
+    if desde:
+        qs = qs.filter(**{f"{campo}__gte": desde})
+    if hasta:
+        qs = qs.filter(**{f"{campo}__lt": hasta})
+    return qs
+
+
+def filtrar_expensas(qs, params):
+    """?periodo / ?periodo_desde / ?periodo_hasta, ?estado, ?unidad sobre Expensa."""
+    qs = filtrar_periodo(qs, params)
+    if params.get("estado"):
+        qs = qs.filter(estado=params["estado"])
+    if params.get("unidad"):
+        qs = qs.filter(unidad_id=params["unidad"])
+    return qs
+
+
+def filtrar_pagos(qs, params):
+    """Mismos filtros sobre Pago: el periodo y la unidad son los de su expensa; ?expensa opcional."""
+    qs = filtrar_periodo(qs, params, "expensa__periodo")
+    if params.get("estado"):
+        qs = qs.filter(estado=params["estado"])
+    if params.get("unidad"):
+        qs = qs.filter(expensa__unidad_id=params["unidad"])
+    if params.get("expensa"):
+        qs = qs.filter(expensa_id=params["expensa"])
+    return qs
@@ -0,0 +1,42 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_expensas.models import PoliticaRecargo
+from gestion_expensas.recargos import aplicar_recargos, revertir_recargos
+
+
+class Command(BaseCommand):
+    help = ("Aplica recargos por mora a todas las expensas vencidas a la fecha de corte "
+            "(idempotente por fecha; el porcentaje se prorratea por días desde el último corte, así que "
+            "se puede correr a diario). Con --revertir deshace los recargos de ese corte.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fecha-corte", help="YYYY-MM-DD (default: hoy)")
+        parser.add_argument("--politica", type=int, help="Id de PoliticaRecargo (default: la vigente a la fecha)")
+        parser.add_argument("--revertir", action="store_true", help="Revierte los recargos vigentes de esa fecha de corte.")
+
+    def handle(self, *args, **opts):
+        try:
+            corte = date.fromisoformat(opts["fecha_corte"]) if opts["fecha_corte"] else date.today()
+        except ValueError:
+            raise CommandError("--fecha-corte debe tener formato YYYY-MM-DD.")
+
+        if opts["revertir"]:
+            res = revertir_recargos(fecha_corte=corte)
+            self.stdout.write(self.style.SUCCESS(
+                f"Corte {corte}: {res['recargos']} recargos revertidos por {res['total']} Bs."))
+            return
+
+        politica = None
+        if opts["politica"]:
+            politica = PoliticaRecargo.objects.filter(pk=opts["politica"]).first()
+            if not politica:
+                raise CommandError(f"No existe la política {opts['politica']}.")
+        try:
+            res = aplicar_recargos(corte, politica)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Corte {corte}: {res['expensas']} expensas recargadas por {res['total']} Bs "
+            f"(política {res['politica']})."))
@@ -0,0 +1,86 @@
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from unidad_pertenencia.models import Unidad
+from gestion_expensas.models import Expensa, Tarifa
+from gestion_expensas.services import generar_expensas, last_day_of_month
+from gestion_expensas.tarifas import TablaTarifas
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Benchmark del motor de generación de expensas con N unidades sintéticas de tipos "
+            "mezclados (tarifa general + tarifas por tipo con monto por m²). "
+            "Todo corre dentro de una transacción que se revierte al final (no deja datos).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tamanos", nargs="+", type=int, default=[1000, 10000, 50000],
+                            help="Cantidades de unidades a probar (default: 1000 10000 50000).")
+        parser.add_argument("--comparar", action="store_true",
+                            help="Mide también el bucle clásico get_or_create por unidad.")
+
+    def handle(self, *args, **opts):
+        for n in opts["tamanos"]:
+            try:
+                with transaction.atomic():
+                    self._correr(n, opts["comparar"])
+                    raise _Rollback()
+            except _Rollback:
+                pass
+
+    def _correr(self, n, comparar):
+        periodo = date(2099, 1, 1)
+        tarifa = Tarifa.objects.create(nombre="Bench", monto_bs=Decimal("350.00"), vigente_desde=periodo)
+        tabla = TablaTarifas(general=tarifa, por_tipo={
+            "casa": Tarifa.objects.create(nombre="Bench casa", tipo_unidad="casa", monto_bs=Decimal("200.00"),
+                                          monto_m2=Decimal("2.50"), vigente_desde=periodo),
+            "local": Tarifa.objects.create(nombre="Bench local", tipo_unidad="local", monto_bs=Decimal("0.00"),
+                                           monto_m2=Decimal("6.00"), vigente_desde=periodo),
+        })
+        tipos = ("apartamento", "casa", "local", "oficina")
+        Unidad.objects.bulk_create(
+            [Unidad(codigo=f"BENCH-{i:07d}", bloque=f"B{i % 50}", piso=i % 20, numero=str(i),
+                    area_m2=Decimal(60 + i % 90), tipo_unidad=tipos[i % len(tipos)], estado="activa")
+             for i in range(n)],
+            batch_size=5000,
+        )
+        unidades = Unidad.objects.filter(codigo__startswith="BENCH-")
+
+        t0 = time.perf_counter()
+        res = generar_expensas(periodo, unidades=unidades, tarifas=tabla)
+        self._linea(n, "crear", time.perf_counter() - t0, res)
+
+        tarifa.monto_bs = Decimal("400.00")
+        t0 = time.perf_counter()
+        res = generar_expensas(periodo, sobrescribir=True, unidades=unidades, tarifas=tabla)
+        self._linea(n, "sobrescribir", time.perf_counter() - t0, res)
+
+        t0 = time.perf_counter()
+        res = generar_expensas(periodo, unidades=unidades, tarifas=tabla)
+        self._linea(n, "omitir", time.perf_counter() - t0, res)
+
+        if comparar:
+            periodo_legacy = date(2099, 2, 1)
+            venc = last_day_of_month(periodo_legacy)
+            t0 = time.perf_counter()
+            for u in unidades:
+                Expensa.objects.get_or_create(
+                    unidad=u, periodo=periodo_legacy,
+                    defaults=dict(vencimiento=venc, monto_total=tarifa.monto_bs, saldo=tarifa.monto_bs),
+                )
+            t = time.perf_counter() - t0
+            self.stdout.write(f"{n:>7} unidades | legacy get_or_create | {t:8.2f}s | {n / t:10.0f} u/s")
+
+    def _linea(self, n, fase, t, res):
+        total = len(res["creadas"]) + len(res["actualizadas"]) + len(res["omitidas"])
+        self.stdout.write(
+            f"{n:>7} unidades | {fase:<12} | {t:8.2f}s | {total / t if t else 0:10.0f} u/s | "
+            f"creadas={len(res['creadas'])} actualizadas={len(res['actualizadas'])} omitidas={len(res['omitidas'])}"
+        )
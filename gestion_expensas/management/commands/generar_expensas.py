@@ -1,41 +1,182 @@
-from calendar import monthrange
+import json
+import os
+import time
 from datetime import date
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from unidad_pertenencia.models import Unidad
+from gestion_expensas.services import generar_expensas
+from gestion_expensas.tarifas import tabla_tarifas
+
+
+def _parse_periodo(valor: str) -> date:
+    y, m = valor.split("-")[:2]
+    return date(int(y), int(m), 1)
+
+
+def _meses(desde: date, hasta: date):
+    actual = desde
+    while actual <= hasta:
+        yield actual
+        actual = date(actual.year + (actual.month // 12), actual.month % 12 + 1, 1)
+
+
+def _clave(periodo, tipo, valor):
+    return f"{periodo:%Y-%m}|{tipo}|{valor}"
+
+
+def _init_worker():
+    # Cada proceso abre su propia conexión (no se comparten sockets heredados).
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _procesar_chunk(tarea):
+    """Genera un chunk (periodo + bloque o rango de ids) en su propia transacción."""
+    periodo, tipo, valor, sobrescribir = tarea
+    unidades = Unidad.objects.filter(estado="activa")
+    if tipo == "bloque":
+        unidades = unidades.filter(bloque=valor)
+    else:
+        # "lo-hi"; el primer rango no tiene lo y el último no tiene hi
+        lo, hi = valor.split("-")
+        if lo:
+            unidades = unidades.filter(id__gte=int(lo))
+        if hi:
+            unidades = unidades.filter(id__lte=int(hi))
+
+    t0 = time.perf_counter()
+    # Las tarifas se resuelven una vez por periodo en cada proceso (caché local)
+    res = generar_expensas(periodo, sobrescribir=sobrescribir, unidades=unidades)
+    return {
+        "clave": _clave(periodo, tipo, valor),
+        "creadas": len(res["creadas"]),
+        "actualizadas": len(res["actualizadas"]),
+        "omitidas": len(res["omitidas"]),
+        "sin_tarifa": len(res["sin_tarifa"]),
+        "segundos": time.perf_counter() - t0,
+    }
 
-from unidad_pertenencia.models import Unidad  
-from gestion_expensas.models import Expensa, Tarifa
 
 class Command(BaseCommand):
-    help = "Genera expensas para todas las unidades ACTIVAS del periodo YYYY-MM (usa día 01)."
+    help = ("Genera expensas para todas las unidades ACTIVAS del periodo YYYY-MM (usa día 01). "
+            "Con --desde/--hasta procesa un rango de periodos en chunks (por bloque o rango de ids), "
+            "cada uno en su propia transacción, reanudable y opcionalmente en paralelo. "
+            "El checkpoint guarda el modo de chunk y los rangos de ids: al reanudar se usan esos, "
+            "aunque cambien --chunk, --tamano o las unidades.")
+
     def add_arguments(self, parser):
         parser.add_argument("--periodo", help="YYYY-MM", required=False)
+        parser.add_argument("--desde", help="YYYY-MM (inicio del rango, inclusive)")
+        parser.add_argument("--hasta", help="YYYY-MM (fin del rango, inclusive)")
+        parser.add_argument("--sobrescribir", action="store_true",
+                            help="Actualiza montos/vencimiento de las expensas ya existentes del periodo.")
+        parser.add_argument("--chunk", choices=["id", "bloque"], default="id",
+                            help="Cómo partir las unidades: rangos de id (default) o por bloque.")
+        parser.add_argument("--tamano", type=int, default=1000,
+                            help="Unidades por chunk cuando --chunk=id (default 1000).")
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Procesos en paralelo (default 1).")
+        parser.add_argument("--checkpoint",
+                            help="Archivo JSON de progreso; si existe, se saltan los chunks ya completados.")
+
     def handle(self, *args, **opts):
         hoy = date.today()
-        if opts["periodo"]:
-            y, m = opts["periodo"].split("-")
-            periodo = date(int(y), int(m), 1)
+        if opts["desde"] or opts["hasta"]:
+            if not (opts["desde"] and opts["hasta"]):
+                raise CommandError("Debes indicar --desde y --hasta juntos.")
+            desde, hasta = _parse_periodo(opts["desde"]), _parse_periodo(opts["hasta"])
+            if hasta < desde:
+                raise CommandError("--hasta debe ser igual o posterior a --desde.")
+        elif opts["periodo"]:
+            desde = hasta = _parse_periodo(opts["periodo"])
+        else:
+            desde = hasta = date(hoy.year, hoy.month, 1)
+
+        # Tarifas verificadas por adelantado: si algún periodo no tiene, no se procesa nada.
+        periodos = list(_meses(desde, hasta))
+        for periodo in periodos:
+            if not tabla_tarifas(periodo):
+                self.stderr.write(f"No hay Tarifa activa para {periodo:%Y-%m}."); return
+
+        checkpoint = self._leer_checkpoint(opts["checkpoint"])
+        hechos = set(checkpoint.get("completados", []))
+        modo = checkpoint.get("chunk", opts["chunk"])
+        if checkpoint.get("plan"):
+            chunks = [tuple(c) for c in checkpoint["plan"]]
+            self.stdout.write(f"Usando los {len(chunks)} rangos de ids del checkpoint.")
         else:
-            periodo = date(hoy.year, hoy.month, 1)
-
-        tarifa = Tarifa.objects.filter(activa=True, vigente_desde__lte=periodo).order_by("-vigente_desde").first()
-        if not tarifa:
-            self.stderr.write("No hay Tarifa activa."); return
-
-        _, last = monthrange(periodo.year, periodo.month)
-        venc = date(periodo.year, periodo.month, last)
-
-        creadas = 0
-        with transaction.atomic():
-            for u in Unidad.objects.filter(estado="activa"):  # 🔎 tu modelo usa string 'activa'
-                _, created = Expensa.objects.get_or_create(
-                    unidad=u, periodo=periodo,
-                    defaults=dict(
-                        vencimiento=venc,
-                        monto_total=tarifa.monto_bs,
-                        saldo=tarifa.monto_bs,
-                        glosa=f"Expensa {periodo:%Y-%m} según {tarifa.nombre}",
-                    ),
-                )
-                if created: creadas += 1
-        self.stdout.write(self.style.SUCCESS(f"Periodo {periodo:%Y-%m}: {creadas} expensas creadas."))
+            if modo != opts["chunk"]:
+                self.stdout.write(f"Usando --chunk={modo} del checkpoint.")
+            chunks = self._chunks(modo, opts["tamano"])
+        # los bloques salen de los datos; los rangos de ids dependen de --tamano y de
+        # las unidades de ese momento, así que se guardan para reanudar con los mismos
+        plan = {"chunk": modo, "plan": chunks if modo == "id" else None}
+        tareas = [
+            (periodo, tipo, valor, opts["sobrescribir"])
+            for periodo in periodos
+            for tipo, valor in chunks
+            if _clave(periodo, tipo, valor) not in hechos
+        ]
+        if hechos:
+            self.stdout.write(f"Reanudando: {len(hechos)} chunks ya completados, {len(tareas)} pendientes.")
+
+        totales = {"creadas": 0, "actualizadas": 0, "omitidas": 0, "sin_tarifa": 0}
+        t0 = time.perf_counter()
+        for r in self._ejecutar(tareas, opts["workers"]):
+            for k in totales:
+                totales[k] += r[k]
+            hechos.add(r["clave"])
+            self._guardar_checkpoint(opts["checkpoint"], plan, hechos)
+            n = r["creadas"] + r["actualizadas"] + r["omitidas"]
+            self.stdout.write(
+                f"[{r['clave']}] {n} unidades: creadas={r['creadas']} actualizadas={r['actualizadas']} "
+                f"omitidas={r['omitidas']} sin_tarifa={r['sin_tarifa']} en {r['segundos']:.2f}s ({n / r['segundos'] if r['segundos'] else 0:.0f} u/s)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Periodos {desde:%Y-%m}..{hasta:%Y-%m}: {totales['creadas']} expensas creadas, "
+            f"{totales['actualizadas']} actualizadas, {totales['omitidas']} omitidas, "
+            f"{totales['sin_tarifa']} unidades sin tarifa "
+            f"({len(tareas)} chunks en {time.perf_counter() - t0:.2f}s)."
+        ))
+
+    def _chunks(self, modo, tamano):
+        activas = Unidad.objects.filter(estado="activa")
+        if modo == "bloque":
+            bloques = activas.order_by("bloque").values_list("bloque", flat=True).distinct()
+            return [("bloque", b) for b in bloques]
+        ids = list(activas.order_by("id").values_list("id", flat=True))
+        # rangos contiguos y abiertos en los extremos: cubren también las unidades
+        # que se activen o creen después de armar el plan
+        inicios = ids[::tamano]
+        desdes = [""] + [str(i) for i in inicios[1:]]
+        hastas = [str(i - 1) for i in inicios[1:]] + [""]
+        return [("id", f"{lo}-{hi}") for lo, hi in zip(desdes, hastas)]
+
+    def _ejecutar(self, tareas, workers):
+        if workers <= 1 or len(tareas) <= 1:
+            for t in tareas:
+                yield _procesar_chunk(t)
+            return
+        connections.close_all()  # no heredar la conexión del proceso padre
+        with Pool(processes=workers, initializer=_init_worker) as pool:
+            yield from pool.imap_unordered(_procesar_chunk, tareas)
+
+    def _leer_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return {}
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+
+    def _guardar_checkpoint(self, path, plan, hechos):
+        if not path:
+            return
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({**plan, "completados": sorted(hechos)}, fh)
+        os.replace(tmp, path)
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from gestion_expensas.models import CuentaUnidad, Expensa, MovimientoCuenta
+from unidad_pertenencia.models import Unidad
+
+_T_CUENTA = CuentaUnidad._meta.db_table
+_T_MOV = MovimientoCuenta._meta.db_table
+
+
+class Command(BaseCommand):
+    help = ("Abre la cuenta corriente (libro de movimientos) de las unidades sin movimiento APERTURA. "
+            "La apertura es la suma de los saldos de sus expensas no anuladas menos lo que ya movieron "
+            "los movimientos escritos antes de correr el comando (pagos, recargos, generación), y queda "
+            "fechada antes del primero de ellos, cuyos saldos corridos se corrigen. Se puede volver a "
+            "correr: las unidades ya abiertas no se tocan.")
+
+    def handle(self, *args, **opts):
+        ahora = timezone.now()
+        with transaction.atomic(), connection.cursor() as cur:
+            # Bloquea (o crea) la cuenta de cada unidad sin apertura: los registros
+            # concurrentes de esas unidades esperan a que la apertura quede escrita.
+            cur.execute(f"""
+                INSERT INTO {_T_CUENTA} (unidad_id, saldo, updated_at)
+                SELECT u.id, 0, %s FROM {Unidad._meta.db_table} u
+                WHERE NOT EXISTS (SELECT 1 FROM {_T_MOV} m WHERE m.unidad_id = u.id AND m.tipo = 'APERTURA')
+                ORDER BY u.id
+                ON CONFLICT (unidad_id) DO UPDATE SET updated_at = EXCLUDED.updated_at
+                RETURNING unidad_id
+            """, [ahora])
+            ids = [r[0] for r in cur.fetchall()]
+            if ids:
+                # apertura = deuda actual - lo ya registrado en la cuenta: con ella, la cuenta
+                # queda igual a la deuda y los saldos corridos previos suben lo mismo
+                cur.execute(f"""
+                    WITH aperturas AS (
+                        SELECT c.unidad_id,
+                               COALESCE((SELECT SUM(e.saldo) FROM {Expensa._meta.db_table} e
+                                         WHERE e.unidad_id = c.unidad_id AND e.estado <> 'ANULADA'), 0)
+                                   - c.saldo AS monto,
+                               (SELECT MIN(m.fecha) FROM {_T_MOV} m WHERE m.unidad_id = c.unidad_id) AS primera
+                        FROM {_T_CUENTA} c
+                        WHERE c.unidad_id = ANY(%(ids)s::bigint[])
+                    ),
+                    corridos AS (
+                        UPDATE {_T_MOV} m SET saldo = m.saldo + a.monto
+                        FROM aperturas a
+                        WHERE m.unidad_id = a.unidad_id AND a.monto <> 0
+                    ),
+                    cuentas AS (
+                        UPDATE {_T_CUENTA} c SET saldo = c.saldo + a.monto, updated_at = %(ahora)s
+                        FROM aperturas a
+                        WHERE c.unidad_id = a.unidad_id
+                    )
+                    INSERT INTO {_T_MOV} (unidad_id, fecha, tipo, monto, saldo, expensa_id, pago_id, recargo_id, glosa)
+                    SELECT unidad_id, COALESCE(primera - interval '1 microsecond', %(ahora)s), 'APERTURA',
+                           monto, monto, NULL, NULL, NULL, 'Saldo de apertura'
+                    FROM aperturas
+                    ORDER BY unidad_id
+                """, {"ids": ids, "ahora": ahora})
+        self.stdout.write(self.style.SUCCESS(f"{len(ids)} cuentas abiertas."))
@@ -0,0 +1,35 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from gestion_expensas.comprobantes import pendientes, procesar_comprobante, sha256_archivo
+from gestion_expensas.models import Pago
+
+
+class Command(BaseCommand):
+    help = ("Comprime y genera la miniatura de los comprobantes pendientes (los que el hilo en segundo "
+            "plano no llegó a procesar). Con --existentes, antes calcula el sha256 de los comprobantes "
+            "subidos sin él, para deduplicarlos y pasarlos a la ruta por contenido.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--existentes", action="store_true",
+                            help="Calcular el hash de comprobantes antiguos que no lo tienen.")
+
+    def handle(self, *args, **opts):
+        if opts["existentes"]:
+            n = 0
+            antiguos = (Pago.objects.filter(comprobante_sha256="").exclude(comprobante="")
+                        .exclude(comprobante__isnull=True).values_list("pk", "comprobante"))
+            for pk, nombre in antiguos.iterator(chunk_size=500):
+                if not default_storage.exists(nombre):
+                    self.stdout.write(self.style.WARNING(f"Pago {pk}: no existe {nombre}"))
+                    continue
+                with default_storage.open(nombre, "rb") as f:
+                    sha = sha256_archivo(f)
+                Pago.objects.filter(pk=pk).update(comprobante_sha256=sha)
+                n += 1
+            self.stdout.write(f"{n} comprobantes antiguos con hash.")
+
+        shas = list(pendientes().order_by().values_list("comprobante_sha256", flat=True).distinct())
+        hechos = sum(1 for sha in shas if procesar_comprobante(sha))
+        self.stdout.write(self.style.SUCCESS(
+            f"{hechos} comprobantes procesados ({len(shas) - hechos} no son imágenes legibles)."))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from gestion_expensas.saldos import CHUNK, corregir_saldos, diferencias_saldo, rango_ids
+
+
+class Command(BaseCommand):
+    help = ("Recalcula el saldo y estado esperados de cada expensa (monto_total - pagos aprobados) "
+            "por tramos de id, informa las diferencias y con --fix las corrige.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true",
+                            help="Corrige las expensas con diferencias (solo bloquea esas filas, tramo a tramo).")
+        parser.add_argument("--chunk", type=int, default=CHUNK,
+                            help=f"Cantidad de ids por tramo (default {CHUNK}).")
+        parser.add_argument("--mostrar", type=int, default=50,
+                            help="Máximo de diferencias a listar (default 50; 0 = ninguna).")
+
+    def handle(self, *args, **opts):
+        chunk = max(opts["chunk"], 1)
+        minimo, maximo = rango_ids()
+        if minimo is None:
+            self.stdout.write("No hay expensas.")
+            return
+        encontradas = corregidas = mostradas = 0
+        for desde in range(minimo, maximo + 1, chunk):
+            filas = diferencias_saldo(desde, desde + chunk)
+            if not filas:
+                continue
+            encontradas += len(filas)
+            for eid, saldo, estado, saldo_ok, estado_ok in filas:
+                if mostradas < opts["mostrar"]:
+                    self.stdout.write(f"expensa {eid}: saldo {saldo} -> {saldo_ok}, estado {estado} -> {estado_ok}")
+                    mostradas += 1
+            if opts["fix"]:
+                corregidas += corregir_saldos([f[0] for f in filas])
+
+        if encontradas > mostradas:
+            self.stdout.write(f"... y {encontradas - mostradas} más.")
+        accion = f"{corregidas} corregidas" if opts["fix"] else "sin cambios (usa --fix para corregir)"
+        estilo = self.style.WARNING if encontradas else self.style.SUCCESS
+        self.stdout.write(estilo(f"{encontradas} expensas con diferencias; {accion}."))
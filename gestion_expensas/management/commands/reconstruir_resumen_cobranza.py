@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from gestion_expensas.models import ResumenCobranza
+from gestion_expensas.resumen import calcular_resumen, diferencias, leer_resumen, recalcular_resumen
+
+
+class Command(BaseCommand):
+    help = ("Recalcula ResumenCobranza desde cero (expensas + pagos aprobados) e informa "
+            "las diferencias (drift) contra lo que estaba guardado.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--solo-verificar", action="store_true",
+                            help="Solo informa las diferencias, no reescribe el resumen.")
+
+    def handle(self, *args, **opts):
+        with transaction.atomic():
+            # Bloquea escrituras concurrentes del resumen mientras se compara y reescribe
+            with connection.cursor() as cur:
+                cur.execute(f"LOCK TABLE {ResumenCobranza._meta.db_table} IN EXCLUSIVE MODE")
+            actual = leer_resumen()
+            if opts["solo_verificar"]:
+                esperado = calcular_resumen()
+            else:
+                esperado = recalcular_resumen()
+
+        drift = diferencias(esperado, actual)
+        for (periodo, bloque), campo, guardado, correcto in drift:
+            self.stdout.write(f"{periodo:%Y-%m} bloque {bloque}: {campo} guardado={guardado} correcto={correcto}")
+        claves = len({d[0] for d in drift})
+        accion = "sin cambios (--solo-verificar)" if opts["solo_verificar"] else "resumen reescrito"
+        estilo = self.style.WARNING if drift else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"{len(esperado)} claves (periodo, bloque); {claves} con diferencias, "
+            f"{len(drift)} valores distintos; {accion}."
+        ))
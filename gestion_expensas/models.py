@@ -7,8 +7,17 @@ from users.models import Usuario
 from unidad_pertenencia.models import Unidad  
 
 class Tarifa(models.Model):
+    """
+    Monto de una unidad = monto_bs + monto_m2 * area_m2.
+    Sin tipo_unidad es la tarifa general; con tipo_unidad aplica solo a ese tipo
+    y tiene prioridad sobre la general (ver gestion_expensas.tarifas).
+    """
     nombre = models.CharField(max_length=100, default="Cuota mensual")
+    tipo_unidad = models.CharField(max_length=20, choices=Unidad.TIPOS_UNIDAD, null=True, blank=True,
+                                   help_text="Vacío: aplica a todos los tipos sin tarifa propia")
     monto_bs = models.DecimalField(max_digits=12, decimal_places=2)
+    monto_m2 = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"),
+                                   help_text="Monto adicional por m² de la unidad")
     vigente_desde = models.DateField()
     activa = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -17,7 +26,9 @@ class Tarifa(models.Model):
         db_table = "tarifa"
         ordering = ["-vigente_desde"]
     def __str__(self):
-        return f"{self.nombre} {self.monto_bs} Bs desde {self.vigente_desde}"
+        m2 = f" + {self.monto_m2} Bs/m²" if self.monto_m2 else ""
+        tipo = f" ({self.tipo_unidad})" if self.tipo_unidad else ""
+        return f"{self.nombre}{tipo} {self.monto_bs} Bs{m2} desde {self.vigente_desde}"
 
 ESTADOS_EXPENSA = (
     ("PENDIENTE", "Pendiente"),
@@ -40,6 +51,15 @@ class Expensa(models.Model):
         db_table = "expensa"
         unique_together = (("unidad", "periodo"),)
         ordering = ["-periodo", "unidad_id"]
+        indexes = [
+            # listados por rango de periodo en su orden natural (la única (unidad, periodo) empieza por unidad)
+            models.Index(fields=["-periodo", "unidad"], name="expensa_periodo_unidad_idx"),
+            # listados/exportes filtrados por estado
+            models.Index(fields=["estado", "-periodo"], name="expensa_estado_periodo_idx"),
+            # expensas abiertas (morosidad, recargos, imputación de pagos): chico, solo lo impago
+            models.Index(fields=["unidad", "periodo"], name="expensa_abiertas_idx",
+                         condition=models.Q(estado__in=["PENDIENTE", "PARCIAL"])),
+        ]
     def __str__(self):
         return f"{self.unidad} {self.periodo:%Y-%m} ({self.estado})"
     def recalc_estado(self):
@@ -75,16 +95,255 @@ class Pago(models.Model):
     metodo = models.CharField(max_length=20, choices=METODOS_PAGO, default="TRANSFERENCIA")
     referencia = models.CharField(max_length=120, blank=True, default="")
     comprobante = models.FileField(upload_to=_comprobante_path, null=True, blank=True)
+    # Comprobantes guardados por contenido (comprobantes.py): el mismo archivo en
+    # dos pagos comparte ruta y el segundo queda marcado para revisión
+    comprobante_sha256 = models.CharField(max_length=64, blank=True, default="")
+    comprobante_miniatura = models.FileField(upload_to=_comprobante_path, null=True, blank=True)
+    comprobante_repetido = models.BooleanField(default=False)
     estado = models.CharField(max_length=10, choices=ESTADOS_PAGO, default="PENDIENTE")
+    # Pago a cuenta de la unidad de `expensa`: al aprobarse se reparte (AsignacionPago)
+    # entre sus expensas abiertas, de la más antigua a la más nueva
+    distribuir = models.BooleanField(default=False)
+    # Cola de revisión (cola.py): quién tiene el pago reservado y hasta cuándo;
+    # vencida la reserva, el pago vuelve a la cola
+    revisor = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    revision_hasta = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     class Meta:
         db_table = "pago"
         ordering = ["-created_at"]
-    def aplicar_en_expensa(self, signo=+1):
+        indexes = [
+            # pagos de una expensa, del más reciente al más antiguo
+            models.Index(fields=["expensa", "-created_at"], name="pago_expensa_creado_idx"),
+            # pagos por revisar, en orden de llegada (id desempata el keyset de la cola)
+            models.Index(fields=["created_at", "id"], name="pago_pendiente_idx",
+                         condition=models.Q(estado="PENDIENTE")),
+            # búsqueda de comprobantes repetidos
+            models.Index(fields=["comprobante_sha256"], name="pago_comprobante_sha_idx",
+                         condition=~models.Q(comprobante_sha256="")),
+        ]
+
+    # (expensa_id, estado, monto_bs, distribuir) tal como se leyeron de la BD; None si la instancia es nueva
+    _original = None
+    CAMPOS_SALDO = ("expensa_id", "estado", "monto_bs", "distribuir")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._original = tuple(instance.__dict__.get(f) for f in cls.CAMPOS_SALDO)
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # lo recién leído es el estado de la BD (p.ej. tras un queryset.update() de cambiar_estado_pagos)
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        leidos = None if fields is None else {"expensa_id" if f == "expensa" else f for f in fields}
+        if leidos is not None and self._original is None:
+            return  # sin el resto de lo leído: pre_save lo consulta
+        original = dict(zip(self.CAMPOS_SALDO, self._original or (None,) * len(self.CAMPOS_SALDO)))
+        for campo in self.CAMPOS_SALDO:
+            if leidos is None or campo in leidos:
+                original[campo] = self.__dict__.get(campo)
+        self._original = tuple(original.values())
+
+    def _valores_a_guardar(self, update_fields=None):
+        actual = {"expensa": self.expensa_id, "estado": self.estado, "monto_bs": self.monto_bs,
+                  "distribuir": self.distribuir}
+        if update_fields is None or self._original is None:
+            return tuple(actual.values())
+        nombres = {"expensa" if f == "expensa_id" else f for f in update_fields}
+        original = dict(zip(actual, self._original))
+        return tuple(actual[k] if k in nombres else original[k] for k in actual)
+
+    def movimientos_saldo(self, update_fields=None):
+        """
+        [(expensa_id, monto)] a descontar de cada saldo para pasar de lo leído de la BD
+        a lo que se va a guardar (monto negativo = reponer). Vacío si no hay transición real:
+        aprobar, des-aprobar, cambiar el monto o la expensa de un pago aprobado.
+        Los pagos `distribuir` no mueven saldo por aquí sino con sus asignaciones
+        (ver requiere_reparto).
+        """
+        exp_o, est_o, monto_o, dist_o = self._original or (None, None, None, False)
+        exp_n, est_n, monto_n, dist_n = self._valores_a_guardar(update_fields)
+        antes = est_o == "APROBADO" and not dist_o
+        despues = est_n == "APROBADO" and not dist_n
+        if antes and despues and exp_o == exp_n:
+            return [(exp_n, monto_n - monto_o)] if monto_n != monto_o else []
+        movs = []
+        if antes:
+            movs.append((exp_o, -monto_o))
+        if despues:
+            movs.append((exp_n, monto_n))
+        return movs
+
+    def requiere_reparto(self, update_fields=None) -> bool:
+        """True si el cambio obliga a rehacer las asignaciones de un pago `distribuir`."""
+        original = self._original or (None, None, None, False)
+        nuevo = self._valores_a_guardar(update_fields)
+        if original == nuevo:
+            return False
+        return any(est == "APROBADO" and dist for _, est, _, dist in (original, nuevo))
+
+    def aplicar_en_expensa(self, signo=+1, monto=None, expensa_id=None):
+        """
+        Descuenta (signo=+1) o repone (signo=-1) `monto` (default: monto_bs) del saldo
+        de la expensa (default: la del pago). Quien llama decide si corresponde.
+        """
+        from .resumen import cambios_resumen  # resumen importa estos modelos
+        monto = self.monto_bs if monto is None else monto
         with transaction.atomic():
-            exp = Expensa.objects.select_for_update().get(pk=self.expensa_id)
-            if self.estado == "APROBADO":
-                exp.saldo = exp.saldo - (self.monto_bs * signo)
+            exp = Expensa.objects.select_for_update().get(pk=expensa_id or self.expensa_id)
+            with cambios_resumen([exp.pk], cobrado={exp.pk: monto * signo}):
+                exp.saldo = exp.saldo - (monto * signo)
                 exp.recalc_estado()
                 exp.save(update_fields=["saldo", "estado", "updated_at"])
+
+
+class AsignacionPago(models.Model):
+    """
+    Parte de un pago `distribuir` imputada a una expensa. Solo existen mientras el
+    pago está APROBADO: se crean al aprobarlo y se borran al des-aprobarlo,
+    reponiendo los saldos (ver services.cambiar_estado_pagos).
+    """
+    pago = models.ForeignKey(Pago, on_delete=models.CASCADE, related_name="asignaciones")
+    expensa = models.ForeignKey(Expensa, on_delete=models.CASCADE, related_name="asignaciones")
+    monto = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        db_table = "asignacion_pago"
+        unique_together = (("pago", "expensa"),)
+        ordering = ["pago", "id"]
+    def __str__(self):
+        return f"Pago {self.pago_id} -> expensa {self.expensa_id}: {self.monto}"
+
+
+class ResumenCobranza(models.Model):
+    """
+    Totales de cobranza por periodo y bloque para el dashboard.
+    Lo mantiene gestion_expensas.resumen en la misma transacción que cada cambio
+    de expensas/pagos; no se edita a mano (ver comando reconstruir_resumen_cobranza).
+    `facturado` y `saldo` excluyen las expensas ANULADAS; `cobrado` suma los pagos APROBADOS.
+    """
+    periodo = models.DateField()
+    bloque = models.CharField(max_length=10)
+    facturado = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    cobrado = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    saldo = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    n_pendiente = models.IntegerField(default=0)
+    n_parcial = models.IntegerField(default=0)
+    n_pagada = models.IntegerField(default=0)
+    n_anulada = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        db_table = "resumen_cobranza"
+        unique_together = (("periodo", "bloque"),)
+        ordering = ["-periodo", "bloque"]
+    def __str__(self):
+        return f"{self.periodo:%Y-%m} bloque {self.bloque}"
+
+
+class PoliticaRecargo(models.Model):
+    """
+    Recargo por mora aplicado en cada fecha de corte a las expensas vencidas:
+        monto_fijo (una vez por mes calendario y expensa)
+        + porcentaje_mensual % del saldo adeudado (sin contar recargos previos),
+          prorrateado por los días desde el último recargo vigente (o desde
+          vencimiento + dias_gracia) sobre meses de 30 días,
+    sin que el total de recargos vigentes de una expensa supere `tope_bs` (si se define).
+    Correr el corte a diario o una vez al mes cobra lo mismo.
+    """
+    nombre = models.CharField(max_length=100, default="Recargo por mora")
+    monto_fijo = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    porcentaje_mensual = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal("0.00"))
+    tope_bs = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True,
+                                  help_text="Máximo acumulado de recargos por expensa (vacío: sin tope)")
+    dias_gracia = models.PositiveIntegerField(default=0)
+    vigente_desde = models.DateField()
+    activa = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        db_table = "politica_recargo"
+        ordering = ["-vigente_desde"]
+    def __str__(self):
+        return f"{self.nombre} ({self.monto_fijo} Bs + {self.porcentaje_mensual}%) desde {self.vigente_desde}"
+
+
+class Recargo(models.Model):
+    """Un recargo aplicado a una expensa en una fecha de corte (auditable y reversible)."""
+    expensa = models.ForeignKey(Expensa, on_delete=models.CASCADE, related_name="recargos")
+    politica = models.ForeignKey(PoliticaRecargo, on_delete=models.PROTECT, related_name="recargos")
+    fecha_corte = models.DateField()
+    saldo_base = models.DecimalField(max_digits=12, decimal_places=2)
+    dias = models.PositiveIntegerField(default=0, help_text="Días de mora cobrados en este corte")
+    monto = models.DecimalField(max_digits=12, decimal_places=2)
+    revertido = models.BooleanField(default=False)
+    revertido_en = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    class Meta:
+        db_table = "recargo"
+        ordering = ["-fecha_corte", "expensa_id"]
+        constraints = [
+            # idempotencia: un solo recargo vigente por expensa y fecha de corte
+            models.UniqueConstraint(fields=["expensa", "fecha_corte"], condition=models.Q(revertido=False),
+                                    name="recargo_unico_por_corte"),
+        ]
+    def __str__(self):
+        return f"Recargo {self.monto} Bs a expensa {self.expensa_id} ({self.fecha_corte})"
+
+
+TIPOS_MOVIMIENTO = (
+    ("APERTURA", "Saldo de apertura"),
+    ("CARGO", "Cargo de expensa"),
+    ("AJUSTE", "Ajuste de expensa"),
+    ("RECARGO", "Recargo por mora"),
+    ("PAGO", "Pago"),
+    ("ANULACION", "Anulación de expensa"),
+    ("REVERSO", "Reverso"),
+)
+
+
+class CuentaUnidad(models.Model):
+    """Saldo vigente de la cuenta de una unidad (positivo = debe). Lo mueve gestion_expensas.cuenta."""
+    unidad = models.OneToOneField(Unidad, on_delete=models.PROTECT, primary_key=True, related_name="cuenta")
+    saldo = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    updated_at = models.DateTimeField(auto_now=True)
+    class Meta:
+        db_table = "cuenta_unidad"
+    def __str__(self):
+        return f"Cuenta {self.unidad_id}: {self.saldo} Bs"
+
+
+class MovimientoCuenta(models.Model):
+    """
+    Fila del libro de la cuenta de una unidad: solo se inserta (ver gestion_expensas.cuenta).
+    `monto` positivo aumenta la deuda; `saldo` es el de la cuenta después del movimiento.
+    Las referencias no tienen FK en la BD: el libro se conserva aunque se borre el origen.
+    """
+    unidad = models.ForeignKey(Unidad, on_delete=models.PROTECT, related_name="movimientos_cuenta")
+    fecha = models.DateTimeField(default=timezone.now)
+    tipo = models.CharField(max_length=10, choices=TIPOS_MOVIMIENTO)
+    monto = models.DecimalField(max_digits=14, decimal_places=2)
+    saldo = models.DecimalField(max_digits=14, decimal_places=2)
+    expensa = models.ForeignKey(Expensa, on_delete=models.DO_NOTHING, db_constraint=False,
+                                null=True, blank=True, related_name="+")
+    pago = models.ForeignKey(Pago, on_delete=models.DO_NOTHING, db_constraint=False,
+                             null=True, blank=True, related_name="+")
+    recargo = models.ForeignKey(Recargo, on_delete=models.DO_NOTHING, db_constraint=False,
+                                null=True, blank=True, related_name="+")
+    glosa = models.CharField(max_length=255, blank=True, default="")
+    class Meta:
+        db_table = "movimiento_cuenta"
+        ordering = ["unidad", "fecha", "id"]
+        indexes = [
+            # estado de cuenta por rango y saldo inicial (última fila antes del rango)
+            models.Index(fields=["unidad", "fecha", "id"], name="movcuenta_unidad_fecha_idx"),
+        ]
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise ValueError("Los movimientos de cuenta no se modifican: registra un reverso.")
+        super().save(*args, **kwargs)
+    def delete(self, *args, **kwargs):
+        raise ValueError("Los movimientos de cuenta no se borran: registra un reverso.")
+    def __str__(self):
+        return f"{self.fecha:%Y-%m-%d} {self.tipo} {self.monto} (saldo {self.saldo})"
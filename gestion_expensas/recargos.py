@@ -0,0 +1,171 @@
+"""
+Recargos por mora, aplicados por conjunto.
+
+`aplicar_recargos(fecha_corte)` toma todas las expensas abiertas vencidas a esa
+fecha (vencimiento + días de gracia < fecha_corte), en cualquier periodo, y en
+UNA sentencia inserta un Recargo por expensa y suma el monto a su `monto_total`
+y `saldo`. El porcentaje mensual se cobra por los días transcurridos desde el
+último recargo vigente de la expensa (o desde el fin de la gracia), sobre meses
+de DIAS_MES días, y el monto fijo una vez por mes calendario: correr el corte a
+diario o una vez al mes da el mismo total. La restricción única (expensa,
+fecha_corte) de los recargos vigentes hace que repetir el mismo corte no cobre
+dos veces, y un corte anterior al último ya cobrado se salta esa expensa.
+
+`revertir_recargos(...)` marca los recargos como revertidos y descuenta sus
+montos de las expensas, también por conjunto. Nada pasa por save() fila a fila.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cuenta
+from .models import Expensa, PoliticaRecargo, Recargo
+from .reportes import invalidar_morosidad
+from .resumen import cambios_resumen
+from .services import recalcular_estado_expensas
+
+_T_EXPENSA = Expensa._meta.db_table
+_T_RECARGO = Recargo._meta.db_table
+
+DIAS_MES = 30
+
+
+def politica_vigente(fecha):
+    """Política activa con mayor `vigente_desde` <= fecha (o None)."""
+    return (PoliticaRecargo.objects
+            .filter(activa=True, vigente_desde__lte=fecha)
+            .order_by("-vigente_desde")
+            .first())
+
+
+def _vencidas(fecha_corte, politica):
+    """Ids de expensas a recargar en este corte, bloqueadas (orden por id)."""
+    sql = f"""
+        SELECT e.id FROM {_T_EXPENSA} e
+        WHERE e.estado IN ('PENDIENTE', 'PARCIAL') AND e.saldo > 0
+          AND e.vencimiento + %s::integer < %s
+          AND NOT EXISTS (
+              SELECT 1 FROM {_T_RECARGO} r
+              WHERE r.expensa_id = e.id AND r.fecha_corte >= %s AND NOT r.revertido
+          )
+        ORDER BY e.id
+        FOR UPDATE OF e
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [politica.dias_gracia, fecha_corte, fecha_corte])
+        return [r[0] for r in cur.fetchall()]
+
+
+def aplicar_recargos(fecha_corte, politica=None) -> dict:
+    """
+    Aplica la política (por defecto la vigente a la fecha) a todas las expensas vencidas.
+    Devuelve {"politica": id, "expensas": n, "total": monto}.
+    Lanza ValueError si no hay política vigente.
+    """
+    politica = politica or politica_vigente(fecha_corte)
+    if not politica:
+        raise ValueError("No existe una política de recargo activa para esa fecha.")
+    ahora = timezone.now()
+    with transaction.atomic():
+        ids = _vencidas(fecha_corte, politica)
+        if not ids:
+            return {"politica": politica.pk, "expensas": 0, "total": 0}
+        # base = saldo sin los recargos vigentes (el porcentaje no se capitaliza)
+        sql = f"""
+            WITH previos AS (
+                SELECT expensa_id, SUM(monto) AS acumulado, MAX(fecha_corte) AS ultimo_corte,
+                       BOOL_OR(date_trunc('month', fecha_corte) = date_trunc('month', %(corte)s::date)) AS fijo_del_mes
+                FROM {_T_RECARGO}
+                WHERE expensa_id = ANY(%(ids)s::bigint[]) AND NOT revertido
+                GROUP BY expensa_id
+            ),
+            calculo AS (
+                SELECT e.id AS expensa_id,
+                       GREATEST(e.saldo - COALESCE(p.acumulado, 0), 0) AS base,
+                       COALESCE(p.acumulado, 0) AS acumulado,
+                       %(corte)s::date - COALESCE(p.ultimo_corte, e.vencimiento + %(gracia)s::integer) AS dias,
+                       COALESCE(p.fijo_del_mes, FALSE) AS fijo_del_mes
+                FROM {_T_EXPENSA} e LEFT JOIN previos p ON p.expensa_id = e.id
+                WHERE e.id = ANY(%(ids)s::bigint[])
+            ),
+            montos AS (
+                SELECT expensa_id, base, dias,
+                       LEAST(CASE WHEN fijo_del_mes THEN 0 ELSE %(fijo)s::numeric END
+                             + ROUND(base * %(pct)s::numeric / 100 * dias / %(dias_mes)s, 2),
+                             COALESCE(%(tope)s::numeric - acumulado, 'Infinity'::numeric)) AS monto
+                FROM calculo
+            ),
+            insertados AS (
+                INSERT INTO {_T_RECARGO} (expensa_id, politica_id, fecha_corte, saldo_base, dias, monto, revertido,
+                                          created_at)
+                SELECT expensa_id, %(politica)s, %(corte)s, base, dias, monto, FALSE, %(ahora)s
+                FROM montos WHERE monto > 0
+                ON CONFLICT (expensa_id, fecha_corte) WHERE NOT revertido DO NOTHING
+                RETURNING id, expensa_id, monto
+            )
+            UPDATE {_T_EXPENSA} e SET
+                monto_total = e.monto_total + i.monto,
+                saldo = e.saldo + i.monto,
+                updated_at = %(ahora)s
+            FROM insertados i
+            WHERE e.id = i.expensa_id
+            RETURNING i.id, i.monto
+        """
+        params = {
+            "ids": ids, "fijo": politica.monto_fijo, "pct": politica.porcentaje_mensual,
+            "tope": politica.tope_bs, "politica": politica.pk, "corte": fecha_corte, "ahora": ahora,
+            "gracia": politica.dias_gracia, "dias_mes": DIAS_MES,
+        }
+        # monto_total y saldo suben lo mismo: el estado no cambia, sí el resumen
+        with cambios_resumen(ids), connection.cursor() as cur:
+            cur.execute(sql, params)
+            filas = cur.fetchall()
+        montos = [r[1] for r in filas]
+        cuenta.registrar_recargos([r[0] for r in filas])
+        if montos:
+            transaction.on_commit(invalidar_morosidad)
+    return {"politica": politica.pk, "expensas": len(montos), "total": sum(montos)}
+
+
+def revertir_recargos(fecha_corte=None, recargo_ids=None) -> dict:
+    """
+    Revierte los recargos vigentes de un corte (o los indicados por id): quedan
+    marcados como revertidos y su monto sale de monto_total y saldo de la expensa.
+    Devuelve {"recargos": n, "total": monto}.
+    """
+    if fecha_corte is None and recargo_ids is None:
+        raise ValueError("Indica la fecha de corte o los recargos a revertir.")
+    qs = Recargo.objects.filter(revertido=False)
+    if fecha_corte is not None:
+        qs = qs.filter(fecha_corte=fecha_corte)
+    if recargo_ids is not None:
+        qs = qs.filter(pk__in=list(recargo_ids))
+    with transaction.atomic():
+        filas = list(qs.select_for_update().order_by("pk").values_list("pk", "expensa_id", "monto"))
+        if not filas:
+            return {"recargos": 0, "total": 0}
+        recargo_ids = [f[0] for f in filas]
+        expensa_ids = sorted({f[1] for f in filas})
+        list(Expensa.objects.select_for_update().filter(pk__in=expensa_ids).order_by("pk").values_list("pk", flat=True))
+        sql = f"""
+            WITH revertidos AS (
+                UPDATE {_T_RECARGO} SET revertido = TRUE, revertido_en = %(ahora)s
+                WHERE id = ANY(%(ids)s::bigint[])
+                RETURNING expensa_id, monto
+            ),
+            por_expensa AS (
+                SELECT expensa_id, SUM(monto) AS monto FROM revertidos GROUP BY expensa_id
+            )
+            UPDATE {_T_EXPENSA} e SET
+                monto_total = e.monto_total - p.monto,
+                saldo = GREATEST(e.saldo - p.monto, 0),
+                updated_at = %(ahora)s
+            FROM por_expensa p
+            WHERE e.id = p.expensa_id
+        """
+        with cambios_resumen(expensa_ids), connection.cursor() as cur:
+            cur.execute(sql, {"ids": recargo_ids, "ahora": timezone.now()})
+            # si ya se había pagado parte del recargo, la expensa puede quedar saldada
+            recalcular_estado_expensas(expensa_ids)
+        cuenta.registrar_recargos(recargo_ids, revertidos=True)
+        transaction.on_commit(invalidar_morosidad)
+    return {"recargos": len(filas), "total": sum(f[2] for f in filas)}
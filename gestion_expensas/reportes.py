@@ -0,0 +1,112 @@
+"""
+Reportes de cobranza calculados en la base de datos.
+
+Morosidad (aging): saldo pendiente por días de atraso respecto a `vencimiento`,
+por unidad, por bloque y total. Se resuelve con UNA consulta agregada agrupada
+por unidad (sumas condicionales); bloques y total se suman sobre esas filas.
+
+El resultado se cachea por día. Cualquier cambio de saldo (aprobación/rechazo
+de pagos, generación de expensas) llama a invalidar_morosidad(), que sube una
+versión: las claves viejas dejan de leerse y expiran solas.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Expensa
+
+CACHE_TTL = 60 * 60 * 24
+_CLAVE_VERSION = "reportes:morosidad:version"
+
+# (nombre, días mínimos, días máximos) de atraso; None = sin límite
+TRAMOS = (
+    ("0_30", 0, 30),
+    ("31_60", 31, 60),
+    ("61_90", 61, 90),
+    ("90_mas", 91, None),
+)
+_COLUMNAS = ("por_vencer",) + tuple(t[0] for t in TRAMOS) + ("total",)
+
+
+def _version() -> int:
+    return cache.get_or_set(_CLAVE_VERSION, 1, None)
+
+
+def invalidar_morosidad():
+    try:
+        cache.incr(_CLAVE_VERSION)
+    except ValueError:
+        cache.set(_CLAVE_VERSION, 1, None)
+
+
+def _suma(condicion=None):
+    return Coalesce(Sum("saldo", filter=condicion), Value(Decimal("0.00")),
+                    output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _por_unidad(hoy):
+    # días de atraso = hoy - vencimiento  →  tramo [a, b] ⇔ hoy-b <= vencimiento <= hoy-a
+    tramos = {}
+    for nombre, a, b in TRAMOS:
+        cond = Q(vencimiento__lte=hoy - timedelta(days=a))
+        if b is not None:
+            cond &= Q(vencimiento__gte=hoy - timedelta(days=b))
+        tramos[nombre] = _suma(cond)
+    return (Expensa.objects
+            .filter(estado__in=("PENDIENTE", "PARCIAL"), saldo__gt=0)
+            .values("unidad_id", "unidad__codigo", "unidad__bloque")
+            .annotate(
+                por_vencer=_suma(Q(vencimiento__gt=hoy) | Q(vencimiento__isnull=True)),
+                **tramos,
+                total=_suma(),
+                expensas=Count("id"),
+                periodo_mas_antiguo=Min("periodo"),
+            )
+            .order_by("unidad__bloque", "unidad__codigo"))
+
+
+def _montos_texto(fila):
+    # Igual que los DecimalField de los serializers: montos como texto "123.45"
+    return {k: (f"{v:.2f}" if k in _COLUMNAS else v) for k, v in fila.items()}
+
+
+def _calcular(hoy) -> dict:
+    unidades, bloques = [], {}
+    total = dict.fromkeys(_COLUMNAS, Decimal("0.00"))
+    for fila in _por_unidad(hoy):
+        bloque = fila["unidad__bloque"]
+        unidades.append({
+            "unidad_id": fila["unidad_id"],
+            "unidad": fila["unidad__codigo"],
+            "bloque": bloque,
+            **{c: fila[c] for c in _COLUMNAS},
+            "expensas": fila["expensas"],
+            "periodo_mas_antiguo": f"{fila['periodo_mas_antiguo']:%Y-%m}",
+        })
+        acum = bloques.setdefault(bloque, {"bloque": bloque, **dict.fromkeys(_COLUMNAS, Decimal("0.00")), "unidades": 0})
+        acum["unidades"] += 1
+        for c in _COLUMNAS:
+            acum[c] += fila[c]
+            total[c] += fila[c]
+    return {
+        "fecha": hoy.isoformat(),
+        "tramos": [t[0] for t in TRAMOS],
+        "unidades": [_montos_texto(u) for u in unidades],
+        "bloques": [_montos_texto(b) for b in bloques.values()],
+        "total": _montos_texto({**total, "unidades": len(unidades)}),
+    }
+
+
+def reporte_morosidad(hoy=None, refrescar=False) -> dict:
+    """Reporte de morosidad al día `hoy` (por defecto la fecha local), cacheado por día."""
+    hoy = hoy or timezone.localdate()
+    clave = f"reportes:morosidad:{hoy.isoformat()}:v{_version()}"
+    datos = None if refrescar else cache.get(clave)
+    if datos is None:
+        datos = _calcular(hoy)
+        cache.set(clave, datos, CACHE_TTL)
+    return datos
@@ -0,0 +1,188 @@
+"""
+Mantenimiento incremental de ResumenCobranza (periodo, bloque).
+
+Toda operación que cambia expensas corre dentro de `cambios_resumen(ids)`:
+se agrega el aporte de esas expensas antes y después del cambio y la diferencia
+se suma al resumen con un único INSERT ... ON CONFLICT DO UPDATE, en la misma
+transacción. El costo depende de cuántas expensas se tocan, no del tamaño de
+la tabla.
+
+`cobrado` depende de los pagos, no de la expensa: quien aprueba o des-aprueba
+pagos lo informa como `cobrado={expensa_id: variación}`.
+
+Las expensas ya existentes deben estar bloqueadas (select_for_update) antes de
+entrar, para que la foto "antes" no quede vieja.
+"""
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from unidad_pertenencia.models import Unidad
+from .models import AsignacionPago, Expensa, Pago, ResumenCobranza
+
+CAMPOS = ("facturado", "cobrado", "saldo", "n_pendiente", "n_parcial", "n_pagada", "n_anulada")
+
+_T_RESUMEN = ResumenCobranza._meta.db_table
+
+
+def sql_cobrado(condicion="TRUE") -> str:
+    """
+    Subconsulta (expensa_id, monto) con lo cobrado por expensa: pagos simples
+    APROBADOS por su expensa y pagos `distribuir` por sus asignaciones.
+    `condicion` se aplica a `expensa_id` en ambas ramas (p.ej. un rango de ids).
+    """
+    return f"""
+        SELECT expensa_id, SUM(monto) AS monto FROM (
+            SELECT expensa_id, monto_bs AS monto FROM {Pago._meta.db_table}
+            WHERE estado = 'APROBADO' AND NOT distribuir AND {condicion}
+            UNION ALL
+            SELECT expensa_id, monto FROM {AsignacionPago._meta.db_table}
+            WHERE {condicion}
+        ) aprobados GROUP BY expensa_id
+    """
+
+
+def _agregado(filtro="", params=(), cobrado=None, cobrado_desde_pagos=False) -> dict:
+    """{(periodo, bloque): [facturado, cobrado, saldo, n_pendiente, n_parcial, n_pagada, n_anulada]}"""
+    join, join_params, col_cobrado = "", [], "0"
+    if cobrado_desde_pagos:
+        join = f"LEFT JOIN ({sql_cobrado()}) c ON c.expensa_id = e.id"
+        col_cobrado = "COALESCE(SUM(c.monto), 0)"
+    elif cobrado:
+        join = "LEFT JOIN unnest(%s::bigint[], %s::numeric[]) AS c(expensa_id, monto) ON c.expensa_id = e.id"
+        join_params = [list(cobrado), list(cobrado.values())]
+        col_cobrado = "COALESCE(SUM(c.monto), 0)"
+    sql = f"""
+        SELECT e.periodo, u.bloque,
+            COALESCE(SUM(e.monto_total) FILTER (WHERE e.estado <> 'ANULADA'), 0),
+            {col_cobrado},
+            COALESCE(SUM(e.saldo) FILTER (WHERE e.estado <> 'ANULADA'), 0),
+            COUNT(*) FILTER (WHERE e.estado = 'PENDIENTE'),
+            COUNT(*) FILTER (WHERE e.estado = 'PARCIAL'),
+            COUNT(*) FILTER (WHERE e.estado = 'PAGADA'),
+            COUNT(*) FILTER (WHERE e.estado = 'ANULADA')
+        FROM {Expensa._meta.db_table} e
+        JOIN {Unidad._meta.db_table} u ON u.id = e.unidad_id
+        {join}
+        {filtro}
+        GROUP BY e.periodo, u.bloque
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [*join_params, *params])
+        return {(r[0], r[1]): list(r[2:]) for r in cur.fetchall()}
+
+
+def _foto(expensa_ids, cobrado=None) -> dict:
+    if not expensa_ids:
+        return {}
+    return _agregado("WHERE e.id = ANY(%s::bigint[])", [list(expensa_ids)], cobrado=cobrado)
+
+
+def _upsert(filas: dict, sumar=True):
+    """Escribe {clave: valores} en el resumen; con sumar=True se suman a lo existente."""
+    filas = sorted((k, v) for k, v in filas.items() if any(v))  # orden fijo de bloqueo
+    if not filas:
+        return
+    ahora = timezone.now()
+    marcador = "(" + ", ".join(["%s"] * (len(CAMPOS) + 3)) + ")"
+    if sumar:
+        asignaciones = ", ".join(f"{c} = {_T_RESUMEN}.{c} + EXCLUDED.{c}" for c in CAMPOS)
+    else:
+        asignaciones = ", ".join(f"{c} = EXCLUDED.{c}" for c in CAMPOS)
+    sql = f"""
+        INSERT INTO {_T_RESUMEN} (periodo, bloque, {", ".join(CAMPOS)}, updated_at)
+        VALUES {", ".join([marcador] * len(filas))}
+        ON CONFLICT (periodo, bloque) DO UPDATE SET {asignaciones}, updated_at = EXCLUDED.updated_at
+    """
+    params = []
+    for (periodo, bloque), valores in filas:
+        params += [periodo, bloque, *valores, ahora]
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+
+
+@contextmanager
+def cambios_resumen(expensa_ids=(), cobrado=None):
+    """
+    Envuelve un cambio sobre `expensa_ids` y suma su efecto al resumen al salir.
+    Devuelve la lista de ids: si el bloque crea expensas, que las agregue ahí.
+    """
+    ids = list(expensa_ids)
+    with transaction.atomic():
+        antes = _foto(ids)
+        yield ids
+        despues = _foto(ids, cobrado=cobrado)
+        deltas = {}
+        for clave in antes.keys() | despues.keys():
+            a = antes.get(clave, [0] * len(CAMPOS))
+            d = despues.get(clave, [0] * len(CAMPOS))
+            deltas[clave] = [y - x for x, y in zip(a, d)]
+        _upsert(deltas)
+
+
+def recalcular_resumen(periodo=None, bloque=None):
+    """
+    Recalcula desde cero (expensas + pagos aprobados) las claves indicadas;
+    sin argumentos, todo el resumen. Devuelve lo calculado.
+    """
+    condiciones, params = [], []
+    if periodo is not None:
+        condiciones.append("e.periodo = %s"); params.append(periodo)
+    if bloque is not None:
+        condiciones.append("u.bloque = %s"); params.append(bloque)
+    filtro = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    with transaction.atomic():
+        esperado = _agregado(filtro, params, cobrado_desde_pagos=True)
+        borrar = ResumenCobranza.objects.all()
+        if periodo is not None:
+            borrar = borrar.filter(periodo=periodo)
+        if bloque is not None:
+            borrar = borrar.filter(bloque=bloque)
+        borrar.delete()
+        _upsert(esperado, sumar=False)
+    return esperado
+
+
+def recalcular_claves(claves):
+    """
+    Recalcula desde cero las claves (periodo, bloque) indicadas. Primero bloquea
+    sus filas del resumen: un cambio incremental en curso sobre esas claves espera
+    y suma su diferencia sobre lo recalculado (que no lo incluye).
+    """
+    claves = sorted(set(claves))
+    if not claves:
+        return {}
+    params = [[p for p, _ in claves], [b for _, b in claves]]
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute(f"""
+                SELECT 1 FROM {_T_RESUMEN}
+                WHERE (periodo, bloque) IN (SELECT * FROM unnest(%s::date[], %s::varchar[]))
+                ORDER BY periodo, bloque FOR UPDATE
+            """, params)
+        esperado = _agregado("WHERE (e.periodo, u.bloque) IN (SELECT * FROM unnest(%s::date[], %s::varchar[]))",
+                             params, cobrado_desde_pagos=True)
+        _upsert(esperado, sumar=False)
+    return esperado
+
+
+def calcular_resumen() -> dict:
+    """Resumen completo calculado desde expensas y pagos, sin escribir nada."""
+    return _agregado(cobrado_desde_pagos=True)
+
+
+def leer_resumen() -> dict:
+    return {(r[0], r[1]): list(r[2:])
+            for r in ResumenCobranza.objects.values_list("periodo", "bloque", *CAMPOS)}
+
+
+def diferencias(esperado: dict, actual: dict):
+    """[(clave, campo, actual, esperado)] donde el resumen guardado no coincide."""
+    ceros = [Decimal("0.00")] * 3 + [0] * 4
+    salida = []
+    for clave in sorted(esperado.keys() | actual.keys()):
+        e, a = esperado.get(clave, ceros), actual.get(clave, ceros)
+        salida += [(clave, c, x, y) for c, x, y in zip(CAMPOS, a, e) if x != y]
+    return salida
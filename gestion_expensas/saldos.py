@@ -0,0 +1,88 @@
+"""
+Verificación y corrección de Expensa.saldo / estado.
+
+El saldo se mantiene de forma incremental (señales, lotes, recargos); un
+UPDATE masivo, una edición a mano o una caída a mitad de camino lo desvían sin
+avisar. Aquí se recalcula lo esperado en SQL, por rangos de id:
+
+    saldo  = max(monto_total - cobrado, 0)      (cobrado: ver resumen.sql_cobrado)
+    estado = misma regla que Expensa.recalc_estado
+
+Las ANULADAS no se revisan. La comparación no bloquea nada; la corrección
+bloquea solo las filas con diferencias de cada tramo, en una transacción corta.
+El resumen de cobranza de esos (periodo, bloque) se recalcula desde cero y no
+por diferencia: el desvío pudo no pasar por el resumen (UPDATE a mano) o pasar
+con el mismo error, y sumar la corrección lo desviaría a él.
+"""
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Expensa
+from .reportes import invalidar_morosidad
+from .resumen import recalcular_claves, sql_cobrado
+
+_T_EXPENSA = Expensa._meta.db_table
+
+CHUNK = 50_000
+
+
+def _sql_esperado(condicion_e, condicion_c):
+    return f"""
+        SELECT e.id, e.saldo, e.estado, s.saldo_ok,
+               CASE WHEN s.saldo_ok <= 0 THEN 'PAGADA'
+                    WHEN s.saldo_ok < e.monto_total THEN 'PARCIAL'
+                    ELSE 'PENDIENTE' END AS estado_ok
+        FROM {_T_EXPENSA} e
+        LEFT JOIN ({sql_cobrado(condicion_c)}) c ON c.expensa_id = e.id
+        CROSS JOIN LATERAL (SELECT GREATEST(e.monto_total - COALESCE(c.monto, 0), 0) AS saldo_ok) s
+        WHERE {condicion_e} AND e.estado <> 'ANULADA'
+    """
+
+
+def rango_ids():
+    """(min_id, max_id) de expensas, o (None, None) si no hay."""
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT MIN(id), MAX(id) FROM {_T_EXPENSA}")
+        return cur.fetchone()
+
+
+def diferencias_saldo(desde, hasta):
+    """
+    [(id, saldo, estado, saldo_esperado, estado_esperado)] con desde <= id < hasta
+    donde lo guardado no coincide. Una consulta agregada por tramo.
+    """
+    sql = f"""
+        SELECT * FROM ({_sql_esperado("e.id >= %s AND e.id < %s", "expensa_id >= %s AND expensa_id < %s")}) x
+        WHERE x.saldo <> x.saldo_ok OR x.estado <> x.estado_ok
+        ORDER BY x.id
+    """
+    with connection.cursor() as cur:
+        # tres pares (desde, hasta): las dos ramas del cobrado y el filtro de expensas
+        cur.execute(sql, [desde, hasta, desde, hasta, desde, hasta])
+        return cur.fetchall()
+
+
+def corregir_saldos(expensa_ids):
+    """
+    Reescribe saldo y estado de las expensas indicadas con lo esperado, con las filas
+    bloqueadas y recalculando dentro de la misma transacción; si alguna cambió, rehace
+    el resumen de sus (periodo, bloque). Devuelve cuántas cambiaron.
+    """
+    ids = sorted(expensa_ids)
+    if not ids:
+        return 0
+    with transaction.atomic():
+        claves = list(Expensa.objects.select_for_update(of=("self",)).filter(pk__in=ids).order_by("pk")
+                      .values_list("periodo", "unidad__bloque"))
+        sql = f"""
+            UPDATE {_T_EXPENSA} e SET saldo = x.saldo_ok, estado = x.estado_ok, updated_at = %s
+            FROM ({_sql_esperado("e.id = ANY(%s::bigint[])", "expensa_id = ANY(%s::bigint[])")}) x
+            WHERE e.id = x.id AND (e.saldo <> x.saldo_ok OR e.estado <> x.estado_ok)
+        """
+        with connection.cursor() as cur:
+            cur.execute(sql, [timezone.now(), ids, ids, ids])
+            n = cur.rowcount
+        if n:
+            recalcular_claves(claves)
+            transaction.on_commit(invalidar_morosidad)
+    return n
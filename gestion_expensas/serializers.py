@@ -1,5 +1,7 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Expensa, Pago
+from .comprobantes import encolar, guardar_comprobante
+from .models import AsignacionPago, Expensa, MovimientoCuenta, Pago
 
 class ExpensaSerializer(serializers.ModelSerializer):
     unidad_codigo = serializers.CharField(source="unidad.codigo", read_only=True)
@@ -11,19 +13,64 @@ class ExpensaSerializer(serializers.ModelSerializer):
 class PagoCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pago
-        fields = ["id","expensa","monto_bs","metodo","referencia","comprobante","estado","created_at"]
-        read_only_fields = ["estado","created_at"]
+        fields = ["id","expensa","monto_bs","metodo","referencia","comprobante","comprobante_repetido",
+                  "distribuir","estado","created_at"]
+        read_only_fields = ["comprobante_repetido","estado","created_at"]
     def create(self, validated_data):
         validated_data["usuario"] = self.context["request"].user
         # Fuerza estado inicial PENDIENTE
         validated_data["estado"] = "PENDIENTE"
-        return super().create(validated_data)
+        archivo = validated_data.pop("comprobante", None)
+        # la ruta del comprobante y el pago, en la misma transacción (ver comprobantes.guardar_comprobante)
+        with transaction.atomic():
+            if archivo:
+                # Guardado por contenido; la miniatura se genera después del commit
+                validated_data.update(guardar_comprobante(archivo))
+                if not validated_data["comprobante_miniatura"]:
+                    encolar(validated_data["comprobante_sha256"])
+            return super().create(validated_data)
+
+class AsignacionPagoSerializer(serializers.ModelSerializer):
+    expensa_periodo = serializers.DateField(source="expensa.periodo", read_only=True)
+    class Meta:
+        model = AsignacionPago
+        fields = ["expensa","expensa_periodo","monto"]
 
 class PagoListSerializer(serializers.ModelSerializer):
     usuario_username = serializers.CharField(source="usuario.username", read_only=True)
     expensa_periodo = serializers.DateField(source="expensa.periodo", read_only=True)
     unidad_codigo = serializers.CharField(source="expensa.unidad.codigo", read_only=True)
+    # Solo pagos `distribuir` aprobados; pedir con prefetch_related("asignaciones__expensa")
+    asignaciones = AsignacionPagoSerializer(many=True, read_only=True)
+    # En listados va la miniatura (el original mientras no esté procesado);
+    # el archivo completo en `comprobante_completo`
+    comprobante = serializers.SerializerMethodField()
+    comprobante_completo = serializers.FileField(source="comprobante", read_only=True)
     class Meta:
         model = Pago
         fields = ["id","expensa","expensa_periodo","unidad_codigo","usuario","usuario_username",
-                  "monto_bs","metodo","referencia","comprobante","estado","created_at"]
+                  "monto_bs","metodo","referencia","comprobante","comprobante_completo","comprobante_repetido",
+                  "distribuir","asignaciones","estado","created_at"]
+    def get_comprobante(self, obj):
+        archivo = obj.comprobante_miniatura or obj.comprobante
+        if not archivo:
+            return None
+        request = self.context.get("request")
+        return request.build_absolute_uri(archivo.url) if request else archivo.url
+
+class ResumenCobranzaSerializer(serializers.Serializer):
+    # Sirve para filas del modelo y para filas agregadas por periodo (sin bloque)
+    periodo = serializers.DateField()
+    bloque = serializers.CharField(required=False)
+    facturado = serializers.DecimalField(max_digits=14, decimal_places=2)
+    cobrado = serializers.DecimalField(max_digits=14, decimal_places=2)
+    saldo = serializers.DecimalField(max_digits=14, decimal_places=2)
+    n_pendiente = serializers.IntegerField()
+    n_parcial = serializers.IntegerField()
+    n_pagada = serializers.IntegerField()
+    n_anulada = serializers.IntegerField()
+
+class MovimientoCuentaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MovimientoCuenta
+        fields = ["id","fecha","tipo","monto","saldo","expensa","pago","recargo","glosa"]
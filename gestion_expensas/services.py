@@ -0,0 +1,394 @@
+from calendar import monthrange
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from unidad_pertenencia.models import Unidad
+from . import cuenta
+from .models import AsignacionPago, Expensa, Pago, Recargo
+from .reportes import invalidar_morosidad
+from .resumen import cambios_resumen
+from .tarifas import tabla_tarifas
+
+
+def last_day_of_month(d: date) -> date:
+    return date(d.year, d.month, monthrange(d.year, d.month)[1])
+
+
+# =============== Motor de generación de expensas (set-based) ===============
+#
+# En lugar de un get_or_create por unidad, cada periodo se resuelve con pocas
+# sentencias sobre el conjunto de unidades:
+#   1) INSERT ... SELECT ... ON CONFLICT (unidad_id, periodo) DO NOTHING RETURNING id
+#   2) con sobrescribir: UPDATE ... FROM <objetivo> RETURNING id
+#      sin sobrescribir: SELECT de las existentes (omitidas)
+# El CTE "objetivo" calcula (unidad_id, monto, glosa) para todas las unidades:
+# las reglas del periodo (ver tarifas.TablaTarifas) van como tabla VALUES y cada
+# unidad toma la de su tipo o, si no hay, la general; monto = fijo + m2 * area_m2.
+
+def _objetivo_sql(unidades, tabla, periodo):
+    sub_sql, sub_params = unidades.order_by().values("id").query.sql_with_params()
+    reglas, params = [], []
+    for tipo, t in tabla.reglas():
+        reglas.append("(%s::varchar, %s::numeric, %s::numeric, %s::varchar)")
+        params += [tipo, t.monto_bs, t.monto_m2, f"{t.nombre} {periodo:%Y-%m}"]
+    sql = f"""
+        WITH reglas (tipo, monto, monto_m2, glosa) AS (VALUES {", ".join(reglas)}),
+        objetivo AS (
+            SELECT u.id AS unidad_id,
+                   ROUND(COALESCE(rt.monto, rg.monto) + COALESCE(rt.monto_m2, rg.monto_m2) * u.area_m2, 2) AS monto,
+                   COALESCE(rt.glosa, rg.glosa) AS glosa
+            FROM {Unidad._meta.db_table} u
+            LEFT JOIN reglas rt ON rt.tipo = u.tipo_unidad
+            LEFT JOIN reglas rg ON rg.tipo IS NULL
+            WHERE u.id IN ({sub_sql}) AND COALESCE(rt.monto, rg.monto) IS NOT NULL
+        )
+    """
+    return sql, [*params, *sub_params]
+
+
+def _insertar(cte_sql, cte_params, periodo, vencimiento, ahora):
+    sql = cte_sql + f"""
+        INSERT INTO {Expensa._meta.db_table}
+            (unidad_id, periodo, vencimiento, monto_total, saldo, estado, glosa, created_at, updated_at)
+        SELECT o.unidad_id, %s, %s, o.monto, o.monto, 'PENDIENTE', o.glosa, %s, %s
+        FROM objetivo o
+        ON CONFLICT (unidad_id, periodo) DO NOTHING
+        RETURNING id
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [*cte_params, periodo, vencimiento, ahora, ahora])
+        return [r[0] for r in cur.fetchall()]
+
+
+def _sobrescribir(cte_sql, cte_params, periodo, vencimiento, ahora, ids):
+    # monto_nuevo = tarifa + recargos vigentes de la expensa (revertir_recargos los descuenta después).
+    # El saldo conserva lo ya pagado: saldo_nuevo = saldo + (monto_nuevo - monto_anterior), mínimo 0.
+    # En el SET, e.saldo / e.monto_total son los valores previos a la actualización.
+    monto_nuevo = "o.monto + COALESCE(rc.monto, 0)"
+    saldo_nuevo = f"GREATEST(e.saldo + {monto_nuevo} - e.monto_total, 0)"
+    sql = cte_sql + f"""
+        UPDATE {Expensa._meta.db_table} e SET
+            vencimiento = %s,
+            monto_total = {monto_nuevo},
+            saldo = {saldo_nuevo},
+            estado = CASE
+                WHEN e.estado = 'ANULADA' THEN e.estado
+                WHEN {saldo_nuevo} <= 0 THEN 'PAGADA'
+                WHEN {saldo_nuevo} < {monto_nuevo} THEN 'PARCIAL'
+                ELSE 'PENDIENTE'
+            END,
+            glosa = o.glosa,
+            updated_at = %s
+        FROM objetivo o
+        JOIN {Expensa._meta.db_table} previa ON previa.unidad_id = o.unidad_id AND previa.periodo = %s
+        LEFT JOIN (
+            SELECT expensa_id, SUM(monto) AS monto FROM {Recargo._meta.db_table}
+            WHERE expensa_id = ANY(%s::bigint[]) AND NOT revertido
+            GROUP BY expensa_id
+        ) rc ON rc.expensa_id = previa.id
+        WHERE e.id = previa.id AND e.id = ANY(%s::bigint[])
+        RETURNING e.id, e.unidad_id,
+                  CASE WHEN previa.estado = 'ANULADA' THEN 0 ELSE {monto_nuevo} - previa.monto_total END
+    """
+    # `previa` es la misma fila leída antes del UPDATE: da el monto anterior para la cuenta
+    with connection.cursor() as cur:
+        cur.execute(sql, [*cte_params, vencimiento, ahora, periodo, ids, ids])
+        return cur.fetchall()
+
+
+def _existentes(cte_sql, cte_params, periodo, bloquear=False):
+    sql = cte_sql + f"""
+        SELECT e.id FROM {Expensa._meta.db_table} e
+        JOIN objetivo o ON o.unidad_id = e.unidad_id
+        WHERE e.periodo = %s
+        ORDER BY e.id
+        {"FOR UPDATE OF e" if bloquear else ""}
+    """
+    with connection.cursor() as cur:
+        cur.execute(sql, [*cte_params, periodo])
+        return [r[0] for r in cur.fetchall()]
+
+
+def generar_expensas(periodo: date, vencimiento: date = None, sobrescribir=False,
+                     unidades=None, tarifas=None):
+    """
+    Genera (y opcionalmente actualiza) las expensas de `periodo` para `unidades`
+    (queryset de Unidad; por defecto todas las activas), con las tarifas del
+    periodo (`tarifas`: TablaTarifas; por defecto la resuelta y cacheada).
+
+    Devuelve {"creadas": [ids], "actualizadas": [ids], "omitidas": [ids],
+    "sin_tarifa": [ids de unidades cuyo tipo no tiene tarifa ni hay general]}.
+    Lanza ValueError si no hay ninguna tarifa vigente para el periodo.
+    """
+    tabla = tarifas if tarifas is not None else tabla_tarifas(periodo)
+    if not tabla:
+        raise ValueError("No existe una tarifa activa vigente para ese periodo.")
+    if unidades is None:
+        unidades = Unidad.objects.filter(estado="activa")
+    vencimiento = vencimiento or last_day_of_month(periodo)
+    ahora = timezone.now()
+
+    sin_tarifa = []
+    if tabla.general is None:
+        sin_tarifa = list(unidades.exclude(tipo_unidad__in=list(tabla.por_tipo)).values_list("id", flat=True))
+
+    cte_sql, cte_params = _objetivo_sql(unidades, tabla, periodo)
+    with transaction.atomic():
+        # Las que ya existían: se bloquean si se van a sobrescribir (foto del resumen)
+        previas = _existentes(cte_sql, cte_params, periodo, bloquear=sobrescribir)
+        with cambios_resumen(previas if sobrescribir else []) as tocadas:
+            creadas = _insertar(cte_sql, cte_params, periodo, vencimiento, ahora)
+            tocadas += creadas
+            if sobrescribir:
+                filas = _sobrescribir(cte_sql, cte_params, periodo, vencimiento, ahora, previas)
+                actualizadas = [f[0] for f in filas]
+                omitidas = []
+            else:
+                filas, actualizadas = [], []
+                omitidas = previas
+        cuenta.registrar_cargos(creadas)
+        cuenta.registrar([(unidad_id, "AJUSTE", delta, eid, None, None, f"Ajuste expensa {periodo:%Y-%m}")
+                          for eid, unidad_id, delta in filas])
+        if creadas or actualizadas:
+            transaction.on_commit(invalidar_morosidad)
+    return {"creadas": creadas, "actualizadas": actualizadas, "omitidas": omitidas, "sin_tarifa": sin_tarifa}
+
+
+# =============== Estado de expensas en bloque ===============
+
+def recalcular_estado_expensas(expensa_ids):
+    """
+    Misma regla que Expensa.recalc_estado, pero para muchas expensas en un solo UPDATE.
+    Las ANULADAS no se tocan.
+    """
+    if not expensa_ids:
+        return 0
+    return (Expensa.objects
+            .filter(pk__in=expensa_ids)
+            .exclude(estado="ANULADA")
+            .update(
+                estado=Case(
+                    When(saldo__lte=0, then=Value("PAGADA")),
+                    When(saldo__lt=F("monto_total"), then=Value("PARCIAL")),
+                    default=Value("PENDIENTE"),
+                ),
+                saldo=Case(When(saldo__lte=0, then=Value(Decimal("0.00"))), default=F("saldo")),
+                updated_at=timezone.now(),
+            ))
+
+
+# =============== Aprobación / rechazo de pagos en lote ===============
+
+ACCIONES_PAGO = {"aprobar": "APROBADO", "rechazar": "RECHAZADO"}
+
+
+_T_EXPENSA = Expensa._meta.db_table
+
+
+def _repartir(pagos, filas, deltas):
+    """
+    Reparte cada pago `distribuir` entre las expensas abiertas de su unidad, de la
+    más antigua a la más nueva, sobre el saldo ya corregido por `deltas` (que se
+    actualiza). `filas`: {expensa_id: (unidad_id, periodo, saldo, estado)} bloqueadas.
+    Devuelve (asignaciones sin guardar, {pago_id: monto sin asignar}).
+    """
+    por_unidad = defaultdict(list)
+    for eid, (unidad_id, periodo, _, estado) in filas.items():
+        if estado != "ANULADA":
+            por_unidad[unidad_id].append((periodo, eid))
+    for lista in por_unidad.values():
+        lista.sort()
+    asignaciones, sobrantes = [], {}
+    for pago in sorted(pagos, key=lambda p: p.pk):
+        restante = pago.monto_bs
+        for _, eid in por_unidad[filas[pago.expensa_id][0]]:
+            if restante <= 0:
+                break
+            disponible = filas[eid][2] + deltas[eid]
+            if disponible <= 0:
+                continue
+            monto = min(restante, disponible)
+            deltas[eid] -= monto
+            restante -= monto
+            asignaciones.append(AsignacionPago(pago_id=pago.pk, expensa_id=eid, monto=monto))
+        sobrantes[pago.pk] = restante
+    return asignaciones, sobrantes
+
+
+def _mover_saldos(deltas, liberar=(), repartir=()):
+    """
+    Aplica de una vez, con las expensas bloqueadas:
+      - `deltas` {expensa_id: variación de saldo} de pagos simples,
+      - la reposición de las asignaciones de los pagos `liberar` (que se borran),
+      - el reparto de los pagos `repartir` (instancias `distribuir`, ya bloqueadas).
+    Un UPDATE para todos los saldos y otro para los estados; el resumen recibe
+    lo cobrado como la baja neta de saldo. Devuelve {pago_id: monto sin asignar}.
+    """
+    deltas = defaultdict(Decimal, deltas)
+    liberadas = []
+    if liberar:
+        for aid, eid, monto in (AsignacionPago.objects.filter(pago_id__in=list(liberar))
+                                .values_list("id", "expensa_id", "monto")):
+            deltas[eid] += monto
+            liberadas.append(aid)
+
+    condicion = Q(pk__in=list(deltas))
+    if repartir:
+        anclas = {p.expensa_id for p in repartir}
+        unidades = set(Expensa.objects.filter(pk__in=anclas).values_list("unidad_id", flat=True))
+        condicion |= Q(pk__in=anclas) | Q(unidad_id__in=unidades, estado__in=("PENDIENTE", "PARCIAL"))
+    filas = {}
+    if deltas or repartir:
+        filas = {r[0]: r[1:] for r in (Expensa.objects.select_for_update().filter(condicion).order_by("pk")
+                                       .values_list("pk", "unidad_id", "periodo", "saldo", "estado"))}
+    asignaciones, sobrantes = _repartir(repartir, filas, deltas) if repartir else ([], {})
+
+    afectadas = sorted(eid for eid, d in deltas.items() if d and eid in filas)
+    # lo que baja el saldo es lo que sube lo cobrado
+    with cambios_resumen(afectadas, cobrado={eid: -deltas[eid] for eid in afectadas}):
+        if liberadas:
+            AsignacionPago.objects.filter(pk__in=liberadas).delete()
+        if asignaciones:
+            AsignacionPago.objects.bulk_create(asignaciones)
+        if afectadas:
+            with connection.cursor() as cur:
+                cur.execute(
+                    f"""UPDATE {_T_EXPENSA} e SET saldo = e.saldo + d.delta
+                        FROM unnest(%s::bigint[], %s::numeric[]) AS d(id, delta)
+                        WHERE e.id = d.id""",
+                    [afectadas, [deltas[eid] for eid in afectadas]],
+                )
+            recalcular_estado_expensas(afectadas)
+    if afectadas:
+        transaction.on_commit(invalidar_morosidad)
+    return sobrantes
+
+
+def _pago_id(valor) -> int:
+    """El id como int; 1.9, True o "1.9" no son ids (int() los truncaría)."""
+    if isinstance(valor, bool) or not isinstance(valor, (int, str)):
+        raise TypeError(f"id de pago inválido: {valor!r}")
+    if isinstance(valor, str) and not valor.strip().isdecimal():
+        raise ValueError(f"id de pago inválido: {valor!r}")
+    return int(valor)
+
+
+def cambiar_estado_pagos(pago_ids, nuevo_estado, desde=None, revisor=None):
+    """
+    Cambia el estado de varios pagos en una transacción.
+
+    - Bloquea los pagos y luego sus expensas (siempre en ese orden y por pk).
+    - Agrupa por expensa la variación neta de saldo (aprobar descuenta,
+      des-aprobar repone) y la aplica con un solo UPDATE.
+    - Los pagos `distribuir` se reparten al aprobarse entre las expensas abiertas
+      de la unidad (la más antigua primero); al des-aprobarse se borran sus
+      asignaciones y se repone cada saldo, todo en el mismo paso.
+    - Recalcula el estado de todas las expensas afectadas en un solo UPDATE.
+
+    Los pagos se actualizan con queryset.update(): no pasan por las señales de
+    Pago, el saldo ya queda ajustado aquí.
+    Con `desde` (estados), solo cambian los pagos que estén en alguno de ellos.
+    Con `revisor`, no cambian los pagos que otro revisor tiene reservados en la
+    cola de revisión (cola.py); los que cambian quedan a nombre de `revisor`.
+    Devuelve una lista de resultados por id, en el orden recibido; un id que no
+    sea entero (1.9, "abc") lanza TypeError/ValueError sin tocar nada.
+    """
+    ids = list(dict.fromkeys(_pago_id(i) for i in pago_ids))
+    resultados = []
+    with transaction.atomic():
+        pagos = {p.pk: p for p in Pago.objects.select_for_update().filter(pk__in=ids).order_by("pk")}
+        ahora = timezone.now()
+        deltas = defaultdict(Decimal)
+        liberar, repartir, cambiados, des_aprobados = [], [], [], []
+        for pid in ids:
+            p = pagos.get(pid)
+            if p is None:
+                resultados.append({"id": pid, "ok": False, "cambiado": False, "estado": None, "detalle": "Pago no existe."})
+                continue
+            if p.estado == nuevo_estado:
+                resultados.append({"id": pid, "ok": True, "cambiado": False, "estado": p.estado, "detalle": "Sin cambios."})
+                continue
+            if desde is not None and p.estado not in desde:
+                resultados.append({"id": pid, "ok": False, "cambiado": False, "estado": p.estado,
+                                   "detalle": f"El pago está {p.estado}."})
+                continue
+            if (revisor is not None and p.revisor_id not in (None, revisor.pk)
+                    and p.revision_hasta and p.revision_hasta > ahora):
+                resultados.append({"id": pid, "ok": False, "cambiado": False, "estado": p.estado,
+                                   "detalle": "Otro revisor tiene reservado este pago.", "reservado": True})
+                continue
+            if p.estado == "APROBADO":
+                des_aprobados.append(pid)
+                if p.distribuir:
+                    liberar.append(pid)
+                else:
+                    deltas[p.expensa_id] += p.monto_bs
+            if nuevo_estado == "APROBADO":
+                if p.distribuir:
+                    repartir.append(p)
+                else:
+                    deltas[p.expensa_id] -= p.monto_bs
+            cambiados.append(pid)
+            resultados.append({"id": pid, "ok": True, "cambiado": True, "estado": nuevo_estado,
+                               "detalle": f"{p.estado} -> {nuevo_estado}"})
+
+        if cambiados:
+            # revisado: la reserva de la cola ya no hace falta
+            cambios = {"estado": nuevo_estado, "revision_hasta": None, "updated_at": ahora}
+            if revisor is not None:
+                cambios["revisor"] = revisor
+            Pago.objects.filter(pk__in=cambiados).update(**cambios)
+            # la cuenta de la unidad registra el pago completo (también lo que sobre)
+            if nuevo_estado == "APROBADO":
+                cuenta.registrar_pagos(cambiados)
+            else:
+                cuenta.registrar_pagos(des_aprobados, aprobados=False)
+        sobrantes = _mover_saldos(deltas, liberar, repartir)
+        for r in resultados:
+            if sobrantes.get(r["id"]):
+                r["sin_asignar"] = f"{sobrantes[r['id']]:.2f}"
+                r["detalle"] += f" (sin asignar: {sobrantes[r['id']]:.2f} Bs, la unidad no tiene más deuda)"
+    return resultados
+
+
+def redistribuir_pagos(pago_ids):
+    """
+    Rehace las asignaciones de pagos ya guardados: repone las actuales y, si el
+    pago sigue APROBADO y `distribuir`, lo vuelve a repartir. Lo usan las señales
+    de Pago cuando se edita uno a mano (admin, shell).
+    """
+    with transaction.atomic():
+        pagos = list(Pago.objects.select_for_update().filter(pk__in=list(pago_ids)).order_by("pk"))
+        repartir = [p for p in pagos if p.estado == "APROBADO" and p.distribuir]
+        return _mover_saldos({}, [p.pk for p in pagos], repartir)
+
+
+def liberar_asignaciones(pago_ids):
+    """Borra las asignaciones de los pagos y repone los saldos (p.ej. antes de borrar el pago)."""
+    with transaction.atomic():
+        _mover_saldos({}, list(pago_ids))
+
+
+# =============== Anulación de expensas ===============
+
+def anular_expensas(expensa_ids):
+    """
+    Marca como ANULADAS las expensas indicadas (saldo y monto quedan como estaban;
+    el resumen y la morosidad dejan de contarlas). Devuelve los ids anulados.
+    """
+    with transaction.atomic():
+        ids = list(Expensa.objects.select_for_update()
+                   .filter(pk__in=list(expensa_ids)).exclude(estado="ANULADA")
+                   .order_by("pk").values_list("pk", flat=True))
+        if not ids:
+            return []
+        with cambios_resumen(ids):
+            Expensa.objects.filter(pk__in=ids).update(estado="ANULADA", updated_at=timezone.now())
+        cuenta.registrar_anulaciones(ids)
+        transaction.on_commit(invalidar_morosidad)
+    return ids
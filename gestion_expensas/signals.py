@@ -1,23 +1,67 @@
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Pago
+from unidad_pertenencia.models import Unidad
+from .cuenta import registrar_cambio_expensa, registrar_cambio_pago
+from .models import Expensa, Pago, Tarifa
+from .reportes import invalidar_morosidad
+from .resumen import recalcular_resumen
+from .services import liberar_asignaciones, redistribuir_pagos
+from .tarifas import invalidar_tarifas
 
-@receiver(post_save, sender=Pago)
-def pago_post_save(sender, instance: Pago, created, **kwargs):
-    if created and instance.estado == "APROBADO":
-        instance.aplicar_en_expensa(+1)
+# El estado previo sale de Pago._original (cargado con la instancia), no de otra consulta.
+# Los movimientos se calculan antes de guardar y se aplican después, solo si el save llegó a la BD.
 
 @receiver(pre_save, sender=Pago)
-def pago_pre_save(sender, instance: Pago, **kwargs):
-    if not instance.pk: return
-    prev = Pago.objects.get(pk=instance.pk)
-    if prev.estado != instance.estado:
-        if prev.estado == "APROBADO" and instance.estado != "APROBADO":
-            prev.aplicar_en_expensa(-1)
-        if prev.estado != "APROBADO" and instance.estado == "APROBADO":
-            instance.aplicar_en_expensa(+1)
+def pago_pre_save(sender, instance: Pago, update_fields=None, **kwargs):
+    if instance.pk and instance._original is None:
+        # Instancia armada a mano con pk (no leída de la BD): único caso que consulta
+        instance._original = (Pago.objects.filter(pk=instance.pk)
+                              .values_list(*Pago.CAMPOS_SALDO).first())
+    instance._movimientos = instance.movimientos_saldo(update_fields)
+    instance._reparto = instance.requiere_reparto(update_fields)
+
+@receiver(post_save, sender=Pago)
+def pago_post_save(sender, instance: Pago, created, update_fields=None, **kwargs):
+    movimientos = getattr(instance, "_movimientos", [])
+    for expensa_id, monto in movimientos:
+        instance.aplicar_en_expensa(+1, monto=monto, expensa_id=expensa_id)
+    if movimientos:
+        transaction.on_commit(invalidar_morosidad)
+    if getattr(instance, "_reparto", False):
+        redistribuir_pagos([instance.pk])
+    nuevo = instance._valores_a_guardar(update_fields)
+    registrar_cambio_pago(instance.pk, instance._original, nuevo)
+    instance._movimientos, instance._reparto = [], False
+    instance._original = nuevo
+
+@receiver(pre_delete, sender=Pago)
+def pago_pre_delete(sender, instance: Pago, **kwargs):
+    # Las asignaciones se borran en cascada antes que el pago: se reponen los saldos ahora
+    if instance.distribuir:
+        liberar_asignaciones([instance.pk])
 
 @receiver(post_delete, sender=Pago)
 def pago_post_delete(sender, instance: Pago, **kwargs):
-    if instance.estado == "APROBADO":
-        instance.aplicar_en_expensa(-1)
+    expensa_id, estado, monto, distribuir = instance._original or (
+        instance.expensa_id, instance.estado, instance.monto_bs, instance.distribuir)
+    if estado == "APROBADO" and not distribuir:
+        instance.aplicar_en_expensa(-1, monto=monto, expensa_id=expensa_id)
+        transaction.on_commit(invalidar_morosidad)
+    registrar_cambio_pago(instance.pk, (expensa_id, estado, monto), None)
+
+@receiver(post_delete, sender=Expensa)
+def expensa_post_delete(sender, instance: Expensa, **kwargs):
+    # La instancia puede tener el saldo viejo (sus pagos se borran antes): se recalcula su clave
+    bloque = Unidad.objects.filter(pk=instance.unidad_id).values_list("bloque", flat=True).first()
+    if bloque is not None:
+        recalcular_resumen(periodo=instance.periodo, bloque=bloque)
+        registrar_cambio_expensa(instance, antes=(instance.monto_total, instance.estado), borrada=True)
+    transaction.on_commit(invalidar_morosidad)
+
+@receiver(post_save, sender=Tarifa)
+@receiver(post_delete, sender=Tarifa)
+def tarifa_cambiada(sender, **kwargs):
+    # Ya y al confirmar: una lectura dentro de la misma transacción podría cachear algo que se revierte
+    invalidar_tarifas()
+    transaction.on_commit(invalidar_tarifas)
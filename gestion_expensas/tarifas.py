@@ -0,0 +1,66 @@
+"""
+Resolución de tarifas por periodo.
+
+Para un periodo, cada tipo de unidad usa su Tarifa específica vigente (activa,
+mayor `vigente_desde` <= periodo); los tipos sin tarifa propia usan la general
+vigente (tipo_unidad vacío). Si tampoco hay general, esas unidades no se facturan.
+
+La tabla resuelta queda en una caché del proceso por periodo. Las señales de
+Tarifa (save/delete) la vacían en este proceso; los demás procesos la renuevan
+al vencer CACHE_TTL.
+"""
+import threading
+import time
+
+from .models import Tarifa
+
+CACHE_TTL = 300  # segundos
+
+_cache = {}  # periodo -> (expira, TablaTarifas)
+_lock = threading.Lock()
+
+
+class TablaTarifas:
+    def __init__(self, general=None, por_tipo=None):
+        self.general = general
+        self.por_tipo = dict(por_tipo or {})
+
+    def __bool__(self):
+        return bool(self.general or self.por_tipo)
+
+    def reglas(self):
+        """[(tipo_unidad | None, tarifa)]: la general (si hay) con tipo None."""
+        filas = list(self.por_tipo.items())
+        if self.general:
+            filas.append((None, self.general))
+        return filas
+
+    def describir(self) -> dict:
+        return {tipo or "general": str(t) for tipo, t in self.reglas()}
+
+
+def _resolver(periodo) -> TablaTarifas:
+    tabla = TablaTarifas()
+    for t in (Tarifa.objects.filter(activa=True, vigente_desde__lte=periodo)
+              .order_by("-vigente_desde", "-id")):
+        if t.tipo_unidad:
+            tabla.por_tipo.setdefault(t.tipo_unidad, t)
+        elif tabla.general is None:
+            tabla.general = t
+    return tabla
+
+
+def tabla_tarifas(periodo) -> TablaTarifas:
+    ahora = time.monotonic()
+    item = _cache.get(periodo)
+    if item and item[0] > ahora:
+        return item[1]
+    tabla = _resolver(periodo)
+    with _lock:
+        _cache[periodo] = (ahora + CACHE_TTL, tabla)
+    return tabla
+
+
+def invalidar_tarifas():
+    with _lock:
+        _cache.clear()
@@ -1,3 +1,1026 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from unidad_pertenencia.models import Unidad
+from users.models import Rol, Usuario
+from . import cola, conciliacion, exportacion, saldos
+from .comprobantes import guardar_comprobante, procesar_comprobante
+from .filtros import filtrar_expensas, filtrar_pagos, rango_periodo
+from .models import (AsignacionPago, CuentaUnidad, Expensa, MovimientoCuenta, Pago, PoliticaRecargo, Recargo,
+                     ResumenCobranza, Tarifa)
+from .recargos import aplicar_recargos, revertir_recargos
+from .resumen import diferencias, leer_resumen, recalcular_resumen
+from .services import cambiar_estado_pagos, generar_expensas
+
+
+def crear_usuario(rol, username="admin"):
+    rol, _ = Rol.objects.get_or_create(name=rol)
+    return Usuario.objects.create_user(username=username, password="clave123", email=f"{username}@test.bo",
+                                       ci=f"ci-{username}", idRol=rol)
+
+
+def crear_unidades(n, bloque="A"):
+    return Unidad.objects.bulk_create(
+        Unidad(codigo=f"{bloque}-{i:05d}", bloque=bloque, piso=i // 100, numero=str(i), area_m2=Decimal("80.00"))
+        for i in range(n))
+
+
+def crear_expensas(unidades, periodo, monto=Decimal("100.00"), **extra):
+    return Expensa.objects.bulk_create(
+        Expensa(unidad=u, periodo=periodo, monto_total=monto, saldo=monto, **extra) for u in unidades)
+
+
+# =============== Saldo de expensas por los pagos ===============
+
+class SaldoPagosTests(TestCase):
+    """
+    El pre_save/post_save de Pago mueve el saldo según Pago._original (lo leído de
+    la BD) y movimientos_saldo(): cualquier secuencia de cambios deja
+    saldo = monto_total - pagos aprobados - asignaciones de pagos `distribuir`.
+    """
+
+    def setUp(self):
+        self.usuario = crear_usuario("Copropietario", "a101")
+        self.e1, self.e2 = crear_expensas(crear_unidades(2), date(2025, 9, 1))
+
+    def nuevo_pago(self, monto="40.00", estado="PENDIENTE", expensa=None, **extra):
+        return Pago.objects.create(expensa=expensa or self.e1, usuario=self.usuario, monto_bs=Decimal(monto),
+                                   estado=estado, **extra)
+
+    def assertSaldo(self, expensa, esperado, estado=None):
+        expensa.refresh_from_db()
+        self.assertEqual(expensa.saldo, Decimal(esperado))
+        aprobados = sum(Pago.objects.filter(expensa=expensa, estado="APROBADO", distribuir=False)
+                        .values_list("monto_bs", flat=True), Decimal("0"))
+        aprobados += sum(AsignacionPago.objects.filter(expensa=expensa).values_list("monto", flat=True), Decimal("0"))
+        self.assertEqual(expensa.saldo, max(expensa.monto_total - aprobados, Decimal("0")))
+        if estado:
+            self.assertEqual(expensa.estado, estado)
+
+    def test_aprobar_y_desaprobar_repetido(self):
+        pago = self.nuevo_pago()
+        for _ in range(3):
+            pago.estado = "APROBADO"
+            pago.save()
+            self.assertSaldo(self.e1, "60.00", "PARCIAL")
+            pago.estado = "RECHAZADO"
+            pago.save()
+            self.assertSaldo(self.e1, "100.00", "PENDIENTE")
+
+    def test_guardar_dos_veces_sin_cambios_no_descuenta_de_nuevo(self):
+        pago = self.nuevo_pago(estado="APROBADO")
+        pago.save()
+        pago.referencia = "otra"
+        pago.save()
+        Pago.objects.get(pk=pago.pk).save()
+        self.assertSaldo(self.e1, "60.00")
+
+    def test_editar_monto_de_un_pago_aprobado(self):
+        pago = self.nuevo_pago(estado="APROBADO")
+        pago.monto_bs = Decimal("100.00")
+        pago.save()
+        self.assertSaldo(self.e1, "0.00", "PAGADA")
+        pago.monto_bs = Decimal("25.00")
+        pago.save()
+        self.assertSaldo(self.e1, "75.00", "PARCIAL")
+
+    def test_mover_un_pago_aprobado_a_otra_expensa(self):
+        pago = self.nuevo_pago(estado="APROBADO")
+        pago.expensa = self.e2
+        pago.save()
+        self.assertSaldo(self.e1, "100.00", "PENDIENTE")
+        self.assertSaldo(self.e2, "60.00", "PARCIAL")
+        # mover y cambiar el monto a la vez
+        pago.expensa, pago.monto_bs = self.e1, Decimal("10.00")
+        pago.save()
+        self.assertSaldo(self.e1, "90.00")
+        self.assertSaldo(self.e2, "100.00")
+
+    def test_update_fields_solo_aplica_los_campos_guardados(self):
+        pago = self.nuevo_pago()
+        # el monto cambia en memoria pero no se guarda: el saldo usa el de la BD
+        pago.estado, pago.monto_bs = "APROBADO", Decimal("90.00")
+        pago.save(update_fields=["estado"])
+        self.assertSaldo(self.e1, "60.00")
+        pago.refresh_from_db()
+        pago.monto_bs = Decimal("30.00")
+        pago.save(update_fields=["monto_bs"])
+        self.assertSaldo(self.e1, "70.00")
+        pago.expensa = self.e2
+        pago.save(update_fields=["referencia"])  # no incluye expensa: nada se mueve
+        self.assertSaldo(self.e1, "70.00")
+        self.assertSaldo(self.e2, "100.00")
+
+    def test_instancia_armada_a_mano_con_pk(self):
+        pago = self.nuevo_pago(estado="APROBADO")
+        copia = Pago(pk=pago.pk, expensa=self.e1, usuario=self.usuario, monto_bs=Decimal("40.00"),
+                     estado="RECHAZADO", created_at=pago.created_at)
+        copia.save()
+        self.assertSaldo(self.e1, "100.00")
+
+    def test_refresh_despues_de_un_update_en_lote(self):
+        pago = self.nuevo_pago()
+        cambiar_estado_pagos([pago.pk], "APROBADO")  # queryset.update(): no pasa por la instancia
+        self.assertSaldo(self.e1, "60.00", "PARCIAL")
+        pago.refresh_from_db()
+        pago.referencia = "revisado"
+        pago.save()
+        self.assertSaldo(self.e1, "60.00", "PARCIAL")
+        cambiar_estado_pagos([pago.pk], "RECHAZADO")
+        pago.refresh_from_db(fields=["estado"])
+        pago.save()
+        self.assertSaldo(self.e1, "100.00", "PENDIENTE")
+
+    def test_lote_rechaza_ids_que_no_son_enteros(self):
+        pago = self.nuevo_pago()
+        for ids in ([pago.pk + 0.9], [True], [f"{pago.pk}.9"], [None]):
+            with self.assertRaises((TypeError, ValueError)):
+                cambiar_estado_pagos(ids, "APROBADO")
+        client = APIClient()
+        client.force_authenticate(crear_usuario("Administrador", "admin-lote"))
+        r = client.post("/gestionexpensas/pagos/lote/", {"ids": [pago.pk + 0.9], "accion": "aprobar"}, format="json")
+        self.assertEqual(r.status_code, 400)
+        self.assertSaldo(self.e1, "100.00", "PENDIENTE")
+        r = client.post("/gestionexpensas/pagos/lote/", {"ids": [str(pago.pk)], "accion": "aprobar"}, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertSaldo(self.e1, "60.00", "PARCIAL")
+
+    def test_borrar_un_pago_aprobado_repone_el_saldo(self):
+        self.nuevo_pago(estado="APROBADO").delete()
+        self.nuevo_pago(monto="10.00", estado="APROBADO")
+        self.assertSaldo(self.e1, "90.00")
+
+    def test_pago_distribuir_usa_asignaciones(self):
+        # a cuenta de la unidad: cubre su expensa más antigua y sigue con la siguiente
+        octubre, = crear_expensas([self.e1.unidad], date(2025, 10, 1))
+        pago = self.nuevo_pago(monto="150.00", estado="APROBADO", distribuir=True)
+        asignado = dict(AsignacionPago.objects.filter(pago=pago).values_list("expensa_id", "monto"))
+        self.assertEqual(asignado, {self.e1.pk: Decimal("100.00"), octubre.pk: Decimal("50.00")})
+        self.assertSaldo(self.e1, "0.00", "PAGADA")
+        octubre.refresh_from_db()
+        self.assertEqual(octubre.saldo, Decimal("50.00"))
+        for _ in range(2):
+            pago.estado = "RECHAZADO"
+            pago.save()
+            self.assertFalse(AsignacionPago.objects.filter(pago=pago).exists())
+            self.assertSaldo(self.e1, "100.00", "PENDIENTE")
+            pago.estado = "APROBADO"
+            pago.save()
+            self.assertSaldo(self.e1, "0.00", "PAGADA")
+        octubre.refresh_from_db()
+        self.assertEqual(octubre.saldo, Decimal("50.00"))
+
+
+
+class RepartoPagosTests(TestCase):
+    """Aprobación en lote de pagos `distribuir` (services._repartir/_mover_saldos) y su resumen."""
+
+    def setUp(self):
+        self.usuario = crear_usuario("Copropietario", "a101")
+        unidad, otra = crear_unidades(2)
+        self.meses = [crear_expensas([unidad], date(2025, m, 1))[0] for m in (7, 8, 9)]
+        self.ajena, = crear_expensas([otra], date(2025, 7, 1))
+        recalcular_resumen()
+
+    def pago(self, monto):
+        # anclado a la expensa más nueva: el reparto igual empieza por la más antigua
+        return Pago.objects.create(expensa=self.meses[-1], usuario=self.usuario, monto_bs=Decimal(monto),
+                                   distribuir=True)
+
+    def estado(self):
+        return [(str(e.saldo), e.estado) for e in Expensa.objects.filter(pk__in=[m.pk for m in self.meses])
+                .order_by("periodo")]
+
+    def assertResumenAlDia(self):
+        guardado = leer_resumen()
+        self.assertEqual(diferencias(recalcular_resumen(), guardado), [])
+
+    def test_reparte_tres_meses_del_mas_antiguo(self):
+        pago = self.pago("250.00")
+        r, = cambiar_estado_pagos([pago.pk], "APROBADO")
+        self.assertNotIn("sin_asignar", r)
+        self.assertEqual(list(AsignacionPago.objects.filter(pago=pago).order_by("expensa__periodo")
+                              .values_list("expensa_id", "monto")),
+                         [(self.meses[0].pk, Decimal("100.00")), (self.meses[1].pk, Decimal("100.00")),
+                          (self.meses[2].pk, Decimal("50.00"))])
+        self.assertEqual(self.estado(), [("0.00", "PAGADA"), ("0.00", "PAGADA"), ("50.00", "PARCIAL")])
+        self.assertEqual(Expensa.objects.get(pk=self.ajena.pk).saldo, Decimal("100.00"))
+        self.assertResumenAlDia()
+
+    def test_excedente_queda_sin_asignar(self):
+        pago = self.pago("340.00")
+        r, = cambiar_estado_pagos([pago.pk], "APROBADO")
+        self.assertEqual(r["sin_asignar"], "40.00")
+        self.assertEqual(AsignacionPago.objects.filter(pago=pago).aggregate(s=Sum("monto"))["s"], Decimal("300.00"))
+        self.assertEqual(self.estado(), [("0.00", "PAGADA")] * 3)
+        self.assertResumenAlDia()
+
+    def test_rechazar_repone_cada_saldo(self):
+        primero, segundo = self.pago("150.00"), self.pago("120.00")
+        cambiar_estado_pagos([primero.pk, segundo.pk], "APROBADO")
+        self.assertEqual(self.estado(), [("0.00", "PAGADA"), ("0.00", "PAGADA"), ("30.00", "PARCIAL")])
+        cambiar_estado_pagos([primero.pk], "RECHAZADO")
+        self.assertFalse(AsignacionPago.objects.filter(pago=primero).exists())
+        # el segundo conserva sus asignaciones: lo que liberó el primero queda como deuda
+        self.assertEqual(self.estado(), [("100.00", "PENDIENTE"), ("50.00", "PARCIAL"), ("30.00", "PARCIAL")])
+        self.assertResumenAlDia()
+        cambiar_estado_pagos([segundo.pk], "RECHAZADO")
+        self.assertEqual(self.estado(), [("100.00", "PENDIENTE")] * 3)
+        self.assertFalse(AsignacionPago.objects.exists())
+        self.assertResumenAlDia()
+        cobrado = ResumenCobranza.objects.aggregate(s=Sum("cobrado"))["s"]
+        self.assertEqual(cobrado, Decimal("0.00"))
+
+
+
+class RecalcularSaldosTests(TestCase):
+    """saldos.diferencias_saldo / corregir_saldos ante un saldo desviado por fuera de la app."""
+
+    def setUp(self):
+        usuario = crear_usuario("Copropietario", "a101")
+        self.expensas = crear_expensas(crear_unidades(3), date(2025, 9, 1))
+        self.otro_mes = crear_expensas(crear_unidades(1, bloque="B"), date(2025, 10, 1))[0]
+        pago = Pago.objects.create(expensa=self.expensas[0], usuario=usuario, monto_bs=Decimal("30.00"))
+        cambiar_estado_pagos([pago.pk], "APROBADO")
+        recalcular_resumen()
+
+    def desviar(self, expensa, saldo, estado):
+        with connection.cursor() as cur:
+            cur.execute(f"UPDATE {Expensa._meta.db_table} SET saldo = %s, estado = %s WHERE id = %s",
+                        [saldo, estado, expensa.pk])
+
+    def test_detecta_y_corrige_sin_desviar_el_resumen(self):
+        minimo, maximo = saldos.rango_ids()
+        self.assertEqual(saldos.diferencias_saldo(minimo, maximo + 1), [])
+        self.desviar(self.expensas[0], Decimal("100.00"), "PENDIENTE")  # como si no tuviera el pago
+        self.desviar(self.expensas[2], Decimal("40.00"), "PARCIAL")
+        self.desviar(self.otro_mes, Decimal("0.00"), "PAGADA")
+        filas = saldos.diferencias_saldo(minimo, maximo + 1)
+        self.assertEqual([f[1:] for f in filas], [
+            (Decimal("100.00"), "PENDIENTE", Decimal("70.00"), "PARCIAL"),
+            (Decimal("40.00"), "PARCIAL", Decimal("100.00"), "PENDIENTE"),
+            (Decimal("0.00"), "PAGADA", Decimal("100.00"), "PENDIENTE"),
+        ])
+        self.assertEqual([f[0] for f in filas], [self.expensas[0].pk, self.expensas[2].pk, self.otro_mes.pk])
+        # por tramos: el rango es semiabierto
+        self.assertEqual(len(saldos.diferencias_saldo(minimo, self.expensas[2].pk)), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(saldos.corregir_saldos([f[0] for f in filas]), 3)
+        self.assertEqual(saldos.diferencias_saldo(minimo, maximo + 1), [])
+        self.assertEqual(
+            list(Expensa.objects.order_by("pk").values_list("saldo", "estado")),
+            [(Decimal("70.00"), "PARCIAL"), (Decimal("100.00"), "PENDIENTE"), (Decimal("100.00"), "PENDIENTE"),
+             (Decimal("100.00"), "PENDIENTE")])
+        guardado = leer_resumen()
+        self.assertEqual(diferencias(recalcular_resumen(), guardado), [])
+
+    def test_comando_con_fix(self):
+        self.desviar(self.expensas[1], Decimal("1.00"), "PARCIAL")
+        salida = io.StringIO()
+        call_command("recalcular_saldos", stdout=salida)
+        self.assertIn("1 expensas con diferencias; sin cambios", salida.getvalue())
+        call_command("recalcular_saldos", "--fix", "--chunk", "2", stdout=salida)
+        self.assertIn("1 expensas con diferencias; 1 corregidas", salida.getvalue())
+        self.assertEqual(Expensa.objects.get(pk=self.expensas[1].pk).saldo, Decimal("100.00"))
+        guardado = leer_resumen()
+        self.assertEqual(diferencias(recalcular_resumen(), guardado), [])
+
+
+# =============== Generación por chunks ===============
+
+class GenerarExpensasComandoTests(TestCase):
+    """El checkpoint guarda los rangos de ids: reanudar no depende de --tamano ni de las unidades nuevas."""
+
+    def setUp(self):
+        Tarifa.objects.create(monto_bs=Decimal("100.00"), vigente_desde=date(2025, 1, 1))
+        self.unidades = crear_unidades(5)
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        self.checkpoint = os.path.join(carpeta, "progreso.json")
+
+    def generar(self, *args):
+        salida = io.StringIO()
+        call_command("generar_expensas", "--desde", "2025-01", "--hasta", "2025-01",
+                     "--checkpoint", self.checkpoint, *args, stdout=salida)
+        return salida.getvalue()
+
+    def test_reanuda_con_los_rangos_guardados(self):
+        self.generar("--tamano", "2")
+        with open(self.checkpoint, encoding="utf-8") as fh:
+            guardado = json.load(fh)
+        self.assertEqual(len(guardado["plan"]), 3)
+        self.assertEqual(len(guardado["completados"]), 3)
+        # cortado antes del último chunk, y mientras tanto se crea una unidad
+        guardado["completados"] = guardado["completados"][:2]
+        with open(self.checkpoint, "w", encoding="utf-8") as fh:
+            json.dump(guardado, fh)
+        nueva, = crear_unidades(1, bloque="B")
+        salida = self.generar("--tamano", "3")
+        self.assertIn("2 chunks ya completados, 1 pendientes", salida)
+        self.assertIn("1 expensas creadas, 0 actualizadas, 1 omitidas", salida)
+        self.assertEqual(Expensa.objects.filter(periodo=date(2025, 1, 1)).count(), 6)
+        self.assertTrue(Expensa.objects.filter(unidad=nueva).exists())
+
+
+# =============== Paginación por cursor ===============
+
+class PaginacionCursorExpensasTests(TestCase):
+    """El cursor lleva (periodo, unidad_id, pk): los empates en periodo no cortan el recorrido."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("Administrador")
+        unidades = crear_unidades(1500)  # bastante más que el offset_cutoff (1000) del CursorPagination de DRF
+        crear_expensas(unidades, date(2025, 9, 1))
+        crear_expensas(unidades[:30], date(2025, 8, 1))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def recorrer(self, url):
+        ids, paginas = [], 0
+        while url:
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 200, r.content[:300])
+            ids += [e["id"] for e in r.json()["values"]]
+            url, paginas = r.json()["next"], paginas + 1
+            self.assertLess(paginas, 50, "el cursor no avanza")
+        return ids, paginas
+
+    def test_recorre_un_periodo_con_mas_de_mil_filas(self):
+        # con páginas de 100 el desempate por offset de DRF pasaría de 1000 dentro de 2025-09
+        ids, paginas = self.recorrer("/gestionexpensas/expensas/?page_size=100")
+        esperado = list(Expensa.objects.order_by("-periodo", "unidad_id").values_list("id", flat=True))
+        self.assertEqual(ids, esperado)
+        self.assertEqual(paginas, 16)
+
+    def test_previous_vuelve_a_la_pagina_anterior(self):
+        primera = self.client.get("/gestionexpensas/expensas/?page_size=300").json()
+        segunda = self.client.get(primera["next"]).json()
+        self.assertIsNotNone(segunda["previous"])
+        atras = self.client.get(segunda["previous"]).json()
+        self.assertEqual([e["id"] for e in atras["values"]], [e["id"] for e in primera["values"]])
+        self.assertIsNone(atras["previous"])
+
+    def test_ordering_no_cambia_la_clave_del_cursor(self):
+        normal, _ = self.recorrer("/gestionexpensas/expensas/?page_size=500")
+        con_ordering, _ = self.recorrer("/gestionexpensas/expensas/?page_size=500&ordering=-saldo")
+        self.assertEqual(con_ordering, normal)
+
+    def test_cursor_invalido(self):
+        r = self.client.get("/gestionexpensas/expensas/?cursor=no-es-un-cursor")
+        self.assertEqual(r.status_code, 404)
+
+
+# =============== Recargos por mora ===============
+
+class RecargosProrrateoTests(TestCase):
+    """El porcentaje mensual se cobra por días desde el último recargo; el fijo, una vez por mes."""
+
+    def setUp(self):
+        self.unidades = crear_unidades(2)
+        self.expensa, self.otra = crear_expensas(self.unidades, date(2025, 1, 1), monto=Decimal("1000.00"),
+                                                 vencimiento=date(2025, 1, 10))
+        self.politica = PoliticaRecargo.objects.create(monto_fijo=Decimal("5.00"), porcentaje_mensual=Decimal("3.00"),
+                                                       dias_gracia=5, vigente_desde=date(2024, 1, 1))
+
+    def recargos(self, expensa):
+        return Recargo.objects.filter(expensa=expensa, revertido=False).order_by("fecha_corte")
+
+    def test_corte_diario_cobra_lo_mismo_que_uno_mensual(self):
+        # fin de la gracia: 15-ene. Diario del 16-ene al 14-feb = 30 días = 3% de 1000
+        dia = date(2025, 1, 16)
+        while dia <= date(2025, 2, 14):
+            aplicar_recargos(dia)
+            dia += timedelta(days=1)
+        recargos = self.recargos(self.expensa)
+        self.assertEqual(recargos.count(), 30)
+        self.assertEqual(sum(r.dias for r in recargos), 30)
+        # 30 Bs de porcentaje + el fijo de enero y el de febrero
+        self.assertEqual(sum(r.monto for r in recargos), Decimal("40.00"))
+        self.assertEqual([r.monto for r in recargos if r.monto != Decimal("1.00")], [Decimal("6.00"), Decimal("6.00")])
+
+    def test_repetir_el_corte_no_cobra_de_nuevo(self):
+        aplicar_recargos(date(2025, 2, 14))
+        self.assertEqual(aplicar_recargos(date(2025, 2, 14))["expensas"], 0)
+        self.assertEqual(self.recargos(self.expensa).count(), 1)
+
+    def test_dos_cortes_en_el_mes_prorratean_y_no_repiten_el_fijo(self):
+        aplicar_recargos(date(2025, 2, 14))  # 30 días: 30 + 5
+        aplicar_recargos(date(2025, 2, 24))  # 10 días más: 10, sin fijo
+        montos = [(r.dias, r.monto) for r in self.recargos(self.expensa)]
+        self.assertEqual(montos, [(30, Decimal("35.00")), (10, Decimal("10.00"))])
+        self.expensa.refresh_from_db()
+        self.assertEqual(self.expensa.saldo, Decimal("1045.00"))
+
+    def test_corte_anterior_al_ultimo_se_salta(self):
+        aplicar_recargos(date(2025, 2, 14))
+        self.assertEqual(aplicar_recargos(date(2025, 2, 1))["expensas"], 0)
+
+    def test_revertir_vuelve_a_contar_desde_el_corte_anterior(self):
+        aplicar_recargos(date(2025, 2, 14))
+        aplicar_recargos(date(2025, 2, 24))
+        revertir_recargos(fecha_corte=date(2025, 2, 24))
+        aplicar_recargos(date(2025, 3, 16))  # 30 días desde el 14-feb, fijo de marzo
+        self.assertEqual([(r.dias, r.monto) for r in self.recargos(self.expensa)],
+                         [(30, Decimal("35.00")), (30, Decimal("35.00"))])
+
+    def test_api_rechaza_ids_que_no_son_enteros(self):
+        client = APIClient()
+        client.force_authenticate(crear_usuario("Administrador"))
+        aplicar_recargos(date(2025, 2, 14))
+        for politica_id in ("abc", 1.9, "1.9"):
+            r = client.post("/gestionexpensas/recargos/aplicar/", {"politica_id": politica_id}, format="json")
+            self.assertEqual(r.status_code, 400, politica_id)
+        for ids in (["abc"], [1.9], [True], [None]):
+            r = client.post("/gestionexpensas/recargos/revertir/", {"ids": ids}, format="json")
+            self.assertEqual(r.status_code, 400, ids)
+        self.assertEqual(self.recargos(self.expensa).count(), 1)
+        recargo = self.recargos(self.expensa).get()
+        r = client.post("/gestionexpensas/recargos/revertir/", {"ids": [str(recargo.pk)]}, format="json")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json()["values"]["recargos"], 1)
+        r = client.post("/gestionexpensas/recargos/aplicar/",
+                        {"politica_id": self.politica.pk, "fecha_corte": "2025-02-24"}, format="json")
+        self.assertEqual(r.status_code, 200)
+
+    def test_sobrescribir_conserva_los_recargos_vigentes(self):
+        aplicar_recargos(date(2025, 2, 14))  # 35 Bs
+        Tarifa.objects.create(monto_bs=Decimal("1200.00"), vigente_desde=date(2024, 1, 1))
+        r = generar_expensas(date(2025, 1, 1), vencimiento=date(2025, 1, 10), sobrescribir=True,
+                             unidades=Unidad.objects.filter(pk=self.expensa.unidad_id))
+        self.assertEqual(r["actualizadas"], [self.expensa.pk])
+        self.expensa.refresh_from_db()
+        self.assertEqual((self.expensa.monto_total, self.expensa.saldo), (Decimal("1235.00"), Decimal("1235.00")))
+        ajuste = MovimientoCuenta.objects.get(expensa=self.expensa, tipo="AJUSTE")
+        self.assertEqual(ajuste.monto, Decimal("200.00"))
+        revertir_recargos(fecha_corte=date(2025, 2, 14))
+        self.expensa.refresh_from_db()
+        self.assertEqual((self.expensa.monto_total, self.expensa.saldo), (Decimal("1200.00"), Decimal("1200.00")))
+        self.assertEqual(self.expensa.estado, "PENDIENTE")
+
+
+# =============== Exportación ===============
+
+def _rss() -> int:
+    """RSS actual del proceso en bytes (Linux)."""
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _filas_xlsx(contenido: bytes):
+    ns = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+    with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+        hoja = ElementTree.fromstring(zf.read("xl/worksheets/sheet1.xml"))
+    filas = []
+    for fila in hoja.iterfind("s:sheetData/s:row", ns):
+        filas.append(["".join(c.itertext()) for c in fila.iterfind("s:c", ns)])
+    return filas
+
+
+class ExportacionContenidoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("Administrador")
+        cls.a1, cls.a2 = crear_unidades(2)
+        cls.sep, = crear_expensas([cls.a1], date(2025, 9, 1), glosa='Cuota "ordinaria", señor')
+        cls.oct, = crear_expensas([cls.a2], date(2025, 10, 1), monto=Decimal("250.50"), vencimiento=date(2025, 10, 10))
+        crear_expensas([cls.a1], date(2025, 8, 1))  # fuera del filtro
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def exportar(self, url):
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.streaming)
+        return r, b"".join(r.streaming_content)
+
+    def test_csv_encabezado_y_filas(self):
+        r, contenido = self.exportar("/gestionexpensas/expensas/export/?periodo_desde=2025-09&periodo_hasta=2025-10")
+        self.assertEqual(r["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn('filename="expensas-', r["Content-Disposition"])
+        self.assertTrue(contenido.startswith("\ufeff".encode("utf-8")))
+        filas = list(csv.reader(io.StringIO(contenido.decode("utf-8-sig"))))
+        self.assertEqual(filas[0], [t for _, t in exportacion.COLUMNAS_EXPENSAS])
+        # orden de la vista: -periodo, unidad
+        self.assertEqual([f[:8] for f in filas[1:]], [
+            [str(self.oct.pk), "A-00001", "A", "2025-10-01", "2025-10-10", "250.50", "250.50", "PENDIENTE"],
+            [str(self.sep.pk), "A-00000", "A", "2025-09-01", "", "100.00", "100.00", "PENDIENTE"],
+        ])
+        self.assertEqual(filas[2][8], 'Cuota "ordinaria", señor')
+
+    def test_xlsx_abre_y_tiene_las_filas(self):
+        r, contenido = self.exportar("/gestionexpensas/expensas/export/?formato=xlsx&periodo=2025-09")
+        self.assertEqual(r["Content-Type"], "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+        with zipfile.ZipFile(io.BytesIO(contenido)) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertIn("[Content_Types].xml", zf.namelist())
+        filas = _filas_xlsx(contenido)
+        self.assertEqual(filas[0], [t for _, t in exportacion.COLUMNAS_EXPENSAS])
+        self.assertEqual(len(filas), 2)
+        self.assertEqual(filas[1][:9], [str(self.sep.pk), "A-00000", "A", "2025-09-01", "", "100.00", "100.00",
+                                        "PENDIENTE", 'Cuota "ordinaria", señor'])
+
+    def test_csv_de_pagos(self):
+        usuario = crear_usuario("Copropietario", "a101")
+        pago = Pago.objects.create(expensa=self.oct, usuario=usuario, monto_bs=Decimal("50.00"), referencia="TX-1")
+        _, contenido = self.exportar(f"/gestionexpensas/pagos/export/?expensa={self.oct.pk}")
+        filas = list(csv.reader(io.StringIO(contenido.decode("utf-8-sig"))))
+        self.assertEqual(filas[0], [t for _, t in exportacion.COLUMNAS_PAGOS])
+        self.assertEqual(filas[1][:10], [str(pago.pk), str(self.oct.pk), "2025-10-01", "A-00001", "a101", "50.00",
+                                         pago.metodo, "TX-1", "False", "PENDIENTE"])
+        self.assertEqual(len(filas), 2)
+
+    def test_formato_invalido(self):
+        r = self.client.get("/gestionexpensas/expensas/export/?formato=pdf")
+        self.assertEqual(r.status_code, 400)
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/statm"), "mide la RSS con /proc")
+class ExportacionMemoriaTests(TestCase):
+    """500k filas salen por el StreamingHttpResponse sin que la RSS crezca con la cantidad de filas."""
+    FILAS = 500_000
+    TECHO = 32 * 1024 * 1024  # el CSV completo pesa ~50 MB
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("Administrador")
+        # 5000 unidades x 100 periodos, armadas en la BD (con el ORM el armado pesaría más que el export)
+        with connection.cursor() as cur:
+            cur.execute("""
+                INSERT INTO unidad (codigo, bloque, piso, numero, area_m2, estado, tipo_unidad, created_at, updated_at)
+                SELECT 'M-' || lpad(i::text, 5, '0'), 'M', i / 100, i::text, 80, 'activa', 'apartamento', now(), now()
+                FROM generate_series(0, 4999) AS i
+            """)
+            cur.execute("""
+                INSERT INTO expensa (unidad_id, periodo, vencimiento, monto_total, saldo, estado, glosa,
+                                     created_at, updated_at)
+                SELECT u.id, (date '2017-01-01' + m * interval '1 month')::date, NULL, 100, 100, 'PENDIENTE',
+                       'Expensa ordinaria del mes', now(), now()
+                FROM unidad u CROSS JOIN generate_series(0, 99) AS m
+                WHERE u.bloque = 'M'
+            """)
+
+    def medir(self, formato):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        inicial = pico = _rss()
+        r = client.get(f"/gestionexpensas/expensas/export/?formato={formato}")
+        self.assertEqual(r.status_code, 200)
+        total = bloques = 0
+        for bloque in r.streaming_content:
+            total += len(bloque)
+            bloques += 1
+            if bloques % 20 == 0:
+                pico = max(pico, _rss())
+        return total, max(pico, _rss()) - inicial
+
+    def test_csv_de_500k_filas_con_memoria_acotada(self):
+        total, crecimiento = self.medir("csv")
+        self.assertGreater(total, self.TECHO)
+        self.assertLess(crecimiento, self.TECHO, f"la RSS creció {crecimiento // 2**20} MB")
+
+    def test_xlsx_de_500k_filas_con_memoria_acotada(self):
+        total, crecimiento = self.medir("xlsx")
+        self.assertGreater(total, 0)
+        self.assertLess(crecimiento, self.TECHO, f"la RSS creció {crecimiento // 2**20} MB")
+
+
+# =============== Filtros de periodo ===============
+
+class RangoPeriodoTests(TestCase):
+    """?periodo es un mes entero; periodo_desde / periodo_hasta son inclusive; el filtro es un rango."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = crear_usuario("Administrador")
+        cls.unidad, = crear_unidades(1)
+        cls.expensas = {e.periodo: e for e in
+                        Expensa.objects.bulk_create(Expensa(unidad=cls.unidad, periodo=date(2024, m, 1),
+                                                            monto_total=Decimal("100.00"), saldo=Decimal("100.00"))
+                                                    for m in range(1, 13))}
+
+    def periodos(self, **params):
+        return [e.periodo for e in filtrar_expensas(Expensa.objects.order_by("periodo"), params)]
+
+    def test_rango(self):
+        self.assertEqual(rango_periodo({"periodo": "2024-09"}), (date(2024, 9, 1), date(2024, 10, 1)))
+        self.assertEqual(rango_periodo({"periodo": "2024-12-01"}), (date(2024, 12, 1), date(2025, 1, 1)))
+        self.assertEqual(rango_periodo({"periodo_desde": "2024-03", "periodo_hasta": "2024-12"}),
+                         (date(2024, 3, 1), date(2025, 1, 1)))
+        self.assertEqual(rango_periodo({"periodo_hasta": "2024-05"}), (None, date(2024, 6, 1)))
+        self.assertEqual(rango_periodo({}), (None, None))
+
+    def test_periodo_es_el_mes_entero(self):
+        # una fila con un día que no es el primero (cargada a mano) igual entra en su mes
+        Expensa.objects.filter(pk=self.expensas[date(2024, 6, 1)].pk).update(periodo=date(2024, 6, 30))
+        self.assertEqual(self.periodos(periodo="2024-06"), [date(2024, 6, 30)])
+        self.assertEqual(self.periodos(periodo="2024-07"), [date(2024, 7, 1)])
+
+    def test_desde_y_hasta_inclusive(self):
+        self.assertEqual(self.periodos(periodo_desde="2024-03", periodo_hasta="2024-05"),
+                         [date(2024, 3, 1), date(2024, 4, 1), date(2024, 5, 1)])
+        self.assertEqual(self.periodos(periodo_desde="2024-11"), [date(2024, 11, 1), date(2024, 12, 1)])
+        self.assertEqual(self.periodos(periodo_hasta="2024-02"), [date(2024, 1, 1), date(2024, 2, 1)])
+        self.assertEqual(self.periodos(periodo_desde="2024-05", periodo_hasta="2024-04"), [])
+
+    def test_periodo_tiene_prioridad_sobre_el_rango(self):
+        self.assertEqual(self.periodos(periodo="2024-08", periodo_desde="2024-01", periodo_hasta="2024-12"),
+                         [date(2024, 8, 1)])
+
+    def test_pagos_filtran_por_el_periodo_de_su_expensa(self):
+        usuario = crear_usuario("Copropietario", "a101")
+        for periodo in (date(2024, 2, 1), date(2024, 3, 1), date(2024, 4, 1)):
+            Pago.objects.create(expensa=self.expensas[periodo], usuario=usuario, monto_bs=Decimal("10.00"))
+        qs = filtrar_pagos(Pago.objects.all(), {"periodo_desde": "2024-03", "periodo_hasta": "2024-04"})
+        self.assertEqual(sorted(qs.values_list("expensa__periodo", flat=True)), [date(2024, 3, 1), date(2024, 4, 1)])
+
+    def test_periodo_invalido(self):
+        for params in ({"periodo": "2024"}, {"periodo": "sep-2024"}, {"periodo_desde": "2024-13"},
+                       {"periodo_hasta": "2024-00"}):
+            with self.assertRaises(ValueError):
+                rango_periodo(params)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        for url in ("/gestionexpensas/expensas/?periodo=2024", "/gestionexpensas/expensas/export/?periodo_desde=x"):
+            r = client.get(url)
+            self.assertEqual(r.status_code, 400, url)
+            self.assertEqual(r.json()["message"], "Periodo inválido. Usa YYYY-MM.")
+
+    def test_listado_por_rango(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        r = client.get("/gestionexpensas/expensas/?periodo_desde=2024-10&periodo_hasta=2024-11")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([e["periodo"] for e in r.json()["values"]], ["2024-11-01", "2024-10-01"])
+
+
+# =============== Planes de consulta ===============
+
+class PlanesConsultaTests(TestCase):
+    """
+    Las consultas de listados, cola y pagos de una expensa usan los índices de
+    Meta.indexes. Tablas con datos generados y ANALYZE para que el planner decida
+    con estadísticas reales: 10 000 unidades x 100 periodos = 1M expensas (casi
+    todo PAGADA) y un pago por expensa, 1M pagos (casi todo APROBADO).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = crear_usuario("Copropietario", "a101")
+        with connection.cursor() as cur:
+            cur.execute("""
+                INSERT INTO unidad (codigo, bloque, piso, numero, area_m2, estado, tipo_unidad, created_at, updated_at)
+                SELECT 'P-' || lpad(i::text, 5, '0'), 'P', i / 100, i::text, 80, 'activa', 'apartamento', now(), now()
+                FROM generate_series(0, 9999) AS i
+            """)
+            cur.execute("""
+                INSERT INTO expensa (unidad_id, periodo, vencimiento, monto_total, saldo, estado, glosa,
+                                     created_at, updated_at)
+                SELECT u.id, (date '2017-01-01' + m * interval '1 month')::date, NULL, 100, 0,
+                       CASE WHEN u.id % 97 = 0 THEN 'ANULADA' WHEN m = 99 THEN 'PENDIENTE' ELSE 'PAGADA' END,
+                       '', now(), now()
+                FROM unidad u CROSS JOIN generate_series(0, 99) AS m
+            """)
+            cur.execute("""
+                INSERT INTO pago (expensa_id, usuario_id, monto_bs, fecha_pago, metodo, referencia, comprobante_sha256,
+                                  comprobante_repetido, estado, distribuir, created_at, updated_at)
+                SELECT e.id, %s, 100, now(), 'QR', '', '', false,
+                       CASE WHEN e.id %% 500 = 0 THEN 'PENDIENTE' ELSE 'APROBADO' END, false,
+                       now() - e.id * interval '1 minute', now()
+                FROM expensa e
+            """, [cls.usuario.pk])
+            cur.execute("ANALYZE unidad, expensa, pago")
+        cls.expensa_id = Expensa.objects.order_by("id").values_list("id", flat=True)[1000]
+
+    def assertUsaIndice(self, queryset, indice):
+        plan = queryset.explain()
+        self.assertIn(indice, plan, plan)
+
+    def test_rango_de_periodos(self):
+        qs = filtrar_expensas(Expensa.objects.all(), {"periodo_desde": "2024-06", "periodo_hasta": "2024-07"})
+        self.assertUsaIndice(qs.order_by("-periodo", "unidad_id")[:50], "expensa_periodo_unidad_idx")
+
+    def test_periodo(self):
+        qs = filtrar_expensas(Expensa.objects.all(), {"periodo": "2024-06"})
+        self.assertUsaIndice(qs.order_by("-periodo", "unidad_id")[:50], "expensa_periodo_unidad_idx")
+
+    def test_estado(self):
+        qs = filtrar_expensas(Expensa.objects.all(), {"estado": "ANULADA"})
+        self.assertUsaIndice(qs.order_by("-periodo")[:50], "expensa_estado_periodo_idx")
+
+    def test_pagos_de_una_expensa(self):
+        qs = Pago.objects.filter(expensa_id=self.expensa_id).order_by("-created_at")
+        self.assertUsaIndice(qs, "pago_expensa_creado_idx")
+
+    def test_pagos_pendientes(self):
+        qs = Pago.objects.filter(estado="PENDIENTE").order_by("created_at", "id")[:50]
+        self.assertUsaIndice(qs, "pago_pendiente_idx")
+
+
+# =============== Comprobantes por contenido ===============
+
+def _png() -> bytes:
+    salida = io.BytesIO()
+    Image.effect_noise((600, 600), 40).convert("RGB").save(salida, "PNG")
+    return salida.getvalue()
+
+
+class MediaTemporalMixin:
+    def setUp(self):
+        super().setUp()
+        carpeta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, carpeta, ignore_errors=True)
+        ajuste = override_settings(MEDIA_ROOT=carpeta)
+        ajuste.enable()
+        self.addCleanup(ajuste.disable)
+        self.contenido = _png()
+
+    def pago_con_comprobante(self, expensa, usuario):
+        with transaction.atomic():
+            campos = guardar_comprobante(SimpleUploadedFile("comprobante.png", self.contenido))
+            return Pago.objects.create(expensa=expensa, usuario=usuario, monto_bs=Decimal("10.00"), **campos)
+
+
+class ComprobantesTests(MediaTemporalMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.usuario = crear_usuario("Copropietario", "a101")
+        self.expensa, = crear_expensas(crear_unidades(1), date(2025, 9, 1))
+
+    def test_mismo_archivo_misma_ruta_y_procesado(self):
+        p1 = self.pago_con_comprobante(self.expensa, self.usuario)
+        p2 = self.pago_con_comprobante(self.expensa, self.usuario)
+        self.assertEqual(p1.comprobante.name, p2.comprobante.name)
+        self.assertTrue(p1.comprobante.name.endswith("_orig.png"))
+        self.assertEqual((p1.comprobante_repetido, p2.comprobante_repetido), (False, True))
+
+        with self.captureOnCommitCallbacks(execute=True):  # el original se borra al confirmar
+            self.assertTrue(procesar_comprobante(p1.comprobante_sha256))
+        p1.refresh_from_db()
+        p2.refresh_from_db()
+        self.assertEqual(p1.comprobante.name, f"comprobantes/{p1.comprobante_sha256[:2]}/{p1.comprobante_sha256}.jpg")
+        self.assertEqual((p2.comprobante.name, p2.comprobante_miniatura.name),
+                         (p1.comprobante.name, p1.comprobante_miniatura.name))
+        self.assertTrue(default_storage.exists(p1.comprobante_miniatura.name))
+        self.assertFalse(default_storage.exists(p1.comprobante.name.replace(".jpg", "_orig.png")))
+        self.assertFalse(procesar_comprobante(p1.comprobante_sha256))  # nada pendiente
+
+    def test_despues_de_procesar_se_usa_la_ruta_canonica(self):
+        p1 = self.pago_con_comprobante(self.expensa, self.usuario)
+        procesar_comprobante(p1.comprobante_sha256)
+        p1.refresh_from_db()
+        p2 = self.pago_con_comprobante(self.expensa, self.usuario)
+        self.assertEqual((p2.comprobante.name, p2.comprobante_miniatura.name),
+                         (p1.comprobante.name, p1.comprobante_miniatura.name))
+        # sin pagos que lo usen, la ruta canónica sigue siendo la recodificada
+        Pago.objects.all().delete()
+        p3 = self.pago_con_comprobante(self.expensa, self.usuario)
+        self.assertEqual(p3.comprobante.name, p1.comprobante.name)
+        self.assertFalse(p3.comprobante_repetido)
+
+
+class ComprobantesConcurrenciaTests(MediaTemporalMixin, TransactionTestCase):
+    """Un pago que se crea con el mismo archivo mientras se procesa no queda con el original borrado."""
+
+    def test_pago_creado_durante_el_procesamiento(self):
+        usuario = crear_usuario("Copropietario", "a101")
+        expensa, = crear_expensas(crear_unidades(1), date(2025, 9, 1))
+        primero = self.pago_con_comprobante(expensa, usuario)
+        ruta_resuelta = threading.Event()
+
+        def subir():
+            try:
+                with transaction.atomic():
+                    campos = guardar_comprobante(SimpleUploadedFile("otra.png", self.contenido))
+                    ruta_resuelta.set()
+                    time.sleep(0.5)  # el procesamiento corre mientras tanto
+                    Pago.objects.create(expensa=expensa, usuario=usuario, monto_bs=Decimal("5.00"), **campos)
+            finally:
+                connection.close()
+
+        hilo = threading.Thread(target=subir)
+        hilo.start()
+        self.assertTrue(ruta_resuelta.wait(5))
+        self.assertTrue(procesar_comprobante(primero.comprobante_sha256))
+        hilo.join()
+
+        nombres = set(Pago.objects.values_list("comprobante", flat=True))
+        self.assertEqual(len(nombres), 1)
+        nombre, = nombres
+        self.assertTrue(nombre.endswith(".jpg"))
+        self.assertTrue(default_storage.exists(nombre))
+
+
+# =============== Cuenta corriente ===============
+
+class InicializarCuentasTests(TestCase):
+    """La apertura cubre la deuda previa al libro aunque la unidad ya tenga movimientos."""
+
+    def setUp(self):
+        self.u1, self.u2 = crear_unidades(2)
+        # deuda anterior al libro: no tiene movimientos
+        crear_expensas([self.u1, self.u2], date(2025, 8, 1))
+        # movimientos escritos antes de correr el comando
+        Tarifa.objects.create(monto_bs=Decimal("300.00"), vigente_desde=date(2024, 1, 1))
+        septiembre = generar_expensas(date(2025, 9, 1), unidades=Unidad.objects.filter(pk=self.u1.pk))["creadas"]
+        pago = Pago.objects.create(expensa_id=septiembre[0], usuario=crear_usuario("Copropietario", "a101"),
+                                   monto_bs=Decimal("50.00"))
+        cambiar_estado_pagos([pago.pk], "APROBADO")
+
+    def inicializar(self):
+        salida = io.StringIO()
+        call_command("inicializar_cuentas", stdout=salida)
+        return salida.getvalue()
+
+    def movimientos(self, unidad):
+        return list(MovimientoCuenta.objects.filter(unidad=unidad).order_by("fecha", "id")
+                    .values_list("tipo", "monto", "saldo"))
+
+    def test_apertura_con_movimientos_previos(self):
+        self.assertIn("2 cuentas abiertas", self.inicializar())
+        self.assertEqual(self.movimientos(self.u1), [
+            ("APERTURA", Decimal("100.00"), Decimal("100.00")),
+            ("CARGO", Decimal("300.00"), Decimal("400.00")),
+            ("PAGO", Decimal("-50.00"), Decimal("350.00")),
+        ])
+        self.assertEqual(self.movimientos(self.u2), [("APERTURA", Decimal("100.00"), Decimal("100.00"))])
+        for unidad in (self.u1, self.u2):
+            deuda = sum(Expensa.objects.filter(unidad=unidad).values_list("saldo", flat=True))
+            self.assertEqual(CuentaUnidad.objects.get(unidad=unidad).saldo, deuda)
+
+    def test_volver_a_correr_no_abre_de_nuevo(self):
+        self.inicializar()
+        antes = self.movimientos(self.u1)
+        self.assertIn("0 cuentas abiertas", self.inicializar())
+        self.assertEqual(self.movimientos(self.u1), antes)
+        self.assertEqual(CuentaUnidad.objects.get(unidad=self.u1).saldo, Decimal("350.00"))
+
+
+# =============== Cola de revisión de pagos ===============
+
+class ColaRevisionTests(TestCase):
+    def setUp(self):
+        self.a, self.b = crear_usuario("Administrador", "admin_a"), crear_usuario("Administrador", "admin_b")
+        usuario = crear_usuario("Copropietario", "a101")
+        expensa, = crear_expensas(crear_unidades(1), date(2025, 9, 1))
+        self.pagos = [Pago.objects.create(expensa=expensa, usuario=usuario, monto_bs=Decimal("1.00")).pk
+                      for _ in range(30)]
+
+    def test_renueva_las_reservas_propias_fuera_del_primer_lote(self):
+        ids_b, _ = cola.tomar_pagos(self.b, 10)
+        ids_a, _ = cola.tomar_pagos(self.a, 10)
+        self.assertEqual((ids_b, ids_a), (self.pagos[:10], self.pagos[10:20]))
+        cola.liberar_pagos(self.b)
+        # las de A están por vencer y hay pagos libres más antiguos: igual se renuevan todas
+        Pago.objects.filter(pk__in=ids_a).update(revision_hasta=timezone.now() + timedelta(seconds=5))
+        renovados, hasta = cola.tomar_pagos(self.a, 10)
+        self.assertEqual(renovados, ids_a)
+        self.assertEqual(set(Pago.objects.filter(pk__in=ids_a).values_list("revision_hasta", flat=True)), {hasta})
+        # con lugar en el lote, lo que falta sale de los libres más antiguos
+        mas, _ = cola.tomar_pagos(self.a, 13)
+        self.assertEqual(mas, self.pagos[:3] + ids_a)
+
+    def test_no_toma_reservas_ajenas_vigentes(self):
+        ids_a, _ = cola.tomar_pagos(self.a, 25)
+        ids_b, _ = cola.tomar_pagos(self.b, 25)
+        self.assertEqual(ids_b, self.pagos[25:])
+        Pago.objects.filter(pk__in=ids_a[:2]).update(revision_hasta=timezone.now() - timedelta(seconds=1))
+        ids_b, _ = cola.tomar_pagos(self.b, 10)
+        self.assertEqual(ids_b, self.pagos[:2] + self.pagos[25:])
+
+
+class ColaConcurrenciaTests(TransactionTestCase):
+    def test_dos_revisores_a_la_vez_reciben_pagos_distintos(self):
+        revisores = [crear_usuario("Administrador", f"admin_{i}") for i in range(4)]
+        usuario = crear_usuario("Copropietario", "a101")
+        expensa, = crear_expensas(crear_unidades(1), date(2025, 9, 1))
+        pagos = {Pago.objects.create(expensa=expensa, usuario=usuario, monto_bs=Decimal("1.00")).pk
+                 for _ in range(30)}
+        barrera = threading.Barrier(len(revisores))
+        lotes = {}
+
+        def tomar(revisor):
+            try:
+                barrera.wait()
+                lotes[revisor.pk] = cola.tomar_pagos(revisor, 10)[0]
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=tomar, args=(r,)) for r in revisores]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        tomados = [pid for lote in lotes.values() for pid in lote]
+        self.assertEqual(len(tomados), len(set(tomados)))
+        self.assertEqual(set(tomados), pagos)
+        self.assertTrue(all(len(lote) <= 10 for lote in lotes.values()))
+        for revisor_id, lote in lotes.items():
+            self.assertEqual(set(Pago.objects.filter(revisor_id=revisor_id).values_list("pk", flat=True)), set(lote))
+
+
+# =============== Conciliación bancaria ===============
+
+def extracto(*lineas, encabezado="fecha,monto,referencia"):
+    return SimpleUploadedFile("extracto.csv", "\n".join([encabezado, *lineas]).encode("utf-8"), "text/csv")
+
+
+class ConciliacionTests(TestCase):
+    def setUp(self):
+        usuario = crear_usuario("Copropietario", "a101")
+        self.expensas = crear_expensas(crear_unidades(3), date(2025, 9, 1))
+        self.fecha = timezone.make_aware(datetime(2025, 9, 10, 12))
+
+        def pago(expensa, monto, referencia=""):
+            return Pago.objects.create(expensa=expensa, usuario=usuario, monto_bs=Decimal(monto),
+                                       referencia=referencia, fecha_pago=self.fecha)
+        self.pago = pago
+
+    def test_montos_con_separadores(self):
+        for texto, esperado in [("1,234", "1234.00"), ("1.234", "1234.00"), ("1.234.567", "1234567.00"),
+                                ("1.234,56", "1234.56"), ("1,234.56", "1234.56"), ("12,5", "12.50"),
+                                ("12.50", "12.50"), ("100", "100.00")]:
+            self.assertEqual(conciliacion._monto(texto), Decimal(esperado), texto)
+
+    def test_par_unico_se_aprueba(self):
+        pago = self.pago(self.expensas[0], "80.00", "TX-001")
+        res = conciliacion.conciliar_extracto(extracto("2025-09-11,80.00,tx 001"))
+        self.assertEqual([(a["pago_id"], a["estado"]) for a in res["aprobados"]], [(pago.pk, "APROBADO")])
+        self.assertEqual(res["revision"], [])
+        pago.refresh_from_db()
+        self.assertEqual(pago.estado, "APROBADO")
+        self.assertEqual(Expensa.objects.get(pk=self.expensas[0].pk).saldo, Decimal("20.00"))
+
+    def test_dos_lineas_por_el_mismo_pago_van_a_revision(self):
+        pago = self.pago(self.expensas[0], "80.00", "TX-001")
+        res = conciliacion.conciliar_extracto(extracto("2025-09-10,80.00,TX-001", "2025-09-11,80.00,TX-001"))
+        self.assertEqual(res["aprobados"], [])
+        self.assertEqual([(r["linea"], r["motivo"], r["candidatos"]) for r in res["revision"]],
+                         [(2, "varias líneas apuntan al mismo pago", [pago.pk]),
+                          (3, "varias líneas apuntan al mismo pago", [pago.pk])])
+        pago.refresh_from_db()
+        self.assertEqual(pago.estado, "PENDIENTE")
+
+    def test_no_aprueba_un_pago_rechazado_mientras_tanto(self):
+        pago = self.pago(self.expensas[0], "80.00", "TX-001")
+        original = conciliacion._pagos_pendientes
+
+        def cargar_y_rechazar(metodos):
+            filas = list(original(metodos))
+            Pago.objects.filter(pk=pago.pk).update(estado="RECHAZADO")
+            return filas
+
+        with mock.patch.object(conciliacion, "_pagos_pendientes", cargar_y_rechazar):
+            res = conciliacion.conciliar_extracto(extracto("2025-09-10,80.00,TX-001"))
+        self.assertEqual(res["aprobados"], [])
+        self.assertEqual([(r["motivo"], r["candidatos"]) for r in res["revision"]],
+                         [("El pago está RECHAZADO.", [pago.pk])])
+        self.assertEqual(Expensa.objects.get(pk=self.expensas[0].pk).saldo, Decimal("100.00"))
+
+    def test_sin_referencia_sugiere_por_monto(self):
+        a = self.pago(self.expensas[0], "55.00")
+        b = self.pago(self.expensas[1], "55.00", "OTRA")
+        self.pago(self.expensas[2], "56.00")
+        res = conciliacion.conciliar_extracto(extracto("2025-09-12,55.00,", "2025-09-20,55.00,"))
+        self.assertEqual(res["aprobados"], [])
+        self.assertEqual([(r["motivo"], sorted(r["candidatos"])) for r in res["revision"]], [
+            ("sin pago con esa referencia; hay pagos del mismo monto", sorted([a.pk, b.pk])),
+            ("sin coincidencias", []),  # fuera de la ventana de días
+        ])
+        self.assertEqual(Pago.objects.filter(estado="PENDIENTE").count(), 3)
+
+    def test_debitos_son_invalidos(self):
+        pago = self.pago(self.expensas[0], "80.00", "TX-001")
+        res = conciliacion.conciliar_extracto(extracto("2025-09-10,-80.00,TX-001", "2025-09-10,0,TX-001"))
+        self.assertEqual(res["aprobados"], [])
+        self.assertEqual([i["linea"] for i in res["invalidas"]], [2, 3])
+        self.assertIn("débito", res["invalidas"][0]["error"])
+        pago.refresh_from_db()
+        self.assertEqual(pago.estado, "PENDIENTE")
@@ -3,7 +3,11 @@ from .views import (
     GenerarExpensasMensuales,
     ExpensasList, MisExpensasList,
     CrearPagoView, PagosDeExpensaList,
-    AprobarPago, RechazarPago,
+    AprobarPago, RechazarPago, CambiarEstadoPagosLote, ConciliarExtracto,
+    ColaRevisionPagos, LiberarPagosCola,
+    ReporteMorosidad, ResumenCobranzaView, EstadoDeCuenta,
+    ExportarExpensas, ExportarPagos,
+    AplicarRecargos, RevertirRecargos,
 )
 
 urlpatterns = [
@@ -14,6 +18,10 @@ urlpatterns = [
     path("expensas/", ExpensasList.as_view()),          # Admin/Guardia/Empleado; Copropietario ve las suyas (filtro en QS)
     path("mis-expensas/", MisExpensasList.as_view()),   # Copropietario
 
+    # Exportación CSV/XLSX (mismos filtros que los listados)
+    path("expensas/export/", ExportarExpensas.as_view()),
+    path("pagos/export/", ExportarPagos.as_view()),
+
     # CU07
     path("pagos/", CrearPagoView.as_view()),
 
@@ -23,4 +31,19 @@ urlpatterns = [
     # CU08
     path("pagos/<int:pk>/aprobar/", AprobarPago.as_view()),
     path("pagos/<int:pk>/rechazar/", RechazarPago.as_view()),
+    path("pagos/lote/", CambiarEstadoPagosLote.as_view()),   # aprobar/rechazar N pagos
+    path("pagos/conciliar/", ConciliarExtracto.as_view()),   # extracto bancario CSV
+    path("pagos/cola/", ColaRevisionPagos.as_view()),         # reservar lote a revisar
+    path("pagos/cola/liberar/", LiberarPagosCola.as_view()),
+
+    # Estado de cuenta de una unidad (libro de movimientos)
+    path("estado-de-cuenta/<int:unidad>/", EstadoDeCuenta.as_view()),
+
+    # Recargos por mora (Admin)
+    path("recargos/aplicar/", AplicarRecargos.as_view()),
+    path("recargos/revertir/", RevertirRecargos.as_view()),
+
+    # Reportes (Admin)
+    path("expensas/reportes/morosidad/", ReporteMorosidad.as_view()),
+    path("expensas/resumen/", ResumenCobranzaView.as_view()),
 ]
@@ -1,24 +1,37 @@
-from datetime import date
-from calendar import monthrange
+import csv
+from datetime import date, datetime, time, timedelta
 
 from rest_framework import generics, permissions, status, filters
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.exceptions import PermissionDenied
-from django.db import transaction
-from django.db.models import Q, F
+from django.db.models import Q, F, Sum
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 
-from users.models import CopropietarioModel
+from condominio.idempotencia import idempotente
+from condominio.pagination import EnvelopePaginationMixin, EnvelopeOffsetPagination
+from users.propiedad import contexto_propiedad
 from unidad_pertenencia.models import Unidad
-from .models import Expensa, Pago, Tarifa
-from .serializers import ExpensaSerializer, PagoCreateSerializer, PagoListSerializer
+from .models import METODOS_PAGO, Expensa, MovimientoCuenta, Pago, PoliticaRecargo, ResumenCobranza
+from .serializers import (ExpensaSerializer, MovimientoCuentaSerializer, PagoCreateSerializer, PagoListSerializer,
+                          ResumenCobranzaSerializer)
 from .permissions import IsAdmin, AdminOrStaffReadOnly
+from . import cola
+from .comprobantes import ComprobanteUploadHandler
+from .conciliacion import VENTANA_DIAS, conciliar_extracto
+from .cuenta import saldo_al
+from .exportacion import COLUMNAS_EXPENSAS, COLUMNAS_PAGOS, FORMATOS, respuesta_exportacion
+from .filtros import filtrar_expensas, filtrar_pagos, filtrar_periodo
+from .recargos import aplicar_recargos, revertir_recargos
+from .reportes import reporte_morosidad
+from .tarifas import tabla_tarifas
+from .services import generar_expensas, last_day_of_month, cambiar_estado_pagos, ACCIONES_PAGO
 
 # --------- Envelope unificado ----------
-def ok(message="OK", values=None, status_code=status.HTTP_200_OK):
-    return Response({"status": 1, "error": 0, "message": message, "values": values}, status=status_code)
+def ok(message="OK", values=None, status_code=status.HTTP_200_OK, **extra):
+    return Response({"status": 1, "error": 0, "message": message, "values": values, **extra}, status=status_code)
 
 def fail(message="Error", values=None, status_code=status.HTTP_400_BAD_REQUEST):
     return Response({"status": 2, "error": 1, "message": message, "values": values}, status=status_code)
@@ -32,9 +45,6 @@ def _first_day_from_yyyymm(yyyymm: str) -> date:
     y, m = int(parts[0]), int(parts[1])
     return date(y, m, 1)
 
-def _last_day_of_month(d: date) -> date:
-    return date(d.year, d.month, monthrange(d.year, d.month)[1])
-
 
 # =============== CU06: Generar expensas mensuales ===============
 class GenerarExpensasMensuales(APIView):
@@ -47,14 +57,17 @@ class GenerarExpensasMensuales(APIView):
       "sobrescribir": false          // opcional, si True y existe expensa de ese periodo, la actualiza
     }
     Reglas:
-    - Usa la Tarifa activa con mayor "vigente_desde" <= periodo (si no hay, error).
-    - Crea Expensa(unidad, periodo) con monto_total=tarifa, saldo=monto_total.
-    - Si existe ya (unique_together), y `sobrescribir=True`, actualiza montos/fechas.
-    - Solo Admin.
+    - Cada unidad usa la Tarifa activa vigente de su tipo_unidad o, si no hay, la general
+      (mayor "vigente_desde" <= periodo; si no hay ninguna, error).
+    - Crea Expensa(unidad, periodo) con monto_total = monto_bs + monto_m2 * area_m2, saldo=monto_total.
+    - Si existe ya (unique_together), y `sobrescribir=True`, actualiza montos/fechas
+      conservando lo ya pagado.
+    - Todo el periodo se resuelve en sentencias por conjunto (ver services.generar_expensas).
+    - Solo Admin. Acepta la cabecera Idempotency-Key (ver condominio.idempotencia).
     """
     permission_classes = [IsAdmin]
 
-    @transaction.atomic
+    @idempotente
     def post(self, request):
         try:
             if "periodo" not in request.data:
@@ -66,17 +79,14 @@ class GenerarExpensasMensuales(APIView):
                 yyyy, mm, dd = map(int, str(ven).split("-"))
                 venc = date(yyyy, mm, dd)
             else:
-                venc = _last_day_of_month(per)
+                venc = last_day_of_month(per)
 
             sobrescribir = bool(request.data.get("sobrescribir", False))
             unidad_id = request.data.get("unidad_id")
 
-            # Tarifa vigente
-            tarifa = (Tarifa.objects
-                      .filter(activa=True, vigente_desde__lte=per)
-                      .order_by("-vigente_desde")
-                      .first())
-            if not tarifa:
+            # Tarifas vigentes (por tipo de unidad + general)
+            tabla = tabla_tarifas(per)
+            if not tabla:
                 return fail("No existe una tarifa activa vigente para ese periodo.")
 
             if unidad_id:
@@ -84,35 +94,13 @@ class GenerarExpensasMensuales(APIView):
             else:
                 unidades = Unidad.objects.filter(estado="activa")
 
-            creadas, actualizadas, omitidas = [], [], []
-            for u in unidades.select_for_update():
-                defaults = {
-                    "vencimiento": venc,
-                    "monto_total": tarifa.monto_bs,
-                    "saldo": tarifa.monto_bs,
-                    "estado": "PENDIENTE",
-                    "glosa": f"{tarifa.nombre} {per:%Y-%m}",
-                }
-                obj, created = Expensa.objects.get_or_create(unidad=u, periodo=per, defaults=defaults)
-                if created:
-                    creadas.append(obj.id)
-                else:
-                    if sobrescribir:
-                        obj.vencimiento = venc
-                        obj.monto_total = tarifa.monto_bs
-                        # si ya hay pagos previos, conserva saldo relativo al nuevo total
-                        if obj.saldo > obj.monto_total:
-                            obj.saldo = obj.monto_total
-                        obj.recalc_estado()
-                        obj.glosa = f"{tarifa.nombre} {per:%Y-%m}"
-                        obj.save()
-                        actualizadas.append(obj.id)
-                    else:
-                        omitidas.append(obj.id)
+            res = generar_expensas(per, venc, sobrescribir=sobrescribir, unidades=unidades, tarifas=tabla)
+            creadas, actualizadas, omitidas = res["creadas"], res["actualizadas"], res["omitidas"]
 
             return ok(
-                message=f"Expensas generadas para {per:%Y-%m}. Creadas: {len(creadas)}, actualizadas: {len(actualizadas)}, omitidas: {len(omitidas)}",
-                values={"creadas": creadas, "actualizadas": actualizadas, "omitidas": omitidas},
+                message=(f"Expensas generadas para {per:%Y-%m}. Creadas: {len(creadas)}, actualizadas: {len(actualizadas)}, "
+                         f"omitidas: {len(omitidas)}, sin tarifa: {len(res['sin_tarifa'])}"),
+                values={**res, "tarifas": tabla.describir()},
                 status_code=status.HTTP_201_CREATED
             )
         except Exception as e:
@@ -120,46 +108,109 @@ class GenerarExpensasMensuales(APIView):
 
 
 # =============== Listados y consultas (Admin/Staff; Copropietario: sólo lo suyo) ===============
-class ExpensasList(generics.ListAPIView):
+class ExpensasList(EnvelopePaginationMixin, generics.ListAPIView):
     """
     Admin/Guardia/Empleado: ven todo; Copropietario: sólo su(s) unidad(es).
-    Filtros: ?periodo=YYYY-MM (prefijo), ?unidad=<id>, ?estado=PENDIENTE/PARCIAL/PAGADA/ANULADA
+    Filtros: ?periodo=YYYY-MM | ?periodo_desde=YYYY-MM&periodo_hasta=YYYY-MM (inclusive),
+             ?unidad=<id>, ?estado=PENDIENTE/PARCIAL/PAGADA/ANULADA
+    Paginado por cursor (?cursor=, ?page_size=); tabla admin: también ?offset=&limit=.
     """
     serializer_class = ExpensaSerializer
     permission_classes = [permissions.IsAuthenticated, AdminOrStaffReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ["unidad", "estado"]
     ordering_fields = ["periodo", "unidad", "estado", "saldo", "created_at"]
+    ordering = ("-periodo", "unidad_id")
+    offset_pagination_class = EnvelopeOffsetPagination
 
     def get_queryset(self):
         qs = Expensa.objects.select_related("unidad").all()
         role = _rol_name(self.request.user)
         if role == "Copropietario":
-            unidad_ids = CopropietarioModel.objects.filter(idUsuario=self.request.user).values_list("unidad_id", flat=True)
-            qs = qs.filter(unidad_id__in=unidad_ids)
-        # filtro periodo: YYYY-MM
-        periodo = self.request.query_params.get("periodo")
-        if periodo:
-            # filtra por mes (prefijo)
-            qs = qs.filter(periodo__year=int(periodo.split("-")[0]), periodo__month=int(periodo.split("-")[1]))
+            qs = contexto_propiedad(self.request).filtrar(qs)
+        # periodo como rango de fechas (usa el índice), nunca __year/__month
+        qs = filtrar_periodo(qs, self.request.query_params)
         return qs.order_by("-periodo", "unidad_id")
 
+    def list(self, request, *args, **kwargs):
+        try:
+            qs = self.filter_queryset(self.get_queryset())
+        except ValueError as e:
+            return fail(str(e))
+        data, enlaces = self.paginar(qs)
+        return ok(message=f"Se encontraron {len(data)} expensas", values=data, **enlaces)
+
 
-class MisExpensasList(generics.ListAPIView):
+class MisExpensasList(EnvelopePaginationMixin, generics.ListAPIView):
     """
     CU09: Copropietario ve sus expensas (solo sus unidades).
     """
     serializer_class = ExpensaSerializer
     permission_classes = [permissions.IsAuthenticated]
+    ordering = ("-periodo", "unidad_id")
 
     def get_queryset(self):
-        u = self.request.user
-        unidad_ids = CopropietarioModel.objects.filter(idUsuario=u).values_list("unidad_id", flat=True)
-        return Expensa.objects.filter(unidad_id__in=unidad_ids).order_by("-periodo")
+        qs = contexto_propiedad(self.request).filtrar(Expensa.objects.select_related("unidad"))
+        return qs.order_by("-periodo")
 
     def list(self, request, *args, **kwargs):
-        data = self.get_serializer(self.get_queryset(), many=True).data
-        return ok(message=f"Se encontraron {len(data)} expensas", values=data)
+        data, enlaces = self.paginar(self.get_queryset())
+        return ok(message=f"Se encontraron {len(data)} expensas", values=data, **enlaces)
+
+
+# =============== Exportación (CSV / XLSX en streaming) ===============
+class _ExportarBase(APIView):
+    """
+    GET ?formato=csv|xlsx (default csv) + los mismos filtros del listado:
+    ?periodo=YYYY-MM | ?periodo_desde=YYYY-MM&periodo_hasta=YYYY-MM, ?estado=, ?unidad=
+    Las filas se leen con cursor del servidor y se escriben a medida que llegan.
+    """
+    permission_classes = [permissions.IsAuthenticated, AdminOrStaffReadOnly]
+    # Cada exportación declara qué modelo recorre, con qué filtros y en qué orden;
+    # campo_unidad es el lookup que acota al copropietario a sus unidades.
+    modelo = None
+    filtrar = None
+    orden = ()
+    campo_unidad = "unidad_id"
+    columnas = ()
+    nombre = ""
+
+    def get_queryset(self, params):
+        assert self.modelo is not None and self.filtrar is not None, (
+            f"{self.__class__.__name__} debe definir 'modelo' y 'filtrar'."
+        )
+        qs = self.modelo.objects.all()
+        if _rol_name(self.request.user) == "Copropietario":
+            qs = contexto_propiedad(self.request).filtrar(qs, self.campo_unidad)
+        return self.filtrar(qs, params).order_by(*self.orden)
+
+    def get(self, request):
+        formato = request.query_params.get("formato", "csv")
+        if formato not in FORMATOS:
+            return fail("'formato' debe ser 'csv' o 'xlsx'.")
+        try:
+            qs = self.get_queryset(request.query_params)
+        except ValueError as e:
+            return fail(str(e))
+        return respuesta_exportacion(qs, self.columnas, self.nombre, formato)
+
+
+class ExportarExpensas(_ExportarBase):
+    modelo = Expensa
+    filtrar = staticmethod(filtrar_expensas)
+    orden = ("-periodo", "unidad_id")
+    columnas = COLUMNAS_EXPENSAS
+    nombre = "expensas"
+
+
+class ExportarPagos(_ExportarBase):
+    """Además: ?expensa=<id>. El periodo y la unidad son los de la expensa del pago."""
+    modelo = Pago
+    filtrar = staticmethod(filtrar_pagos)
+    orden = ("-created_at", "-id")
+    campo_unidad = "expensa__unidad_id"
+    columnas = COLUMNAS_PAGOS
+    nombre = "pagos"
 
 
 # =============== CU07: Crear pago (copropietario) ===============
@@ -173,6 +224,14 @@ class CrearPagoView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser, JSONParser]
 
+    def initial(self, request, *args, **kwargs):
+        # El comprobante va a disco por bloques y se le calcula el sha256 mientras llega
+        # (antes de @idempotente, que lee request.data para la huella del cuerpo)
+        request._request.upload_handlers = [ComprobanteUploadHandler(request._request)]
+        super().initial(request, *args, **kwargs)
+
+    # Reintentos del cliente con la misma Idempotency-Key no crean otro pago
+    @idempotente
     def create(self, request, *args, **kwargs):
         ser = self.get_serializer(data=request.data)
         if not ser.is_valid():
@@ -183,8 +242,7 @@ class CrearPagoView(generics.CreateAPIView):
         role = _rol_name(user)
         expensa = ser.validated_data["expensa"]
         if role == "Copropietario":
-            unidad_ids = set(CopropietarioModel.objects.filter(idUsuario=user).values_list("unidad_id", flat=True))
-            if expensa.unidad_id not in unidad_ids:
+            if not contexto_propiedad(request).es_duenio(expensa.unidad_id):
                 raise PermissionDenied("No puedes pagar expensas de otra unidad.")
 
         self.perform_create(ser)
@@ -193,48 +251,334 @@ class CrearPagoView(generics.CreateAPIView):
 
 
 # =============== CU08: Aprobar / Rechazar pago (Admin) ===============
+def _fallo_pago(res):
+    if res.get("reservado"):
+        return fail(res["detalle"], values={"id": res["id"]}, status_code=status.HTTP_409_CONFLICT)
+    return fail("Pago no existe.", status_code=status.HTTP_404_NOT_FOUND)
+
 class AprobarPago(APIView):
     permission_classes = [IsAdmin]
     def post(self, request, pk):
-        try:
-            p = Pago.objects.get(pk=pk)
-        except Pago.DoesNotExist:
-            return fail("Pago no existe.", status_code=status.HTTP_404_NOT_FOUND)
-        if p.estado != "APROBADO":
-            p.estado = "APROBADO"; p.save(update_fields=["estado"])
-        return ok("Pago aprobado", values={"id": p.id, "estado": p.estado})
+        res = cambiar_estado_pagos([pk], "APROBADO", revisor=request.user)[0]
+        if not res["ok"]:
+            return _fallo_pago(res)
+        return ok("Pago aprobado", values={"id": res["id"], "estado": res["estado"]})
 
 class RechazarPago(APIView):
     permission_classes = [IsAdmin]
     def post(self, request, pk):
+        res = cambiar_estado_pagos([pk], "RECHAZADO", revisor=request.user)[0]
+        if not res["ok"]:
+            return _fallo_pago(res)
+        return ok("Pago rechazado", values={"id": res["id"], "estado": res["estado"]})
+
+class CambiarEstadoPagosLote(APIView):
+    """
+    POST body:
+    {
+      "ids": [1, 2, 3],          // requerido
+      "accion": "aprobar"        // "aprobar" | "rechazar"
+    }
+    Todo el lote en una transacción; saldos ajustados con un UPDATE por expensa.
+    Devuelve el resultado de cada pago en `values.resultados`.
+    """
+    permission_classes = [IsAdmin]
+    def post(self, request):
+        ids = request.data.get("ids")
+        accion = request.data.get("accion")
+        if not isinstance(ids, list) or not ids:
+            return fail("Debes enviar 'ids' como lista de pagos.")
+        if accion not in ACCIONES_PAGO:
+            return fail("'accion' debe ser 'aprobar' o 'rechazar'.")
+        try:
+            resultados = cambiar_estado_pagos(ids, ACCIONES_PAGO[accion], revisor=request.user)
+        except (TypeError, ValueError):
+            return fail("'ids' debe contener solo números.")
+        n = sum(1 for r in resultados if r["cambiado"])
+        return ok(f"{n} pagos actualizados a {ACCIONES_PAGO[accion]}", values={"resultados": resultados})
+
+
+# =============== Cola de revisión de pagos (Admin) ===============
+def _entero(valor, defecto, minimo, maximo, nombre):
+    if valor in (None, ""):
+        return defecto
+    try:
+        n = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{nombre}' debe ser un número.")
+    if not minimo <= n <= maximo:
+        raise ValueError(f"'{nombre}' debe estar entre {minimo} y {maximo}.")
+    return n
+
+def _pagos_cola(qs):
+    qs = qs.select_related("usuario", "expensa__unidad").prefetch_related("asignaciones__expensa")
+    return PagoListSerializer(qs.order_by("created_at", "id"), many=True).data
+
+class ColaRevisionPagos(APIView):
+    """
+    GET  -> pagos que el admin tiene reservados ahora (reserva vigente).
+    POST -> reserva y devuelve el siguiente lote de pagos PENDIENTES:
+      { "cantidad": 20,   // opcional, 1..100
+        "minutos": 10 }   // opcional, 1..60: duración de la reserva
+    Varios admins pueden pedir a la vez: cada uno recibe pagos distintos
+    (SKIP LOCKED). Pedir de nuevo renueva las reservas propias; al vencer, los
+    pagos no revisados vuelven a la cola.
+    """
+    permission_classes = [IsAdmin]
+    def get(self, request):
+        data = _pagos_cola(cola.pagos_reservados(request.user))
+        return ok(f"{len(data)} pagos reservados", values={"pagos": data})
+    def post(self, request):
+        try:
+            cantidad = _entero(request.data.get("cantidad"), cola.LOTE, 1, cola.MAX_LOTE, "cantidad")
+            minutos = _entero(request.data.get("minutos"), cola.MINUTOS, 1, cola.MAX_MINUTOS, "minutos")
+        except ValueError as e:
+            return fail(str(e))
+        ids, hasta = cola.tomar_pagos(request.user, cantidad, minutos)
+        return ok(f"{len(ids)} pagos reservados",
+                  values={"pagos": _pagos_cola(Pago.objects.filter(pk__in=ids)),
+                          "reservados_hasta": hasta if ids else None})
+
+class LiberarPagosCola(APIView):
+    """
+    POST { "ids": [1, 2] }  // opcional: sin ids libera todas las reservas propias
+    Devuelve a la cola pagos reservados que el admin no va a revisar.
+    """
+    permission_classes = [IsAdmin]
+    def post(self, request):
+        ids = request.data.get("ids")
+        if ids is not None and not isinstance(ids, list):
+            return fail("'ids' debe ser una lista de pagos.")
+        try:
+            n = cola.liberar_pagos(request.user, ids)
+        except (TypeError, ValueError):
+            return fail("'ids' debe contener solo números.")
+        return ok(f"{n} pagos devueltos a la cola", values={"liberados": n})
+
+
+# =============== Conciliación de extracto bancario (Admin) ===============
+class ConciliarExtracto(APIView):
+    """
+    POST multipart:
+      extracto      archivo CSV con columnas fecha, monto, referencia (descripcion opcional)
+      ventana_dias  opcional (default 3): tolerancia entre fecha del banco y fecha_pago
+      metodos       opcional, separados por coma (default TRANSFERENCIA)
+      simular       opcional "1": no aprueba nada, solo muestra el resultado
+    Aprueba en un lote los pagos que calzan sin ambigüedad (referencia + monto);
+    el resto vuelve en `values.revision` con sus candidatos.
+    """
+    permission_classes = [IsAdmin]
+    parser_classes = [MultiPartParser, FormParser]
+    def post(self, request):
+        archivo = request.FILES.get("extracto")
+        if not archivo:
+            return fail("Debes adjuntar el archivo 'extracto' (CSV).")
+        try:
+            ventana = int(request.data.get("ventana_dias") or VENTANA_DIAS)
+        except ValueError:
+            return fail("'ventana_dias' debe ser un número.")
+        if not 0 <= ventana <= 31:
+            return fail("'ventana_dias' debe estar entre 0 y 31.")
+        validos = {m for m, _ in METODOS_PAGO}
+        metodos = [m.strip().upper() for m in (request.data.get("metodos") or "TRANSFERENCIA").split(",") if m.strip()]
+        if not metodos or set(metodos) - validos:
+            return fail(f"'metodos' debe contener valores de: {', '.join(sorted(validos))}.")
+        simular = str(request.data.get("simular", "")).lower() in ("1", "true", "si", "sí")
         try:
-            p = Pago.objects.get(pk=pk)
-        except Pago.DoesNotExist:
-            return fail("Pago no existe.", status_code=status.HTTP_404_NOT_FOUND)
-        if p.estado != "RECHAZADO":
-            p.estado = "RECHAZADO"; p.save(update_fields=["estado"])
-        return ok("Pago rechazado", values={"id": p.id, "estado": p.estado})
+            res = conciliar_extracto(archivo, ventana=ventana, metodos=metodos, simular=simular)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return fail(f"Extracto inválido: {e}")
+        verbo = "conciliables" if simular else "aprobados"
+        return ok(f"{len(res['aprobados'])} pagos {verbo}, {len(res['revision'])} líneas a revisar", values=res)
+
+
+# =============== Recargos por mora (Admin) ===============
+def _fecha_corte(request):
+    valor = request.data.get("fecha_corte")
+    if not valor:
+        return date.today()
+    return date.fromisoformat(str(valor))
+
+
+def _id(valor):
+    """El id como int, o None si no es un entero ("abc", 1.9 y true no lo son)."""
+    texto = str(valor)
+    return int(texto) if texto.isdecimal() else None
+
+
+class AplicarRecargos(APIView):
+    """
+    POST body:
+    {
+      "fecha_corte": "YYYY-MM-DD",   // opcional (default: hoy)
+      "politica_id": 1               // opcional (default: la vigente a la fecha)
+    }
+    Recarga todas las expensas vencidas a la fecha de corte en sentencias por conjunto.
+    Repetir el mismo corte no vuelve a cobrar; el porcentaje se cobra por los días desde el último corte.
+    """
+    permission_classes = [IsAdmin]
+    def post(self, request):
+        try:
+            corte = _fecha_corte(request)
+        except ValueError:
+            return fail("'fecha_corte' debe tener formato YYYY-MM-DD.")
+        politica = None
+        if request.data.get("politica_id"):
+            politica_id = _id(request.data["politica_id"])
+            if politica_id is None:
+                return fail("'politica_id' debe ser un número entero.")
+            politica = PoliticaRecargo.objects.filter(pk=politica_id).first()
+            if not politica:
+                return fail("Política de recargo no existe.", status_code=status.HTTP_404_NOT_FOUND)
+        try:
+            res = aplicar_recargos(corte, politica)
+        except ValueError as e:
+            return fail(str(e))
+        return ok(f"{res['expensas']} expensas recargadas al {corte}", values={**res, "total": f"{res['total']:.2f}"})
+
+
+class RevertirRecargos(APIView):
+    """
+    POST body: {"fecha_corte": "YYYY-MM-DD"} o {"ids": [recargo_id, ...]}
+    Marca los recargos como revertidos y descuenta su monto de las expensas.
+    """
+    permission_classes = [IsAdmin]
+    def post(self, request):
+        ids = request.data.get("ids")
+        if ids is not None and not isinstance(ids, list):
+            return fail("'ids' debe ser una lista de recargos.")
+        if ids:
+            ids = [_id(i) for i in ids]
+            if None in ids:
+                return fail("'ids' debe contener solo números enteros.")
+        try:
+            corte = date.fromisoformat(str(request.data["fecha_corte"])) if request.data.get("fecha_corte") else None
+        except ValueError:
+            return fail("'fecha_corte' debe tener formato YYYY-MM-DD.")
+        if corte is None and not ids:
+            return fail("Debes enviar 'fecha_corte' o 'ids'.")
+        res = revertir_recargos(fecha_corte=corte, recargo_ids=ids)
+        return ok(f"{res['recargos']} recargos revertidos", values={**res, "total": f"{res['total']:.2f}"})
 
 
 # =============== CU09: Consultar pagos/estado e historial ===============
-class PagosDeExpensaList(generics.ListAPIView):
+class PagosDeExpensaList(EnvelopePaginationMixin, generics.ListAPIView):
     """
-    Lista pagos de una expensa:
+    Lista pagos de una expensa (también los `distribuir` con una parte asignada a ella):
     - Admin/Guardia/Empleado: permitido
     - Copropietario: solo si la expensa es de su unidad
     """
     serializer_class = PagoListSerializer
     permission_classes = [permissions.IsAuthenticated, AdminOrStaffReadOnly]
+    ordering = ("-created_at",)
 
     def get_queryset(self):
         expensa_id = self.kwargs["pk"]
-        qs = Pago.objects.filter(expensa_id=expensa_id).select_related("usuario", "expensa__unidad")
+        qs = (Pago.objects
+              .filter(Q(expensa_id=expensa_id) | Q(asignaciones__expensa_id=expensa_id)).distinct()
+              .select_related("usuario", "expensa__unidad")
+              .prefetch_related("asignaciones__expensa"))
         role = _rol_name(self.request.user)
         if role == "Copropietario":
-            unidad_ids = CopropietarioModel.objects.filter(idUsuario=self.request.user).values_list("unidad_id", flat=True)
-            qs = qs.filter(expensa__unidad_id__in=unidad_ids)
+            qs = contexto_propiedad(self.request).filtrar(qs, "expensa__unidad_id")
         return qs.order_by("-created_at")
 
     def list(self, request, *args, **kwargs):
-        data = self.get_serializer(self.get_queryset(), many=True).data
-        return ok(message=f"{len(data)} pagos encontrados", values=data)
+        data, enlaces = self.paginar(self.get_queryset())
+        return ok(message=f"{len(data)} pagos encontrados", values=data, **enlaces)
+
+
+# =============== Estado de cuenta de una unidad ===============
+class EstadoDeCuenta(EnvelopePaginationMixin, generics.ListAPIView):
+    """
+    GET ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD (inclusive; ambos opcionales)
+    Movimientos del libro de la unidad en el rango (paginado por cursor), con el
+    saldo al inicio y al final del rango. Cada saldo es una búsqueda por índice
+    (último movimiento antes del borde): el costo no crece con la historia.
+    Admin/Guardia/Empleado: cualquier unidad; Copropietario: solo las suyas.
+    """
+    serializer_class = MovimientoCuentaSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    ordering = ("fecha", "id")
+
+    def _rango(self):
+        params = self.request.query_params
+        try:
+            desde = date.fromisoformat(params["desde"]) if params.get("desde") else None
+            hasta = date.fromisoformat(params["hasta"]) if params.get("hasta") else None
+        except ValueError:
+            raise ValueError("Las fechas deben tener formato YYYY-MM-DD.")
+        if desde and hasta and desde > hasta:
+            raise ValueError("'desde' no puede ser posterior a 'hasta'.")
+        borde = lambda d: timezone.make_aware(datetime.combine(d, time.min))
+        return (borde(desde) if desde else None), (borde(hasta + timedelta(days=1)) if hasta else None)
+
+    def get_queryset(self):
+        qs = MovimientoCuenta.objects.filter(unidad_id=self.kwargs["unidad"])
+        if self._inicio:
+            qs = qs.filter(fecha__gte=self._inicio)
+        if self._fin:
+            qs = qs.filter(fecha__lt=self._fin)
+        return qs.order_by("fecha", "id")
+
+    def list(self, request, *args, **kwargs):
+        unidad_id = self.kwargs["unidad"]
+        role = _rol_name(request.user)
+        if role not in ("Administrador", "Guardia", "Empleado") and not contexto_propiedad(request).es_duenio(unidad_id):
+            raise PermissionDenied("No puedes ver la cuenta de otra unidad.")
+        if not Unidad.objects.filter(pk=unidad_id).exists():
+            return fail("Unidad no existe.", status_code=status.HTTP_404_NOT_FOUND)
+        try:
+            self._inicio, self._fin = self._rango()
+        except ValueError as e:
+            return fail(str(e))
+        saldo_inicial = saldo_al(unidad_id, self._inicio) if self._inicio else 0
+        saldo_final = saldo_al(unidad_id, self._fin or timezone.now() + timedelta(days=1))
+        data, enlaces = self.paginar(self.get_queryset())
+        return ok(
+            message=f"{len(data)} movimientos",
+            values=data,
+            saldo_inicial=f"{saldo_inicial:.2f}",
+            saldo_final=f"{saldo_final:.2f}",
+            **enlaces,
+        )
+
+
+# =============== Reportes (Admin) ===============
+class ReporteMorosidad(APIView):
+    """
+    GET /expensas/reportes/morosidad/[?refrescar=1]
+    Saldo pendiente por tramos de atraso (por vencer, 0-30, 31-60, 61-90, 90+ días)
+    por unidad, por bloque y total, con el periodo impago más antiguo de cada unidad.
+    Cacheado por día; se invalida al aprobar/rechazar pagos o generar expensas.
+    """
+    permission_classes = [IsAdmin]
+    def get(self, request):
+        datos = reporte_morosidad(refrescar=request.query_params.get("refrescar") in ("1", "true"))
+        return ok(f"Morosidad al {datos['fecha']}", values=datos)
+
+
+class ResumenCobranzaView(APIView):
+    """
+    GET /expensas/resumen/?periodo_desde=YYYY-MM&periodo_hasta=YYYY-MM&bloque=A&por_bloque=1
+    Totales por periodo (facturado, cobrado, saldo y cantidad por estado) leídos de
+    ResumenCobranza, que se mantiene al aprobar/rechazar pagos, generar y anular expensas.
+    Sin `por_bloque`, los bloques se suman por periodo.
+    """
+    permission_classes = [permissions.IsAuthenticated, AdminOrStaffReadOnly]
+    def get(self, request):
+        qs = ResumenCobranza.objects.all()
+        p = request.query_params
+        try:
+            qs = filtrar_periodo(qs, p)
+        except ValueError as e:
+            return fail(str(e))
+        if p.get("bloque"):
+            qs = qs.filter(bloque=p["bloque"])
+        if p.get("por_bloque") in ("1", "true"):
+            filas = qs.order_by("-periodo", "bloque")
+        else:
+            campos = [f for f in ResumenCobranzaSerializer().fields if f not in ("periodo", "bloque")]
+            filas = qs.values("periodo").annotate(**{c: Sum(c) for c in campos}).order_by("-periodo")
+        data = ResumenCobranzaSerializer(filas, many=True).data
+        return ok(f"{len(data)} periodos en el resumen", values=data)
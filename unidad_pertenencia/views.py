@@ -8,10 +8,11 @@ from django.db.models import Q
 from .models import Unidad, Vehiculo, Mascota
 from .serializers import UnidadSerializer, VehiculoSerializer, MascotaSerializer
 from .permissions import AdminOrStaffReadOnly
-from users.models import CopropietarioModel  # para filtrar por unidad del copropietario
+from condominio.pagination import EnvelopePaginationMixin, EnvelopeOffsetPagination
+from users.propiedad import contexto_propiedad  # para filtrar por unidad del copropietario
 
-def _ok(message: str, values=None, code=status.HTTP_200_OK):
-    return Response({"status": 1, "error": 0, "message": message, "values": values}, status=code)
+def _ok(message: str, values=None, code=status.HTTP_200_OK, **extra):
+    return Response({"status": 1, "error": 0, "message": message, "values": values, **extra}, status=code)
 
 def _bad(message: str, errors=None, code=status.HTTP_400_BAD_REQUEST):
     body = {"status": 2, "error": 1, "message": message}
@@ -23,31 +24,29 @@ def _rol_nombre(user) -> str:
     return getattr(getattr(user, 'idRol', None), 'name', '') or ''
 
 
-class UnidadViewSet(viewsets.ModelViewSet):
+class UnidadViewSet(EnvelopePaginationMixin, viewsets.ModelViewSet):
     queryset = Unidad.objects.all().order_by('bloque', 'piso', 'numero')
     serializer_class = UnidadSerializer
-    authentication_classes = []  # usa las globales del settings (JWT)
     permission_classes = [IsAuthenticated, AdminOrStaffReadOnly]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['codigo', 'bloque', 'numero', 'tipo_unidad']
     filterset_fields = ['estado', 'tipo_unidad', 'bloque', 'piso']
     ordering_fields = ['id', 'bloque', 'piso', 'numero', 'created_at']
+    ordering = ('bloque', 'piso', 'numero')
+    offset_pagination_class = EnvelopeOffsetPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
         role = _rol_nombre(self.request.user)
         # Si es Copropietario: solo su(s) unidad(es)
         if role == 'Copropietario':
-            unidad_ids = (CopropietarioModel.objects
-                          .filter(idUsuario=self.request.user)
-                          .values_list('unidad_id', flat=True))
-            qs = qs.filter(id__in=unidad_ids)
+            qs = contexto_propiedad(self.request).filtrar(qs, 'id')
         return qs
 
     # Envoltorios del response
     def list(self, request, *args, **kwargs):
-        resp = super().list(request, *args, **kwargs)
-        return _ok(f"Se encontraron {len(resp.data)} unidades", resp.data)
+        data, enlaces = self.paginar(self.filter_queryset(self.get_queryset()))
+        return _ok(f"Se encontraron {len(data)} unidades", data, **enlaces)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -89,7 +88,7 @@ class UnidadViewSet(viewsets.ModelViewSet):
         return _ok(f"Unidad {codigo} eliminada")
 
 
-class VehiculoViewSet(viewsets.ModelViewSet):
+class VehiculoViewSet(EnvelopePaginationMixin, viewsets.ModelViewSet):
     queryset = Vehiculo.objects.select_related('unidad').all().order_by('placa')
     serializer_class = VehiculoSerializer
     permission_classes = [IsAuthenticated, AdminOrStaffReadOnly]
@@ -97,20 +96,19 @@ class VehiculoViewSet(viewsets.ModelViewSet):
     search_fields = ['placa', 'marca', 'modelo', 'color', 'tipo_vehiculo', 'tag_codigo', 'unidad__codigo']
     filterset_fields = ['estado', 'unidad']
     ordering_fields = ['id', 'placa', 'created_at']
+    ordering = ('placa',)
+    offset_pagination_class = EnvelopeOffsetPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
         role = _rol_nombre(self.request.user)
         if role == 'Copropietario':
-            unidad_ids = (CopropietarioModel.objects
-                          .filter(idUsuario=self.request.user)
-                          .values_list('unidad_id', flat=True))
-            qs = qs.filter(unidad_id__in=unidad_ids)
+            qs = contexto_propiedad(self.request).filtrar(qs)
         return qs
 
     def list(self, request, *args, **kwargs):
-        resp = super().list(request, *args, **kwargs)
-        return _ok(f"Se encontraron {len(resp.data)} vehículos", resp.data)
+        data, enlaces = self.paginar(self.filter_queryset(self.get_queryset()))
+        return _ok(f"Se encontraron {len(data)} vehículos", data, **enlaces)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -157,7 +155,7 @@ class VehiculoViewSet(viewsets.ModelViewSet):
         return _ok(f"Vehículo {placa} eliminado")
 
 
-class MascotaViewSet(viewsets.ModelViewSet):
+class MascotaViewSet(EnvelopePaginationMixin, viewsets.ModelViewSet):
     queryset = Mascota.objects.select_related('unidad').all().order_by('nombre')
     serializer_class = MascotaSerializer
     permission_classes = [IsAuthenticated, AdminOrStaffReadOnly]
@@ -165,20 +163,19 @@ class MascotaViewSet(viewsets.ModelViewSet):
     search_fields = ['nombre', 'tipo_mascota', 'raza', 'color', 'unidad__codigo']
     filterset_fields = ['unidad', 'activo', 'tipo_mascota']
     ordering_fields = ['id', 'nombre', 'created_at']
+    ordering = ('nombre', 'id')
+    offset_pagination_class = EnvelopeOffsetPagination
 
     def get_queryset(self):
         qs = super().get_queryset()
         role = _rol_nombre(self.request.user)
         if role == 'Copropietario':
-            unidad_ids = (CopropietarioModel.objects
-                          .filter(idUsuario=self.request.user)
-                          .values_list('unidad_id', flat=True))
-            qs = qs.filter(unidad_id__in=unidad_ids)
+            qs = contexto_propiedad(self.request).filtrar(qs)
         return qs
 
     def list(self, request, *args, **kwargs):
-        resp = super().list(request, *args, **kwargs)
-        return _ok(f"Se encontraron {len(resp.data)} mascotas", resp.data)
+        data, enlaces = self.paginar(self.filter_queryset(self.get_queryset()))
+        return _ok(f"Se encontraron {len(data)} mascotas", data, **enlaces)
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -0,0 +1,117 @@
+# users/authentication.py
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CopropietarioModel, Rol
+
+# Claims que MyTokenObtainPairSerializer agrega al token
+CLAIM_ROL = "rol"
+CLAIM_ROL_ID = "rol_id"
+CLAIM_ESTADO = "estado"
+CLAIM_UNIDADES = "unidades"
+CLAIM_COPROPIETARIO = "copropietario"
+CLAIM_AUTH_TS = "auth_ts"   # momento en que se calcularon los claims (se conserva al refrescar)
+
+
+def _clave_cambio(user_id) -> str:
+    return f"auth:cambio:{user_id}"
+
+
+def marcar_cambio_auth(user_id):
+    """
+    Registra que cambió algo de lo que viaja en el token (rol, estado, unidades).
+    Los tokens emitidos antes de esta marca dejan de confiar en sus claims.
+    La marca vive lo mismo que un refresh token: después ya no hay tokens viejos.
+    """
+    ttl = int(settings.SIMPLE_JWT["REFRESH_TOKEN_LIFETIME"].total_seconds())
+    cache.set(_clave_cambio(user_id), time.time(), ttl)
+
+
+def claims_de_usuario(user) -> dict:
+    """Claims de autorización para `user` (usados al emitir el token)."""
+    filas = list(CopropietarioModel.objects.filter(idUsuario=user).values_list("unidad_id", flat=True))
+    rol = getattr(user, "idRol", None)
+    return {
+        "username": user.username,
+        "is_staff": user.is_staff,
+        CLAIM_ROL: getattr(rol, "name", None),
+        CLAIM_ROL_ID: getattr(rol, "pk", None),
+        CLAIM_ESTADO: user.estado,
+        CLAIM_COPROPIETARIO: bool(filas),
+        CLAIM_UNIDADES: [u for u in filas if u is not None],
+        CLAIM_AUTH_TS: int(time.time()),
+    }
+
+
+class RolJWTAuthentication(JWTAuthentication):
+    """
+    JWT que evita consultar usuario/rol en cada request.
+
+    Se construye el usuario desde los claims (sin consultas) cuando:
+      - el método es de lectura (GET/HEAD/OPTIONS),
+      - el token trae los claims de rol (emitido por MyTokenObtainPairSerializer),
+      - el claim `estado` es 'activo', y
+      - no hay una marca de cambio (rol, estado o unidades) posterior a `auth_ts`.
+
+    En cualquier otro caso se carga el usuario desde la BD (con su rol en la
+    misma consulta) y se rechaza si está inactivo. Así las escrituras siempre
+    ven el rol/estado real y un cambio de rol o una baja tiene efecto inmediato
+    en los procesos que comparten la caché (ver CACHES en settings).
+    """
+
+    def authenticate(self, request):
+        self._lectura = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if getattr(self, "_lectura", False) and self._claims_confiables(validated_token):
+            return self._usuario_desde_claims(validated_token)
+        return self._usuario_desde_bd(validated_token)
+
+    def _claims_confiables(self, token) -> bool:
+        if CLAIM_ROL not in token or CLAIM_AUTH_TS not in token:
+            return False
+        if token.get(CLAIM_ESTADO) != "activo":
+            return False
+        marca = cache.get(_clave_cambio(token[api_settings.USER_ID_CLAIM]))
+        return marca is None or marca < token[CLAIM_AUTH_TS]
+
+    def _usuario_desde_claims(self, token):
+        # from_db deja diferidos los campos que no vienen en el token:
+        # si una vista los necesita, Django los carga al accederlos.
+        cargados = {
+            "id": token[api_settings.USER_ID_CLAIM],
+            "username": token.get("username", ""),
+            "estado": token[CLAIM_ESTADO],
+            "is_active": True,
+            "is_staff": token.get("is_staff", False),
+            "idRol_id": token.get(CLAIM_ROL_ID),
+        }
+        campos = [f.attname for f in self.user_model._meta.concrete_fields if f.attname in cargados]
+        user = self.user_model.from_db("default", campos, [cargados[c] for c in campos])
+        if token.get(CLAIM_ROL_ID) is not None:
+            rol = Rol.from_db("default", ["idRol", "name"], [token[CLAIM_ROL_ID], token[CLAIM_ROL]])
+            self.user_model.idRol.field.set_cached_value(user, rol)
+        user.unidades_token = list(token.get(CLAIM_UNIDADES, []))
+        user.copropietario_token = bool(token.get(CLAIM_COPROPIETARIO, False))
+        return user
+
+    def _usuario_desde_bd(self, token):
+        try:
+            user_id = token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("El token no contiene identificación de usuario reconocible")
+        try:
+            user = (self.user_model.objects.select_related("idRol")
+                    .get(**{api_settings.USER_ID_FIELD: user_id}))
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("Usuario no encontrado", code="user_not_found")
+        if not user.is_active or user.estado == "inactivo":
+            raise AuthenticationFailed("Usuario inactivo", code="user_inactive")
+        return user
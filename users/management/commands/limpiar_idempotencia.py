@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from users.models import ClaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = "Borra las claves Idempotency-Key vencidas, por lotes cortos (pensado para cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=5000, help="Filas por DELETE (default 5000).")
+
+    def handle(self, *args, **opts):
+        ahora = timezone.now()
+        lote = max(opts["lote"], 1)
+        total = 0
+        while True:
+            ids = list(ClaveIdempotencia.objects.filter(expira_en__lte=ahora)
+                       .values_list("pk", flat=True)[:lote])
+            if not ids:
+                break
+            total += ClaveIdempotencia.objects.filter(pk__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"{total} claves vencidas borradas."))
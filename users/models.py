@@ -31,6 +31,16 @@ class Usuario(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._auth_original = instance._datos_auth()
+        return instance
+
+    def _datos_auth(self):
+        # Lo que viaja en el token (ver users.authentication); __dict__ evita cargar campos diferidos
+        return tuple(self.__dict__.get(f) for f in ("idRol_id", "estado", "is_active"))
+
     def es_copropietario(self):
         return self.idRol is not None and self.idRol.name == "Copropietario"
 
@@ -122,3 +132,22 @@ class ResidenteModel(models.Model):
             name='chk_residencia_fechas_validas',
         ),
         ]
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Respuesta guardada de una escritura enviada con la cabecera Idempotency-Key
+    (ver condominio.idempotencia). No se guarda la clave en claro: `huella` es el
+    sha256 de (usuario, método, ruta, clave), 32 bytes; `huella_cuerpo` es el
+    sha256 del cuerpo enviado con ella. La respuesta va en JSON comprimido.
+    Las vencidas se borran con `manage.py limpiar_idempotencia`.
+    """
+    huella = models.BinaryField(max_length=32, unique=True)
+    huella_cuerpo = models.BinaryField(max_length=32, null=True, blank=True)
+    en_curso = models.BooleanField(default=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.BinaryField(null=True, blank=True)
+    creada_en = models.DateTimeField(auto_now_add=True)
+    expira_en = models.DateTimeField(db_index=True)
+    class Meta:
+        db_table = 'clave_idempotencia'
@@ -0,0 +1,57 @@
+# users/propiedad.py
+"""
+Resolución de "qué unidades son del usuario" para acotar querysets.
+
+Orden de resolución (de más barato a más caro):
+  1) memo en el request (una sola resolución por request),
+  2) claims del token (RolJWTAuthentication ya validó que siguen vigentes),
+  3) caché entre requests con TTL corto, invalidada por users.signals
+     cuando cambia un CopropietarioModel,
+  4) consulta a CopropietarioModel.
+"""
+from django.core.cache import cache
+
+from .models import CopropietarioModel
+
+CACHE_TTL = 60  # segundos
+
+
+def _clave(user_id) -> str:
+    return f"propiedad:{user_id}"
+
+
+class ContextoPropiedad:
+    def __init__(self, es_copropietario=False, unidad_ids=()):
+        self.es_copropietario = es_copropietario
+        self.unidad_ids = tuple(unidad_ids)
+
+    def es_duenio(self, unidad_id) -> bool:
+        return unidad_id in self.unidad_ids
+
+    def filtrar(self, queryset, campo="unidad_id"):
+        return queryset.filter(**{f"{campo}__in": self.unidad_ids})
+
+
+def contexto_propiedad(request) -> ContextoPropiedad:
+    ctx = getattr(request, "_contexto_propiedad", None)
+    if ctx is None:
+        ctx = _resolver(request.user)
+        request._contexto_propiedad = ctx
+    return ctx
+
+
+def invalidar_propiedad(user_id):
+    cache.delete(_clave(user_id))
+
+
+def _resolver(user) -> ContextoPropiedad:
+    if not user or not user.is_authenticated:
+        return ContextoPropiedad()
+    if hasattr(user, "unidades_token"):
+        return ContextoPropiedad(user.copropietario_token, user.unidades_token)
+    datos = cache.get(_clave(user.pk))
+    if datos is None:
+        filas = list(CopropietarioModel.objects.filter(idUsuario=user).values_list("unidad_id", flat=True))
+        datos = (bool(filas), tuple(u for u in filas if u is not None))
+        cache.set(_clave(user.pk), datos, CACHE_TTL)
+    return ContextoPropiedad(*datos)
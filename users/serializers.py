@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import GuardiaModel, Usuario, CopropietarioModel, Rol
+from .authentication import claims_de_usuario
 
 User = get_user_model()
 
@@ -37,6 +38,14 @@ class UserSerializer(serializers.ModelSerializer):
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # El rol y las unidades viajan en el token: RolJWTAuthentication no consulta la BD en lecturas
+        token = super().get_token(user)
+        for claim, valor in claims_de_usuario(user).items():
+            token[claim] = valor
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
         rol_name = getattr(getattr(self.user, 'idRol', None), 'name', None)
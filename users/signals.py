@@ -0,0 +1,23 @@
+# users/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import marcar_cambio_auth
+from .propiedad import invalidar_propiedad
+from .models import Usuario, CopropietarioModel
+
+@receiver(post_save, sender=Usuario)
+def usuario_post_save(sender, instance: Usuario, created, **kwargs):
+    if created:
+        return
+    actual = instance._datos_auth()
+    # Sin foto previa (instancia no cargada de la BD) se asume que pudo cambiar
+    if getattr(instance, "_auth_original", None) != actual:
+        marcar_cambio_auth(instance.pk)
+    instance._auth_original = actual
+
+@receiver(post_save, sender=CopropietarioModel)
+@receiver(post_delete, sender=CopropietarioModel)
+def copropietario_cambiado(sender, instance: CopropietarioModel, **kwargs):
+    marcar_cambio_auth(instance.idUsuario_id)
+    invalidar_propiedad(instance.idUsuario_id)
@@ -1,3 +1,86 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, force_authenticate
+from rest_framework.views import APIView
 
-# Create your tests here.
+from condominio.idempotencia import idempotente
+from .models import ClaveIdempotencia, Rol, Usuario
+
+
+# =============== Idempotency-Key ===============
+
+class VistaPrueba(APIView):
+    """Crea un Rol por petición; `fallar` responde 500 después de escribir."""
+    permission_classes = [permissions.IsAuthenticated]
+    fallar = False
+    anidada = None
+
+    @idempotente
+    def post(self, request):
+        rol = Rol.objects.create(name=f"rol-{Rol.objects.count()}")
+        if self.fallar:
+            return Response({"message": "falló"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if self.anidada:
+            VistaPrueba.respuesta_anidada = self.anidada()
+        return Response({"id": rol.pk}, status=status.HTTP_201_CREATED)
+
+
+class IdempotenciaTests(TestCase):
+    def setUp(self):
+        rol = Rol.objects.create(name="Administrador")
+        self.usuario = Usuario.objects.create_user(username="admin", password="clave123", email="admin@test.bo",
+                                                   ci="ci-admin", idRol=rol)
+        self.roles = Rol.objects.count()
+
+    def pedir(self, datos=None, clave="clave-1", formato="json", **opciones):
+        request = APIRequestFactory().post("/prueba/", datos or {"monto": "10.00"}, format=formato,
+                                           HTTP_IDEMPOTENCY_KEY=clave)
+        force_authenticate(request, user=self.usuario)
+        return VistaPrueba.as_view(**opciones)(request)
+
+    def creados(self):
+        return Rol.objects.count() - self.roles
+
+    def test_reintento_recibe_la_respuesta_guardada(self):
+        primera = self.pedir()
+        segunda = self.pedir()
+        self.assertEqual((primera.status_code, segunda.status_code), (201, 201))
+        self.assertEqual(segunda.data, primera.data)
+        self.assertEqual(segunda["Idempotent-Replayed"], "true")
+        self.assertEqual(self.creados(), 1)
+        # otra clave es otra operación
+        self.assertNotEqual(self.pedir(clave="clave-2").data, primera.data)
+
+    def test_misma_clave_con_otro_cuerpo_es_422(self):
+        self.pedir()
+        r = self.pedir({"monto": "99.00"})
+        self.assertEqual(r.status_code, 422)
+        self.assertEqual(self.creados(), 1)
+
+    def test_multipart_compara_el_sha_del_archivo(self):
+        def subir(contenido):
+            return self.pedir({"monto": "10.00", "comprobante": SimpleUploadedFile("c.jpg", contenido)},
+                              formato="multipart")
+        primera = subir(b"foto")
+        self.assertEqual(subir(b"foto").data, primera.data)
+        self.assertEqual(subir(b"otra foto").status_code, 422)
+        self.assertEqual(self.creados(), 1)
+
+    def test_reintento_mientras_corre_el_primero_es_409(self):
+        r = self.pedir(anidada=lambda: self.pedir())
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(VistaPrueba.respuesta_anidada.status_code, 409)
+        self.assertEqual(self.creados(), 1)
+        self.assertEqual(self.pedir().data, r.data)
+
+    def test_5xx_deshace_y_libera_la_clave(self):
+        r = self.pedir(fallar=True)
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(self.creados(), 0)
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+        r = self.pedir()
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(self.creados(), 1)
+        self.assertFalse(ClaveIdempotencia.objects.get().en_curso)
@@ -18,6 +18,7 @@ from .serializers import (
 )
 from .models import Usuario, Rol
 from .permissions import IsAdminRole  # <- permiso por rol (Administrador)
+from condominio.pagination import EnvelopePaginationMixin, EnvelopeOffsetPagination
 
 User = get_user_model()
 
@@ -110,7 +111,7 @@ class RegisterView(generics.CreateAPIView):
 
 
 # ---------- CRUD DE USUARIOS (ADMIN-ONLY) ----------
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(EnvelopePaginationMixin, viewsets.ModelViewSet):
     queryset = User.objects.all().order_by('-id')
     serializer_class = UserSerializer
     permission_classes = [IsAdminRole]  # <- TODO el CRUD sólo para Admin
@@ -118,10 +119,12 @@ class UserViewSet(viewsets.ModelViewSet):
     search_fields = ['username', 'email', 'telefono', 'ci', 'idRol__name']
     filterset_fields = ['estado', 'idRol']
     ordering_fields = ['id', 'username', 'email', 'created_at']
+    ordering = ('-id',)
+    offset_pagination_class = EnvelopeOffsetPagination
 
     def list(self, request, *args, **kwargs):
-        resp = super().list(request, *args, **kwargs)
-        return Response({"status": 1, "error": 0, "message": "Usuarios listados correctamente", "values": resp.data})
+        data, enlaces = self.paginar(self.filter_queryset(self.get_queryset()))
+        return Response({"status": 1, "error": 0, "message": "Usuarios listados correctamente", "values": data, **enlaces})
 
     def retrieve(self, request, *args, **kwargs):
         resp = super().retrieve(request, *args, **kwargs)
@@ -215,7 +218,8 @@ class PerfilUsuarioView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        usuario = request.user
+        # El usuario del token trae solo los claims; el perfil necesita la fila completa
+        usuario = Usuario.objects.select_related('idRol').get(pk=request.user.pk)
         print(usuario.idRol)
         return Response({
             "status": 1,